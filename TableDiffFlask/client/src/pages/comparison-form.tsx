@@ -1,3 +1,4 @@
+import { useState } from "react";
 import { useForm } from "react-hook-form";
 import { zodResolver } from "@hookform/resolvers/zod";
 import { comparisonRequestSchema, type ComparisonRequest } from "@shared/schema";
@@ -9,14 +10,66 @@ import { MaterialInput } from "@/components/ui/material-input";
 import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@/components/ui/select";
 import { useMutation } from "@tanstack/react-query";
 import { apiRequest } from "@/lib/queryClient";
-import { type ComparisonResult } from "@shared/schema";
+import { type ComparisonJob, type JobEvent } from "@shared/schema";
 import { useLocation } from "wouter";
-import { Database, ArrowRight, Key, Mail, Loader2 } from "lucide-react";
+import { Database, ArrowRight, Key, Mail, Loader2, Gauge, X } from "lucide-react";
 import { useToast } from "@/hooks/use-toast";
 
+// Button label for the latest progress event of a running comparison
+function describeProgress(event: JobEvent): string {
+  const rows = event.rows?.toLocaleString();
+  switch (event.phase) {
+    case "estimated":
+      return "Estimating memory...";
+    case "queued":
+      return `Waiting for capacity (position ${event.position})...`;
+    case "admitted":
+    case "started":
+      return "Starting comparison...";
+    case "connected":
+      return `Connected to database ${event.side}...`;
+    case "fetching":
+      return `Database ${event.side}: ${rows} rows fetched...`;
+    case "fetched":
+      return `Database ${event.side}: ${rows} rows fetched`;
+    case "bisecting":
+      return `Bisecting key ranges (round ${event.round})...`;
+    case "profiled":
+      return event.matched
+        ? "Aggregate profiles match"
+        : `Profiles differ for ${(event.suspectColumns as string[]).join(", ")}, comparing rows...`;
+    case "comparing":
+      return "Comparing rows...";
+    case "report":
+      return "Building report...";
+    case "cacheHit":
+      return "Tables unchanged, using the cached result...";
+    default:
+      return "Comparing Tables...";
+  }
+}
+
+// Follow a job's Server-Sent Events until it finishes
+function waitForJob(jobId: string, onEvent: (event: JobEvent) => void): Promise<void> {
+  return new Promise((resolve) => {
+    const source = new EventSource(`/api/jobs/${jobId}/events`);
+    source.addEventListener("progress", (message) => onEvent(JSON.parse((message as MessageEvent).data)));
+    source.addEventListener("done", () => {
+      source.close();
+      resolve();
+    });
+    // The browser reconnects after transient errors; a closed stream means the job is gone
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED) resolve();
+    };
+  });
+}
+
 export default function ComparisonForm() {
   const [, setLocation] = useLocation();
   const { toast } = useToast();
+  const [jobId, setJobId] = useState<string | null>(null);
+  const [progress, setProgress] = useState<string | null>(null);
 
   const form = useForm<ComparisonRequest>({
     resolver: zodResolver(comparisonRequestSchema),
@@ -50,6 +103,16 @@ export default function ComparisonForm() {
       primaryKey2: "",
       primaryKey3: "",
       primaryKey4: "",
+      compareMode: "full",
+      engine: "native",
+      sampleFraction: undefined,
+      targetError: undefined,
+      payloadFormat: "columnar",
+      includeReport: false,
+      profileFirst: false,
+      snapshotCache: false,
+      watermarkColumn: "",
+      fullReconcile: false,
       emailAddress: "",
       sendEmail: false,
     },
@@ -57,12 +120,23 @@ export default function ComparisonForm() {
 
   const db1Type = form.watch("db1Type");
   const db2Type = form.watch("db2Type");
+  const compareMode = form.watch("compareMode");
 
   const compareMutation = useMutation({
     mutationFn: async (data: ComparisonRequest) => {
       try {
-        const response = await apiRequest("POST", "/api/compare", data);
-        return await response.json() as ComparisonResult;
+        // Run as a background job so long comparisons are not cut off by HTTP timeouts
+        const submitted = await (await apiRequest("POST", "/api/jobs", data)).json() as { jobId: string };
+        setJobId(submitted.jobId);
+        await waitForJob(submitted.jobId, (event) => setProgress(describeProgress(event)));
+        const job = await (await apiRequest("GET", `/api/jobs/${submitted.jobId}`)).json() as ComparisonJob;
+        if (job.status === "cancelled") {
+          throw new Error("Comparison cancelled");
+        }
+        if (job.status !== "succeeded" || !job.result) {
+          throw new Error(job.error || "Comparison failed");
+        }
+        return job.result;
       } catch (error) {
         // Parse error message to extract meaningful details
         const errorMessage = error instanceof Error ? error.message : String(error);
@@ -81,6 +155,9 @@ export default function ComparisonForm() {
           }
         }
         throw error;
+      } finally {
+        setJobId(null);
+        setProgress(null);
       }
     },
     onSuccess: (result) => {
@@ -108,6 +185,14 @@ export default function ComparisonForm() {
     compareMutation.mutate(data);
   };
 
+  const onCancel = () => {
+    if (jobId) {
+      apiRequest("DELETE", `/api/jobs/${jobId}`).catch(() => {
+        // Already finished; the job's outcome is reported as usual
+      });
+    }
+  };
+
   return (
     <div className="min-h-screen bg-background">
       {/* Header */}
@@ -726,6 +811,185 @@ export default function ComparisonForm() {
               </CardContent>
             </Card>
 
+            {/* Comparison Strategy */}
+            <Card>
+              <CardHeader>
+                <CardTitle className="text-xl font-medium flex items-center gap-2">
+                  <Gauge className="w-5 h-5" />
+                  Comparison Strategy
+                </CardTitle>
+                <CardDescription>
+                  Choose how rows are transferred and compared
+                </CardDescription>
+              </CardHeader>
+              <CardContent className="space-y-6">
+                <FormField
+                  control={form.control}
+                  name="compareMode"
+                  render={({ field }) => (
+                    <FormItem>
+                      <FormLabel>Comparison Mode</FormLabel>
+                      <Select onValueChange={field.onChange} defaultValue={field.value}>
+                        <FormControl>
+                          <SelectTrigger data-testid="select-compare-mode">
+                            <SelectValue placeholder="Select comparison mode" />
+                          </SelectTrigger>
+                        </FormControl>
+                        <SelectContent>
+                          <SelectItem value="full">Full (fetch every row)</SelectItem>
+                          <SelectItem value="hash">Hash (compare row checksums in the database)</SelectItem>
+                          <SelectItem value="bisect">Bisect (segment checksums for near-identical tables)</SelectItem>
+                          <SelectItem value="partitioned">Partitioned (stream and compare by key partition)</SelectItem>
+                          <SelectItem value="keys">Keys first (diff keys, then fetch common rows)</SelectItem>
+                          <SelectItem value="sampled">Sampled (estimate differences from a key sample)</SelectItem>
+                        </SelectContent>
+                      </Select>
+                      <FormMessage />
+                    </FormItem>
+                  )}
+                />
+                {compareMode === "sampled" && (
+                  <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
+                    <FormField
+                      control={form.control}
+                      name="sampleFraction"
+                      render={({ field, fieldState }) => (
+                        <FormItem>
+                          <FormControl>
+                            <MaterialInput
+                              {...field}
+                              type="number"
+                              label="Sample Fraction (e.g. 0.01)"
+                              error={fieldState.error?.message}
+                              data-testid="input-sample-fraction"
+                              onChange={(e) => field.onChange(e.target.value ? parseFloat(e.target.value) : undefined)}
+                            />
+                          </FormControl>
+                        </FormItem>
+                      )}
+                    />
+                    <FormField
+                      control={form.control}
+                      name="targetError"
+                      render={({ field, fieldState }) => (
+                        <FormItem>
+                          <FormControl>
+                            <MaterialInput
+                              {...field}
+                              type="number"
+                              label="Or Target Error on Mismatch Rate (e.g. 0.005)"
+                              error={fieldState.error?.message}
+                              data-testid="input-target-error"
+                              onChange={(e) => field.onChange(e.target.value ? parseFloat(e.target.value) : undefined)}
+                            />
+                          </FormControl>
+                        </FormItem>
+                      )}
+                    />
+                  </div>
+                )}
+                <FormField
+                  control={form.control}
+                  name="engine"
+                  render={({ field }) => (
+                    <FormItem>
+                      <FormLabel>Comparison Engine</FormLabel>
+                      <Select onValueChange={field.onChange} defaultValue={field.value}>
+                        <FormControl>
+                          <SelectTrigger data-testid="select-engine">
+                            <SelectValue placeholder="Select comparison engine" />
+                          </SelectTrigger>
+                        </FormControl>
+                        <SelectContent>
+                          <SelectItem value="native">Native (vectorized, same results)</SelectItem>
+                          <SelectItem value="polars">Polars (multi-threaded)</SelectItem>
+                          <SelectItem value="duckdb">DuckDB (multi-threaded, in-process SQL)</SelectItem>
+                          <SelectItem value="datacompy">datacompy</SelectItem>
+                        </SelectContent>
+                      </Select>
+                      <FormMessage />
+                    </FormItem>
+                  )}
+                />
+                <FormField
+                  control={form.control}
+                  name="profileFirst"
+                  render={({ field }) => (
+                    <FormItem className="flex flex-row items-start space-x-3 space-y-0">
+                      <FormControl>
+                        <Checkbox
+                          checked={field.value}
+                          onCheckedChange={field.onChange}
+                          data-testid="checkbox-profile-first"
+                        />
+                      </FormControl>
+                      <div className="space-y-1 leading-none">
+                        <label className="text-sm font-normal cursor-pointer">
+                          Compare aggregate profiles first and skip the row comparison when they match
+                        </label>
+                      </div>
+                    </FormItem>
+                  )}
+                />
+                <FormField
+                  control={form.control}
+                  name="snapshotCache"
+                  render={({ field }) => (
+                    <FormItem className="flex flex-row items-start space-x-3 space-y-0">
+                      <FormControl>
+                        <Checkbox
+                          checked={field.value}
+                          onCheckedChange={field.onChange}
+                          data-testid="checkbox-snapshot-cache"
+                        />
+                      </FormControl>
+                      <div className="space-y-1 leading-none">
+                        <label className="text-sm font-normal cursor-pointer">
+                          Reuse cached table snapshots from recent full comparisons
+                        </label>
+                      </div>
+                    </FormItem>
+                  )}
+                />
+                <FormField
+                  control={form.control}
+                  name="watermarkColumn"
+                  render={({ field, fieldState }) => (
+                    <FormItem>
+                      <FormControl>
+                        <MaterialInput
+                          {...field}
+                          label="Watermark Column (Optional, compares only new rows)"
+                          error={fieldState.error?.message}
+                          data-testid="input-watermark-column"
+                        />
+                      </FormControl>
+                    </FormItem>
+                  )}
+                />
+                <FormField
+                  control={form.control}
+                  name="fullReconcile"
+                  render={({ field }) => (
+                    <FormItem className="flex flex-row items-start space-x-3 space-y-0">
+                      <FormControl>
+                        <Checkbox
+                          checked={field.value}
+                          onCheckedChange={field.onChange}
+                          data-testid="checkbox-full-reconcile"
+                        />
+                      </FormControl>
+                      <div className="space-y-1 leading-none">
+                        <label className="text-sm font-normal cursor-pointer">
+                          Run a full reconciliation and reset the cumulative watermark totals
+                        </label>
+                      </div>
+                    </FormItem>
+                  )}
+                />
+              </CardContent>
+            </Card>
+
             {/* Email Configuration */}
             <Card>
               <CardHeader>
@@ -780,7 +1044,7 @@ export default function ComparisonForm() {
             </Card>
 
             {/* Submit Button */}
-            <div className="flex justify-center pt-4">
+            <div className="flex justify-center gap-3 pt-4">
               <Button
                 type="submit"
                 size="lg"
@@ -791,7 +1055,7 @@ export default function ComparisonForm() {
                 {compareMutation.isPending ? (
                   <>
                     <Loader2 className="w-5 h-5 mr-2 animate-spin" />
-                    Comparing Tables...
+                    {progress ?? "Comparing Tables..."}
                   </>
                 ) : (
                   <>
@@ -800,6 +1064,19 @@ export default function ComparisonForm() {
                   </>
                 )}
               </Button>
+              {compareMutation.isPending && jobId && (
+                <Button
+                  type="button"
+                  variant="outline"
+                  size="lg"
+                  className="h-12"
+                  onClick={onCancel}
+                  data-testid="button-cancel-compare"
+                >
+                  <X className="w-5 h-5 mr-2" />
+                  Cancel
+                </Button>
+              )}
             </div>
           </form>
         </Form>
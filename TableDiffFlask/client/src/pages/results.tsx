@@ -1,6 +1,6 @@
 import { useEffect, useState } from "react";
 import { useLocation } from "wouter";
-import { type ComparisonResult } from "@shared/schema";
+import { type ComparisonResult, type SampleRows } from "@shared/schema";
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
 import { ArrowLeft, Download, Database, CheckCircle2, XCircle, AlertCircle, FileText } from "lucide-react";
@@ -12,6 +12,7 @@ export default function Results() {
   const [, setLocation] = useLocation();
   const [result, setResult] = useState<ComparisonResult | null>(null);
   const [isGeneratingDocx, setIsGeneratingDocx] = useState(false);
+  const [deferredReport, setDeferredReport] = useState<string | null>(null);
   const { toast } = useToast();
 
   useEffect(() => {
@@ -28,8 +29,37 @@ export default function Results() {
     return null;
   }
 
-  const handleDownloadText = () => {
-    const blob = new Blob([result.fullReport], { type: "text/plain" });
+  // Reports of comparisons run without includeReport are built by the worker on first use
+  const loadReport = async (): Promise<string> => {
+    if (!result.reportDeferred || !result.resultId) return result.fullReport;
+    if (deferredReport !== null) return deferredReport;
+
+    const response = await fetch(`/api/results/${result.resultId}/report`);
+    const data = await response.json();
+    if (!response.ok) {
+      throw new Error(data.error || "Failed to generate report");
+    }
+    setDeferredReport(data.fullReport);
+    return data.fullReport;
+  };
+
+  const showReportError = (error: unknown) => {
+    toast({
+      variant: "destructive",
+      title: "Report Unavailable",
+      description: error instanceof Error ? error.message : "Failed to generate report",
+    });
+  };
+
+  const handleDownloadText = async () => {
+    let report: string;
+    try {
+      report = await loadReport();
+    } catch (error) {
+      showReportError(error);
+      return;
+    }
+    const blob = new Blob([report], { type: "text/plain" });
     const url = URL.createObjectURL(blob);
     const a = document.createElement("a");
     a.href = url;
@@ -43,16 +73,21 @@ export default function Results() {
   const handleDownloadWord = async () => {
     setIsGeneratingDocx(true);
     try {
-      const response = await fetch('/api/generate-docx', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(result),
-      });
+      // A deferred result is exported from the worker that holds it, report included
+      const response = result.reportDeferred && result.resultId
+        ? await fetch(`/api/results/${result.resultId}/docx`)
+        : await fetch('/api/generate-docx', {
+            method: 'POST',
+            headers: {
+              'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(result),
+          });
 
       if (!response.ok) {
-        throw new Error('Failed to generate Word document');
+        // An expired stored result (410) explains itself; other failures may not return JSON
+        const data = await response.json().catch(() => ({}));
+        throw new Error(data.error || 'Failed to generate Word document');
       }
 
       // Get the blob from response
@@ -86,6 +121,13 @@ export default function Results() {
     ? ((result.summary.matchingRows / result.summary.totalRows1) * 100).toFixed(1)
     : "0.0";
 
+  // Sampled comparisons report estimates; show each one's confidence interval under it
+  const estimates = result.summary.estimates;
+  const intervalLabel = (interval?: { lower: number; upper: number }) =>
+    estimates && interval
+      ? `${Math.round(estimates.confidenceLevel * 100)}% CI ${interval.lower.toLocaleString()} – ${interval.upper.toLocaleString()}`
+      : null;
+
   // Get all columns from the difference data
   const getAllColumns = (rows: Record<string, any>[]): string[] => {
     if (rows.length === 0) return [];
@@ -94,7 +136,15 @@ export default function Results() {
     return Array.from(allCols);
   };
 
-  const renderDataTable = (rows: Record<string, any>[], emptyMessage: string) => {
+  // Sample rows in columnar form, whichever payload format the server used
+  const toColumnar = (data: SampleRows): { columns: string[]; rows: any[][] } => {
+    if (!Array.isArray(data)) return data;
+    const columns = getAllColumns(data);
+    return { columns, rows: data.map(row => columns.map(col => row[col])) };
+  };
+
+  const renderDataTable = (data: SampleRows, emptyMessage: string) => {
+    const { columns, rows } = toColumnar(data);
     if (rows.length === 0) {
       return (
         <div className="flex flex-col items-center justify-center py-12 text-muted-foreground">
@@ -104,8 +154,6 @@ export default function Results() {
       );
     }
 
-    const columns = getAllColumns(rows);
-
     return (
       <div className="border rounded-md">
         <ScrollArea className="h-[500px]">
@@ -130,10 +178,10 @@ export default function Results() {
                     className="border-b last:border-b-0 hover-elevate"
                     data-testid={`row-difference-${idx}`}
                   >
-                    {columns.map((col) => (
+                    {columns.map((col, colIdx) => (
                       <td key={col} className="px-4 py-3 font-mono text-xs text-foreground">
-                        {row[col] !== null && row[col] !== undefined
-                          ? String(row[col])
+                        {row[colIdx] !== null && row[colIdx] !== undefined
+                          ? String(row[colIdx])
                           : <span className="text-muted-foreground italic">null</span>}
                       </td>
                     ))}
@@ -167,6 +215,7 @@ export default function Results() {
               </p>
               <p className="text-xs text-muted-foreground mt-0.5">
                 Compared on {new Date(result.timestamp).toLocaleString()}
+                {result.cacheHit && " (cached result; both tables unchanged since)"}
               </p>
             </div>
             <div className="flex items-center gap-3 flex-wrap">
@@ -206,7 +255,9 @@ export default function Results() {
           <CardHeader>
             <CardTitle className="text-xl font-medium">Summary Statistics</CardTitle>
             <CardDescription>
-              High-level comparison metrics between the two tables
+              {estimates
+                ? `Estimated from a ${(estimates.sampleFraction * 100).toPrecision(3)}% key sample (${estimates.sampledRows1.toLocaleString()} / ${estimates.sampledRows2.toLocaleString()} rows)`
+                : "High-level comparison metrics between the two tables"}
             </CardDescription>
           </CardHeader>
           <CardContent>
@@ -248,6 +299,9 @@ export default function Results() {
                 <p className="text-3xl font-semibold text-amber-600" data-testid="text-mismatched-rows">
                   {result.summary.mismatchedRows.toLocaleString()}
                 </p>
+                {estimates && (
+                  <p className="text-xs text-muted-foreground">{intervalLabel(estimates.mismatchedRows)}</p>
+                )}
               </div>
 
               <div className="space-y-2">
@@ -258,6 +312,9 @@ export default function Results() {
                 <p className="text-3xl font-semibold text-red-600" data-testid="text-only-db1">
                   {result.summary.onlyInDatabase1.toLocaleString()}
                 </p>
+                {estimates && (
+                  <p className="text-xs text-muted-foreground">{intervalLabel(estimates.onlyInDatabase1)}</p>
+                )}
               </div>
 
               <div className="space-y-2">
@@ -268,6 +325,9 @@ export default function Results() {
                 <p className="text-3xl font-semibold text-red-600" data-testid="text-only-db2">
                   {result.summary.onlyInDatabase2.toLocaleString()}
                 </p>
+                {estimates && (
+                  <p className="text-xs text-muted-foreground">{intervalLabel(estimates.onlyInDatabase2)}</p>
+                )}
               </div>
             </div>
           </CardContent>
@@ -282,7 +342,13 @@ export default function Results() {
             </CardDescription>
           </CardHeader>
           <CardContent>
-            <Tabs defaultValue="only-db1" className="w-full">
+            <Tabs
+              defaultValue="only-db1"
+              className="w-full"
+              onValueChange={(value) => {
+                if (value === "full-report") loadReport().catch(showReportError);
+              }}
+            >
               <TabsList className="grid w-full grid-cols-1 md:grid-cols-4 h-auto">
                 <TabsTrigger value="only-db1" className="data-[state=active]:bg-primary data-[state=active]:text-primary-foreground" data-testid="tab-only-db1">
                   Only in Database 1
@@ -337,7 +403,7 @@ export default function Results() {
               <TabsContent value="full-report" className="mt-6">
                 <div className="bg-muted/30 rounded-md p-6 border">
                   <pre className="text-sm font-mono whitespace-pre-wrap break-words text-foreground overflow-x-auto" data-testid="text-full-report">
-                    {result.fullReport}
+                    {result.reportDeferred ? (deferredReport ?? "Generating report...") : result.fullReport}
                   </pre>
                 </div>
               </TabsContent>
@@ -0,0 +1,222 @@
+import os from "os";
+import { PythonJobCancelled } from "./pythonPool";
+
+export interface AdmissionOptions {
+  // Comparisons running at once
+  maxConcurrent: number;
+  // Memory the running comparisons may add to their workers together
+  memoryBudgetMb: number;
+  // Comparisons waiting for admission before new ones are refused
+  maxQueued: number;
+}
+
+export interface AdmissionTicket {
+  id: number;
+  compareMode: string;
+  rawEstimateMb: number;
+  estimatedMb: number;
+  // False when the estimate assumed a row count, so its measured peak says nothing about the ratio
+  calibrate: boolean;
+  // Position in the queue on arrival (0 when admitted at once)
+  queuePosition: number;
+  enqueuedAt: number;
+  admittedAt: number | null;
+}
+
+// Refused by admission control; status is the HTTP status to answer with
+export class AdmissionRejected extends Error {
+  constructor(message: string, readonly status: number) {
+    super(message);
+  }
+}
+
+interface Waiter {
+  ticket: AdmissionTicket;
+  position: number;
+  onQueued?: (position: number) => void;
+  resolve: (ticket: AdmissionTicket) => void;
+  reject: (error: Error) => void;
+}
+
+// Floor for a job's reservation (interpreter work, report building) however small its tables
+const MIN_JOB_MB = 64;
+// Weight of the latest measurement in the running peak/estimate ratio of a compare mode
+const CALIBRATION_WEIGHT = 0.3;
+const CALIBRATION_MIN = 0.1;
+const CALIBRATION_MAX = 10;
+
+/**
+ * Admission control in front of the comparison workers.
+ * Each comparison reserves its estimated memory (metadata estimate x a per-mode calibration
+ * ratio learned from measured peaks) and runs once it fits the budget and a concurrency slot is
+ * free. Memory workers keep after a job (stored results) counts against the budget too.
+ * Waiting jobs are admitted strictly in order, so a large job is not starved by small ones.
+ * Jobs larger than the whole budget, or arriving while the queue is full, are refused.
+ */
+export class AdmissionController {
+  private running = new Map<number, AdmissionTicket>();
+  private waiting: Waiter[] = [];
+  private nextTicketId = 1;
+  private calibration = new Map<string, { ratio: number; samples: number }>();
+  // Memory each worker keeps after its last job (stored results for follow-up tasks), by PID
+  private retained = new Map<number, number>();
+  private admitted = 0;
+  private rejected = 0;
+  private waitMsTotal = 0;
+
+  constructor(private readonly options: AdmissionOptions) {}
+
+  admit(
+    estimate: { compareMode: string; estimatedMb: number; rowsKnown?: boolean },
+    options: { signal?: AbortSignal; onQueued?: (position: number) => void } = {},
+  ): Promise<AdmissionTicket> {
+    const ticket: AdmissionTicket = {
+      id: this.nextTicketId++,
+      compareMode: estimate.compareMode,
+      rawEstimateMb: estimate.estimatedMb,
+      estimatedMb: Math.max(MIN_JOB_MB, Math.round(estimate.estimatedMb * this.ratio(estimate.compareMode))),
+      calibrate: estimate.rowsKnown !== false,
+      queuePosition: 0,
+      enqueuedAt: Date.now(),
+      admittedAt: null,
+    };
+
+    if (ticket.estimatedMb > this.options.memoryBudgetMb) {
+      this.rejected += 1;
+      return Promise.reject(new AdmissionRejected(
+        `Comparison needs an estimated ${ticket.estimatedMb} MB, more than the ${this.options.memoryBudgetMb} MB ` +
+          `memory budget; use compareMode "partitioned" with memoryBudgetMb, or a narrower column list or filter`,
+        413,
+      ));
+    }
+    if (this.waiting.length === 0 && this.fits(ticket)) {
+      this.start(ticket);
+      return Promise.resolve(ticket);
+    }
+    if (this.waiting.length >= this.options.maxQueued) {
+      this.rejected += 1;
+      return Promise.reject(new AdmissionRejected("Too many comparisons waiting; try again later", 429));
+    }
+    if (options.signal?.aborted) {
+      return Promise.reject(new PythonJobCancelled("Cancelled"));
+    }
+
+    return new Promise<AdmissionTicket>((resolve, reject) => {
+      const waiter: Waiter = { ticket, position: this.waiting.length + 1, onQueued: options.onQueued, resolve, reject };
+      this.waiting.push(waiter);
+      ticket.queuePosition = waiter.position;
+      waiter.onQueued?.(waiter.position);
+      options.signal?.addEventListener(
+        "abort",
+        () => {
+          const index = this.waiting.indexOf(waiter);
+          if (index < 0) return;
+          this.waiting.splice(index, 1);
+          reject(new PythonJobCancelled("Cancelled"));
+          this.pump();
+        },
+        { once: true },
+      );
+    });
+  }
+
+  // Free a ticket's reservation; a measured peak refines future estimates for its compare mode,
+  // and the memory the worker kept afterwards stays reserved until that worker reports again
+  release(ticket: AdmissionTicket, memory?: { jobPeakMb?: number | null; pid?: number; retainedMb?: number } | null) {
+    if (!this.running.delete(ticket.id)) return;
+    this.retain(memory);
+    const measuredPeakMb = memory?.jobPeakMb;
+    if (ticket.calibrate && measuredPeakMb != null && measuredPeakMb > 0 && ticket.rawEstimateMb > 0) {
+      const observed = Math.min(CALIBRATION_MAX, Math.max(CALIBRATION_MIN, measuredPeakMb / ticket.rawEstimateMb));
+      const current = this.calibration.get(ticket.compareMode);
+      this.calibration.set(ticket.compareMode, current
+        ? { ratio: current.ratio + CALIBRATION_WEIGHT * (observed - current.ratio), samples: current.samples + 1 }
+        : { ratio: observed, samples: 1 });
+    }
+    this.pump();
+  }
+
+  // Record the memory a worker keeps for stored results (also after jobs that were never admitted,
+  // e.g. result cache hits)
+  retain(memory?: { pid?: number; retainedMb?: number } | null) {
+    if (memory?.pid !== undefined && memory.retainedMb !== undefined) {
+      this.retained.set(memory.pid, memory.retainedMb);
+    }
+    this.pump();
+  }
+
+  // Forget the retained memory of workers that have exited
+  retainWorkers(pids: number[]) {
+    const live = new Set(pids);
+    Array.from(this.retained.keys()).forEach((pid) => {
+      if (!live.has(pid)) this.retained.delete(pid);
+    });
+    this.pump();
+  }
+
+  stats() {
+    const reservedMb = Array.from(this.running.values()).reduce((sum, t) => sum + t.estimatedMb, 0);
+    return {
+      maxConcurrent: this.options.maxConcurrent,
+      memoryBudgetMb: this.options.memoryBudgetMb,
+      running: this.running.size,
+      reservedMb,
+      retainedMb: this.retainedMb(),
+      queued: this.waiting.length,
+      admitted: this.admitted,
+      rejected: this.rejected,
+      avgWaitMs: this.admitted ? Math.round(this.waitMsTotal / this.admitted) : null,
+      calibration: Object.fromEntries(this.calibration),
+    };
+  }
+
+  private ratio(compareMode: string): number {
+    return this.calibration.get(compareMode)?.ratio ?? 1;
+  }
+
+  private retainedMb(): number {
+    return Array.from(this.retained.values()).reduce((sum, mb) => sum + mb, 0);
+  }
+
+  // Retained memory is only freed by later jobs, so with nothing running a job that fits the budget
+  // on its own is admitted anyway rather than waiting forever
+  private fits(ticket: AdmissionTicket): boolean {
+    if (this.running.size === 0) return true;
+    const reservedMb = Array.from(this.running.values()).reduce((sum, t) => sum + t.estimatedMb, 0);
+    return (
+      this.running.size < this.options.maxConcurrent &&
+      reservedMb + this.retainedMb() + ticket.estimatedMb <= this.options.memoryBudgetMb
+    );
+  }
+
+  private start(ticket: AdmissionTicket) {
+    ticket.admittedAt = Date.now();
+    this.running.set(ticket.id, ticket);
+    this.admitted += 1;
+    this.waitMsTotal += ticket.admittedAt - ticket.enqueuedAt;
+  }
+
+  // Admit waiting jobs in order while the head of the queue fits
+  private pump() {
+    while (this.waiting.length > 0 && this.fits(this.waiting[0].ticket)) {
+      const waiter = this.waiting.shift() as Waiter;
+      this.start(waiter.ticket);
+      waiter.resolve(waiter.ticket);
+    }
+    this.waiting.forEach((waiter, index) => {
+      if (waiter.position !== index + 1) {
+        waiter.position = index + 1;
+        waiter.onQueued?.(waiter.position);
+      }
+    });
+  }
+}
+
+export function admissionOptionsFromEnv(compareWorkers: number): AdmissionOptions {
+  const defaultBudgetMb = Math.round((os.totalmem() / (1024 * 1024)) * 0.7);
+  return {
+    maxConcurrent: Math.max(1, parseInt(process.env.COMPARE_MAX_CONCURRENT || String(compareWorkers), 10)),
+    memoryBudgetMb: Math.max(1, parseInt(process.env.COMPARE_MEMORY_BUDGET_MB || String(defaultBudgetMb), 10)),
+    maxQueued: Math.max(0, parseInt(process.env.COMPARE_MAX_QUEUED || "20", 10)),
+  };
+}
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Batch comparison of many table pairs
+Reads a JSON manifest: "defaults" holds the request fields shared by every pair (database types,
+credentials, compareMode, ...) and "pairs" the per-pair fields (name, database/schema/table,
+primaryKey1-4, columns, filters, or any other override). Pairs are sized from catalog metadata
+and run largest first in a pool of worker processes, with at most maxPerSource comparisons
+touching the same Snowflake account or SQL Server host at once (sourceLimits overrides that per
+source). Each worker keeps its connection pool across pairs, so sessions are reused.
+
+Every finished pair is appended to the output JSON lines file as soon as it completes; --resume
+skips the pairs already recorded there. A consolidated summary is written at the end.
+
+Usage: python batch_compare.py MANIFEST [--output results.jsonl] [--summary summary.json]
+                               [--workers N] [--max-per-source N] [--resume]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+from json_worker import dumps
+from table_compare import compare_tables, estimate_memory, get_side_config, metadata_cache_key
+
+# Worker processes and comparisons per source when the manifest does not say
+BATCH_WORKERS = 4
+MAX_PER_SOURCE = 2
+
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    """Read a manifest and build one comparison request per pair"""
+    with open(path) as f:
+        manifest = json.load(f)
+    if not manifest.get('pairs'):
+        raise ValueError("The manifest has no pairs")
+
+    defaults = dict(manifest.get('defaults') or {})
+    # Reports of hundreds of tables would swamp the output; a pair can ask for its own
+    defaults.setdefault('includeReport', False)
+    # Nothing asks a batch worker for follow-up tasks, so it keeps no comparison state between pairs
+    defaults['storeResult'] = False
+
+    pairs = []
+    for pair in manifest['pairs']:
+        request = {**defaults, **pair}
+        name = pair.get('name') or f"{request.get('table1')} vs {request.get('table2')}"
+        request.pop('name', None)
+        pairs.append({'name': name, 'request': request})
+
+    names = [pair['name'] for pair in pairs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Pair names must be unique: {', '.join(duplicates)}")
+    manifest['pairs'] = pairs
+    return manifest
+
+
+def pair_sources(request: Dict[str, Any]) -> List[str]:
+    """Distinct sources a pair reads from, as 'dbType:account' or 'dbType:host:port'"""
+    return sorted({
+        ':'.join(metadata_cache_key(get_side_config(request, side))[:2]) for side in (1, 2)
+    })
+
+
+def source_limit(source: str, max_per_source: int, source_limits: Dict[str, int]) -> int:
+    """Concurrent comparisons allowed on a source; sourceLimits keys may omit the dbType prefix"""
+    server = source.split(':', 1)[1]
+    limit = source_limits.get(source, source_limits.get(server, max_per_source))
+    return max(1, int(limit))
+
+
+def size_pair(pair: Dict[str, Any]) -> Dict[str, Any]:
+    """Bytes fetched by a pair, from the same catalog estimate the server's admission control uses"""
+    estimate = estimate_memory(pair['request'])
+    pair['rows1'], pair['rows2'] = estimate['rows1'], estimate['rows2']
+    pair['sizeBytes'] = estimate['rows1'] * estimate['rowBytes1'] + estimate['rows2'] * estimate['rowBytes2']
+    pair['estimatedMb'] = estimate['estimatedMb']
+    return pair
+
+
+def worker_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Process pool for the comparisons
+    Spawned workers start with no connections; forked ones would share the sizing sessions' sockets
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def run_pair(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Compare one pair in a worker process"""
+    return compare_tables(request)
+
+
+def read_completed(path: str) -> Dict[str, Dict[str, Any]]:
+    """Records of the pairs an earlier run completed, by name (a torn last line is ignored)"""
+    completed = {}
+    if not os.path.exists(path):
+        return completed
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('status') == 'ok':
+                completed[record['name']] = record
+    return completed
+
+
+def append_record(out: Any, record: Dict[str, Any]) -> None:
+    """Write one pair's record and push it to disk before the next pair finishes"""
+    out.write(dumps(record) + '\n')
+    out.flush()
+    os.fsync(out.fileno())
+
+
+def pair_differs(summary: Dict[str, Any]) -> bool:
+    """True when a comparison found any difference"""
+    return bool(summary['mismatchedRows'] or summary['onlyInDatabase1'] or summary['onlyInDatabase2']
+                or summary['totalRows1'] != summary['totalRows2'])
+
+
+def batch_summary(records: List[Dict[str, Any]], resumed: int, seconds: float) -> Dict[str, Any]:
+    """Consolidated outcome of every pair: counts plus one line per pair"""
+    compared = [record for record in records if record['status'] == 'ok']
+    differing = [record for record in compared if pair_differs(record['result']['summary'])]
+    pairs = []
+    for record in records:
+        line = {'name': record['name'], 'status': record['status'], 'seconds': record.get('seconds')}
+        if record['status'] == 'ok':
+            summary = record['result']['summary']
+            line.update({
+                'differs': pair_differs(summary),
+                'totalRows1': summary['totalRows1'],
+                'totalRows2': summary['totalRows2'],
+                'mismatchedRows': summary['mismatchedRows'],
+                'onlyInDatabase1': summary['onlyInDatabase1'],
+                'onlyInDatabase2': summary['onlyInDatabase2'],
+            })
+        else:
+            line['error'] = record['error']
+        pairs.append(line)
+
+    return {
+        'pairs': len(records),
+        'compared': len(compared),
+        'matched': len(compared) - len(differing),
+        'withDifferences': len(differing),
+        'failed': len(records) - len(compared),
+        'resumed': resumed,
+        'seconds': round(seconds, 1),
+        'results': pairs,
+    }
+
+
+def next_runnable(pending: List[Dict[str, Any]], in_flight: Dict[str, int],
+                  max_per_source: int, source_limits: Dict[str, int]) -> Optional[Dict[str, Any]]:
+    """Largest pending pair whose sources all have a free slot"""
+    for pair in pending:
+        if all(in_flight.get(source, 0) < source_limit(source, max_per_source, source_limits)
+               for source in pair['sources']):
+            return pair
+    return None
+
+
+def run_batch(manifest: Dict[str, Any], output: str, workers: int, max_per_source: int,
+              resume: bool = False) -> Dict[str, Any]:
+    """
+    Run every pair of a loaded manifest, appending each outcome to output as it completes
+    Returns: the consolidated summary
+    """
+    start = time.perf_counter()
+    source_limits = manifest.get('sourceLimits') or {}
+    completed = read_completed(output) if resume else {}
+    records = [completed[pair['name']] for pair in manifest['pairs'] if pair['name'] in completed]
+    todo = [pair for pair in manifest['pairs'] if pair['name'] not in completed]
+
+    with open(output, 'a' if resume else 'w') as out:
+        def finish(pair: Dict[str, Any], record: Dict[str, Any]) -> None:
+            record = {'name': pair['name'], **record}
+            append_record(out, record)
+            records.append(record)
+            outcome = record['status'] if record['status'] != 'ok' else (
+                'differs' if pair_differs(record['result']['summary']) else 'matches')
+            print(f"[{len(records)}/{len(manifest['pairs'])}] {pair['name']}: {outcome}", file=sys.stderr)
+
+        # Size every pair from metadata; a pair that cannot be sized (e.g. missing table) fails here
+        pending = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [(pair, executor.submit(size_pair, pair)) for pair in todo]
+        for pair, future in futures:
+            try:
+                future.result()
+                pair['sources'] = pair_sources(pair['request'])
+                pending.append(pair)
+            except Exception as e:
+                finish(pair, {'status': 'error', 'error': f"Sizing failed: {str(e)}"})
+        pending.sort(key=lambda pair: pair['sizeBytes'], reverse=True)
+
+        # A worker that dies (e.g. killed for memory) breaks the whole pool: every pair running in it
+        # fails, and the remaining pairs continue in a new pool
+        in_flight: Dict[str, int] = {}
+        running: Dict[Any, Tuple[Dict[str, Any], float]] = {}
+        executor = worker_pool(workers)
+        broken = False
+        try:
+            while pending or running:
+                while len(running) < workers and not broken:
+                    pair = next_runnable(pending, in_flight, max_per_source, source_limits)
+                    if pair is None:
+                        break
+                    try:
+                        future = executor.submit(run_pair, pair['request'])
+                    except BrokenProcessPool:
+                        broken = True
+                        break
+                    pending.remove(pair)
+                    for source in pair['sources']:
+                        in_flight[source] = in_flight.get(source, 0) + 1
+                    running[future] = (pair, time.perf_counter())
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED) if running else (set(), set())
+                for future in done:
+                    pair, started = running.pop(future)
+                    for source in pair['sources']:
+                        in_flight[source] -= 1
+                    seconds = round(time.perf_counter() - started, 3)
+                    try:
+                        finish(pair, {'status': 'ok', 'seconds': seconds, 'rows1': pair['rows1'],
+                                      'rows2': pair['rows2'], 'result': future.result()})
+                    except BrokenProcessPool:
+                        broken = True
+                        finish(pair, {'status': 'error', 'seconds': seconds,
+                                      'error': 'A worker process died while this pair or one running '
+                                               'alongside it was compared; rerun with --resume'})
+                    except Exception as e:
+                        finish(pair, {'status': 'error', 'seconds': seconds, 'error': str(e)})
+
+                if broken and not running:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = worker_pool(workers)
+                    broken = False
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    order = {pair['name']: i for i, pair in enumerate(manifest['pairs'])}
+    records.sort(key=lambda record: order[record['name']])
+    return batch_summary(records, len(completed), time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('manifest')
+    parser.add_argument('--output', help='per-pair JSON lines (default: <manifest>.results.jsonl)')
+    parser.add_argument('--summary', help='consolidated summary JSON (default: <manifest>.summary.json)')
+    parser.add_argument('--workers', type=int, default=None, help='pairs compared at once')
+    parser.add_argument('--max-per-source', type=int, default=None, help='pairs at once per account or host')
+    parser.add_argument('--resume', action='store_true', help='skip pairs already completed in --output')
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.manifest)
+    stem = os.path.splitext(args.manifest)[0]
+    output = args.output or f'{stem}.results.jsonl'
+    summary_path = args.summary or f'{stem}.summary.json'
+    workers = max(1, args.workers or int(manifest.get('workers') or BATCH_WORKERS))
+    max_per_source = max(1, args.max_per_source or int(manifest.get('maxPerSource') or MAX_PER_SOURCE))
+
+    summary = run_batch(manifest, output, workers, max_per_source, args.resume)
+    with open(summary_path, 'w') as f:
+        f.write(dumps(summary))
+    print(f"{summary['pairs']} pairs: {summary['matched']} match, {summary['withDifferences']} differ, "
+          f"{summary['failed']} failed ({summary['resumed']} from an earlier run) in {summary['seconds']}s")
+    print(f"Results: {output}\nSummary: {summary_path}")
+    sys.exit(1 if summary['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Comparison engine benchmark
+Times every comparison engine on the same synthetic tables and checks that each produces
+the same summary as datacompy. --columns takes a list (e.g. 50,200,800) to sweep table width;
+--column-workers adds a native run comparing column groups in a process pool.
+
+Usage: python benchmark_compare.py [--rows N] [--columns N[,N...]] [--mismatch-rate R] [--report]
+                                   [--engines E[,E...]] [--column-workers N] [--column-chunk N]
+"""
+
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, Tuple
+from table_compare import COMPARE_ENGINES, run_datacompy, summarize_compare
+
+
+def synthetic_tables(rows: int, columns: int, mismatch_rate: float,
+                     seed: int = 0) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Two tables sharing most keys, with a mix of int, float, text and timestamp columns"""
+    rng = np.random.default_rng(seed)
+    data: Dict[str, Any] = {'id': np.arange(rows)}
+    for i in range(columns):
+        kind = i % 4
+        if kind == 0:
+            data[f'int_{i}'] = rng.integers(0, 1000, rows)
+        elif kind == 1:
+            data[f'float_{i}'] = rng.random(rows)
+        elif kind == 2:
+            data[f'text_{i}'] = rng.choice(['alpha', 'beta', 'gamma', 'delta'], rows).astype(object)
+        else:
+            data[f'ts_{i}'] = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 10**6, rows), unit='s')
+    df1 = pd.DataFrame(data)
+
+    # Database 2: drop 1% of rows, add 1% new keys, then perturb a share of the values
+    df2 = df1.sample(frac=0.99, random_state=seed).reset_index(drop=True)
+    extra = df1.sample(frac=0.01, random_state=seed + 1).copy()
+    extra['id'] = np.arange(rows, rows + len(extra))
+    df2 = pd.concat([df2, extra], ignore_index=True)
+    for column in df2.columns[1:]:
+        changed = rng.random(len(df2)) < mismatch_rate
+        if df2[column].dtype.kind in 'if':
+            df2.loc[changed, column] = df2.loc[changed, column] + 1
+        elif df2[column].dtype.kind == 'M':
+            df2.loc[changed, column] = df2.loc[changed, column] + pd.Timedelta(seconds=1)
+        else:
+            df2.loc[changed, column] = 'changed'
+    return df1, df2
+
+
+def run_engine(engine: str, df1: pd.DataFrame, df2: pd.DataFrame, report: bool,
+               **options: Any) -> Dict[str, Any]:
+    """Compare, summarize and optionally render the report, timing each step"""
+    start = time.perf_counter()
+    compare = run_datacompy(df1.copy(), df2.copy(), 'id', engine, **options)
+    compared = time.perf_counter()
+    outcome = summarize_compare(compare)
+    summarized = time.perf_counter()
+    if report:
+        compare.report()
+    finished = time.perf_counter()
+    return {
+        'summary': outcome['summary'],
+        'compareSeconds': compared - start,
+        'summarizeSeconds': summarized - compared,
+        'reportSeconds': finished - summarized,
+        'totalSeconds': finished - start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--columns', default='40', help='comma-separated column counts to sweep')
+    parser.add_argument('--mismatch-rate', type=float, default=0.01)
+    parser.add_argument('--report', action='store_true', help='also time report rendering')
+    parser.add_argument('--engines', default=','.join(COMPARE_ENGINES),
+                        help='comma-separated engines; the first is the baseline')
+    parser.add_argument('--column-workers', type=int, default=0, help='also run native with this many processes')
+    parser.add_argument('--column-chunk', type=int, default=None, help='columns per process-pool task')
+    args = parser.parse_args()
+    engines = args.engines.split(',')
+
+    for columns in (int(count) for count in args.columns.split(',')):
+        df1, df2 = synthetic_tables(args.rows, columns, args.mismatch_rate)
+        print(f"{args.rows} rows x {columns} columns, mismatch rate {args.mismatch_rate}")
+
+        results = {engine: run_engine(engine, df1, df2, args.report) for engine in engines}
+        if args.column_workers > 1:
+            results[f'native x{args.column_workers}'] = run_engine(
+                'native', df1, df2, args.report,
+                column_workers=args.column_workers, column_chunk_size=args.column_chunk)
+        for engine, result in results.items():
+            print(f"{engine:>10}: compare {result['compareSeconds']:.2f}s, "
+                  f"summarize {result['summarizeSeconds']:.2f}s, report {result['reportSeconds']:.2f}s, "
+                  f"total {result['totalSeconds']:.2f}s")
+
+        baseline_engine = engines[0]
+        baseline = results[baseline_engine]
+        for engine, result in results.items():
+            if engine == baseline_engine:
+                continue
+            if result['summary'] != baseline['summary']:
+                print(f"{engine} summary differs from {baseline_engine}: "
+                      f"{result['summary']} vs {baseline['summary']}")
+                sys.exit(1)
+            print(f"{engine} speedup: {baseline['totalSeconds'] / result['totalSeconds']:.1f}x "
+                  f"(identical summary)")
+
+
+if __name__ == '__main__':
+    main()
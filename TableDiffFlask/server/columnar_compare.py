@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Columnar comparison engines
+"polars" runs datacompy's PolarsCompare and "duckdb" runs the key join and every column
+comparison as one query in an in-process DuckDB; both spread the work over all cores. Inputs may
+be pandas frames or Arrow tables, which are handed over without a pandas round trip. Only sample
+and difference rows come back as pandas, so summaries keep the datacompy.Compare contract.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import datacompy
+from ordered_set import OrderedSet
+from typing import Any, Dict, List, Tuple
+from native_compare import NativeCompare
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Row number column added to each side so difference rows can be taken back out of the Arrow tables
+ROW_COLUMN = '__tablediff_row'
+
+
+def as_arrow(df: Any) -> pa.Table:
+    """Arrow table with lowercase column names, from a pandas frame or an Arrow table"""
+    table = df if isinstance(df, pa.Table) else pa.Table.from_pandas(df, preserve_index=False)
+    return table.rename_columns([str(name).lower() for name in table.column_names])
+
+
+def fill_null_types(table1: pa.Table, table2: pa.Table) -> Tuple[pa.Table, pa.Table]:
+    """
+    Give untyped (all-null or empty) columns the other side's type
+    Empty fetches and all-null batches come back as Arrow null columns, which cannot be joined
+    against typed keys.
+    """
+    tables = [table1, table2]
+    for column in set(table1.column_names) & set(table2.column_names):
+        types = [table.schema.field(column).type for table in tables]
+        for i in (0, 1):
+            if pa.types.is_null(types[i]) and not pa.types.is_null(types[1 - i]):
+                index = tables[i].column_names.index(column)
+                tables[i] = tables[i].set_column(index, column, tables[i].column(column).cast(types[1 - i]))
+    return tables[0], tables[1]
+
+
+def polars_compare(df1: Any, df2: Any, join_columns: List[str] | str,
+                   df1_name: str = 'df1', df2_name: str = 'df2') -> Any:
+    """datacompy's Polars comparison over Arrow data (zero-copy where the types allow)"""
+    if pl is None:
+        raise ValueError("The polars engine needs the polars package")
+    table1, table2 = fill_null_types(as_arrow(df1), as_arrow(df2))
+    return datacompy.PolarsCompare(pl.from_arrow(table1), pl.from_arrow(table2),
+                                   join_columns=join_columns, df1_name=df1_name, df2_name=df2_name)
+
+
+def quote_name(name: str) -> str:
+    """DuckDB identifier"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def is_numeric_type(arrow_type: pa.DataType) -> bool:
+    """Integer, floating point or decimal Arrow type"""
+    return pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type) or pa.types.is_decimal(arrow_type)
+
+
+def match_expression(column: str, type1: pa.DataType, type2: pa.DataType) -> str:
+    """
+    datacompy's column equality in SQL: equal values or both null
+    Columns of unrelated types are compared as text
+    """
+    value1, value2 = f's1.{quote_name(column)}', f's2.{quote_name(column)}'
+    if type1 != type2 and not (is_numeric_type(type1) and is_numeric_type(type2)):
+        value1, value2 = f'CAST({value1} AS VARCHAR)', f'CAST({value2} AS VARCHAR)'
+    return f'{value1} IS NOT DISTINCT FROM {value2}'
+
+
+def difference_expression(column: str, type1: pa.DataType, type2: pa.DataType) -> str:
+    """Absolute difference for the report's max_diff (NULL for non-numeric columns)"""
+    if not (is_numeric_type(type1) and is_numeric_type(type2)):
+        return 'NULL::DOUBLE'
+    return f'ABS(CAST(s1.{quote_name(column)} AS DOUBLE) - CAST(s2.{quote_name(column)} AS DOUBLE))'
+
+
+class DuckDBCompare(NativeCompare):
+    """
+    NativeCompare whose join and column comparison run in DuckDB over Arrow tables
+    df1 and df2 stay Arrow tables; only the rows that differ are brought back, so the match masks
+    cover just those rows.
+    """
+
+    def _validate_dataframe(self, index: str, cast_column_names_lower: bool = True) -> None:
+        """Keep each side as an Arrow table with lowercase column names and the join columns"""
+        table = as_arrow(getattr(self, index))
+        setattr(self, '_' + index, table)
+        missing = set(self.join_columns) - set(table.column_names)
+        if missing:
+            raise ValueError(f"{index} must have all columns from join_columns: {missing}")
+        if len(set(table.column_names)) < len(table.column_names):
+            raise ValueError(f"{index} must have unique column names")
+
+    def df1_unq_columns(self) -> OrderedSet:
+        return OrderedSet(self.df1.column_names) - OrderedSet(self.df2.column_names)
+
+    def df2_unq_columns(self) -> OrderedSet:
+        return OrderedSet(self.df2.column_names) - OrderedSet(self.df1.column_names)
+
+    def intersect_columns(self) -> OrderedSet:
+        return OrderedSet(self.df1.column_names) & OrderedSet(self.df2.column_names)
+
+    def only_join_columns(self) -> bool:
+        return set(self.join_columns) == set(self.df1.column_names) == set(self.df2.column_names)
+
+    def side_values(self, df: Any, column: str, rows: np.ndarray, padded: bool) -> pd.Series:
+        """Values of one side's column at row positions"""
+        return pd.Series(df.column(column).take(pa.array(rows, type=pa.int64())).to_pandas(), name=column)
+
+    def side_frame(self, df: Any, rows: np.ndarray, padded: bool) -> pd.DataFrame:
+        """Rows of one side as pandas"""
+        return df.take(pa.array(rows, type=pa.int64())).to_pandas()
+
+    def run_join(self, row_filter: str) -> pd.DataFrame:
+        """
+        Full outer join of both sides on the join columns, filtered to row_filter
+        Returns row numbers row1/row2 (-1 for a missing side) and per-column match, null
+        difference and absolute difference columns m_i, n_i, d_i
+        """
+        if duckdb is None:
+            raise ValueError("The duckdb engine needs the duckdb package")
+
+        keys = [quote_name(key) for key in self.join_columns]
+        row = quote_name(ROW_COLUMN)
+        connection = duckdb.connect()
+        try:
+            for name, table in (('side1', self.df1), ('side2', self.df2)):
+                connection.register(name, table.append_column(
+                    ROW_COLUMN, pa.array(np.arange(len(table), dtype=np.int64))
+                ))
+
+            # Duplicate keys pair up in order of appearance, like datacompy's order column
+            conditions = [f's1.{key} IS NOT DISTINCT FROM s2.{key}' for key in keys]
+            sides = {name: f'SELECT * FROM {name}' for name in ('side1', 'side2')}
+            if self._any_dupes:
+                occurrence = quote_name(ROW_COLUMN + '_occurrence')
+                for name in sides:
+                    sides[name] = (f'SELECT *, row_number() OVER (PARTITION BY {", ".join(keys)} '
+                                   f'ORDER BY {row}) AS {occurrence} FROM {name}')
+                conditions.append(f's1.{occurrence} = s2.{occurrence}')
+
+            schema1, schema2 = self.df1.schema, self.df2.schema
+            selected = [f'COALESCE(s1.{row}, -1) AS row1', f'COALESCE(s2.{row}, -1) AS row2']
+            for i, column in enumerate(self._shared):
+                type1, type2 = schema1.field(column).type, schema2.field(column).type
+                value1, value2 = f's1.{quote_name(column)}', f's2.{quote_name(column)}'
+                selected += [
+                    f'{match_expression(column, type1, type2)} AS m_{i}',
+                    f'(({value1} IS NULL) <> ({value2} IS NULL)) AS n_{i}',
+                    f'{difference_expression(column, type1, type2)} AS d_{i}',
+                ]
+
+            return connection.execute(
+                f'SELECT * FROM (SELECT {", ".join(selected)} '
+                f'FROM ({sides["side1"]}) s1 FULL OUTER JOIN ({sides["side2"]}) s2 '
+                f'ON {" AND ".join(conditions)}) joined WHERE {row_filter}'
+            ).df()
+        finally:
+            connection.close()
+
+    def has_duplicate_keys(self, table: pa.Table) -> bool:
+        """Whether any join key value occurs more than once (nulls count as equal)"""
+        keys = table.select(self.join_columns)
+        return keys.group_by(self.join_columns).aggregate([]).num_rows < keys.num_rows
+
+    def _compare(self, ignore_spaces: bool, ignore_case: bool) -> None:
+        """Join both sides in DuckDB and keep only the rows that differ"""
+        if self.on_index or ignore_spaces or ignore_case:
+            raise ValueError("The duckdb engine compares on join columns without normalization")
+        self._df1, self._df2 = fill_null_types(self.df1, self.df2)
+
+        self._any_dupes = self.has_duplicate_keys(self.df1) or self.has_duplicate_keys(self.df2)
+        self._shared = [column for column in self.intersect_columns() if column not in self.join_columns]
+        mismatch = ' OR '.join(f'NOT m_{i}' for i in range(len(self._shared)))
+        row_filter = 'row1 < 0 OR row2 < 0' + (f' OR {mismatch}' if mismatch else '')
+        differences = self.run_join(row_filter)
+
+        row1 = differences['row1'].to_numpy(dtype=np.int64)
+        row2 = differences['row2'].to_numpy(dtype=np.int64)
+        pairs = (row1 >= 0) & (row2 >= 0)
+        order = np.argsort(row1[pairs], kind='stable')
+        only1 = np.sort(row1[row2 < 0])
+        only2 = np.sort(row2[row1 < 0])
+        self._rows1 = row1[pairs][order]
+        self._rows2 = row2[pairs][order]
+        self._padded1 = self._padded2 = False
+        self.df1_unq_rows = self.side_frame(self.df1, only1, False)
+        self.df2_unq_rows = self.side_frame(self.df2, only2, False)
+        self._intersect_rows = None
+
+        # Every differing pair mismatches somewhere; masks and stats come from those rows only
+        common_count = len(self.df1) - len(only1)
+        self._common_count = common_count
+        self._matches: Dict[str, np.ndarray] = {}
+        only_join_columns = self.only_join_columns()
+        for column in self.intersect_columns():
+            if column in self.join_columns:
+                match_cnt = common_count
+                row_cnt = common_count + (len(only1) + len(only2) if only_join_columns else 0)
+                max_diff = 0.0
+                null_diff = 0
+            else:
+                i = self._shared.index(column)
+                row_cnt = common_count
+                matches = differences[f'm_{i}'].to_numpy(dtype=bool)[pairs][order]
+                self._matches[column] = matches
+                match_cnt = common_count - int((~matches).sum())
+                diffs = differences[f'd_{i}'].to_numpy(dtype=float)[pairs]
+                max_diff = float(np.nanmax(diffs)) if np.isfinite(diffs).any() else 0.0
+                null_diff = int(differences[f'n_{i}'].to_numpy(dtype=bool)[pairs].sum())
+
+            type1, type2 = self.df1.schema.field(column).type, self.df2.schema.field(column).type
+            self.column_stats.append({
+                'column': column,
+                'match_column': column + '_match',
+                'match_cnt': match_cnt,
+                'unequal_cnt': row_cnt - match_cnt,
+                'dtype1': str(type1),
+                'dtype2': str(type2),
+                'all_match': type1 == type2 and row_cnt == match_cnt,
+                'max_diff': max_diff,
+                'null_diff': null_diff,
+                'rel_tol': 0,
+                'abs_tol': 0,
+            })
+
+        self._row_mismatch = np.ones(len(self._rows1), dtype=bool)
+        self._matching_count = common_count - len(self._rows1)
+
+    @property
+    def intersect_rows(self) -> pd.DataFrame:
+        """All common rows in datacompy's layout; runs the join again, so only built on request"""
+        if self._intersect_rows is None:
+            common = self.run_join('row1 >= 0 AND row2 >= 0').sort_values('row1', kind='stable')
+            row1 = common['row1'].to_numpy(dtype=np.int64)
+            row2 = common['row2'].to_numpy(dtype=np.int64)
+            frame = {key: self.side_values(self.df1, key, row1, False) for key in self.join_columns}
+            for column in self._shared:
+                frame[f'{column}_{self.df1_name}'] = self.side_values(self.df1, column, row1, False)
+                frame[f'{column}_{self.df2_name}'] = self.side_values(self.df2, column, row2, False)
+            for column in self.df1_unq_columns():
+                frame[column] = self.side_values(self.df1, column, row1, False)
+            for column in self.df2_unq_columns():
+                frame[column] = self.side_values(self.df2, column, row2, False)
+            frame = pd.DataFrame(frame)
+            frame['_merge'] = 'both'
+            for i, column in enumerate(self._shared):
+                frame[column + '_match'] = common[f'm_{i}'].to_numpy(dtype=bool)
+            self._intersect_rows = frame
+        return self._intersect_rows
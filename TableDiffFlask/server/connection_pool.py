@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Database connection pool for long-lived comparison workers
+Connections are keyed by driver, target and credentials (the password only as a digest).
+Idle connections are health-checked before reuse once they have sat for a while and closed
+after an idle timeout. Each key keeps at most POOL_MAX_PER_KEY connections; connections
+opened beyond that are closed when released instead of waiting for a free one, so a comparison
+holding connections can never block on its own parallel fetches.
+Shareable connections (Snowflake's connector is thread-safe) are handed to concurrent users,
+so both sides of a comparison on the same account run on one session.
+"""
+
+import os
+import sys
+import time
+import atexit
+import hashlib
+import threading
+from typing import Any, Callable, Dict, List, Tuple
+
+# Connections kept per key, seconds an idle connection is kept, and idle seconds after which a
+# connection is checked with SELECT 1 before it is handed out again
+POOL_MAX_PER_KEY = int(os.environ.get('CONNECTION_POOL_MAX_PER_KEY', '4'))
+POOL_IDLE_SECONDS = float(os.environ.get('CONNECTION_POOL_IDLE_SECONDS', '600'))
+POOL_HEALTH_CHECK_SECONDS = 30
+
+POOL: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+POOL_LOCK = threading.Lock()
+
+# Shareable keys with a connect in progress; other users wait for it and share the result
+CONNECTING: Dict[Tuple[str, ...], threading.Event] = {}
+
+POOL_COUNTERS = {
+    'hits': 0,
+    'misses': 0,
+    'shared': 0,
+    'overflow': 0,
+    'healthCheckFailures': 0,
+    'idleClosed': 0,
+    'brokenClosed': 0,
+    'connects': 0,
+    'connectSeconds': 0.0,
+}
+
+
+def pool_key(parts: List[Any], password: str) -> Tuple[str, ...]:
+    """Pool key from the identifying connection parts plus a digest of the password"""
+    digest = hashlib.sha256((password or '').encode('utf-8')).hexdigest()
+    return tuple(str(part).lower() for part in parts) + (digest,)
+
+
+def close_quietly(conn: Any) -> None:
+    """Close a connection, ignoring errors from one that is already broken"""
+    try:
+        conn.close()
+    except Exception as e:
+        print(f"Failed to close pooled connection: {str(e)}", file=sys.stderr)
+
+
+def is_healthy(conn: Any) -> bool:
+    """Round trip a SELECT 1 on a fresh cursor"""
+    cursor = None
+    try:
+        cursor = conn.cursor()
+        cursor.execute('SELECT 1')
+        cursor.fetchall()
+        return True
+    except Exception:
+        return False
+    finally:
+        if cursor is not None:
+            try:
+                cursor.close()
+            except Exception:
+                pass
+
+
+def take_idle(now: float) -> List[Any]:
+    """Remove connections idle past POOL_IDLE_SECONDS and return them for closing; call with POOL_LOCK held"""
+    expired = []
+    for key in list(POOL):
+        entries = POOL[key]
+        for entry in [e for e in entries if e['users'] == 0 and now - e['lastUsed'] > POOL_IDLE_SECONDS]:
+            entries.remove(entry)
+            POOL_COUNTERS['idleClosed'] += 1
+            expired.append(entry['conn'])
+        if not entries:
+            del POOL[key]
+    return expired
+
+
+def checkout(key: Tuple[str, ...], shareable: bool) -> Tuple[Any, str]:
+    """Reserve a pooled connection for key: (entry, 'hit'/'shared'), or (None, '') when none is usable"""
+    while True:
+        with POOL_LOCK:
+            now = time.time()
+            expired = take_idle(now)
+            entries = POOL.get(key, [])
+            entry, outcome = None, ''
+            busy = [e for e in entries if e['users'] > 0 and not e.get('broken')] if shareable else []
+            idle = [e for e in entries if e['users'] == 0]
+            if busy:
+                entry, outcome = busy[0], 'shared'
+                POOL_COUNTERS['shared'] += 1
+            elif idle:
+                entry, outcome = idle[-1], 'hit'
+            if entry is not None:
+                entry['users'] += 1
+        for conn in expired:
+            close_quietly(conn)
+        if entry is None or outcome == 'shared':
+            return entry, outcome
+
+        # Health check outside the lock; a dead connection is dropped and the next one tried
+        if now - entry['lastUsed'] < POOL_HEALTH_CHECK_SECONDS or is_healthy(entry['conn']):
+            with POOL_LOCK:
+                POOL_COUNTERS['hits'] += 1
+            return entry, 'hit'
+        with POOL_LOCK:
+            POOL_COUNTERS['healthCheckFailures'] += 1
+            entries.remove(entry)
+        close_quietly(entry['conn'])
+
+
+def acquire(key: Tuple[str, ...], connect: Callable[[], Any], shareable: bool = False) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Connection for key from the pool, or a new one from connect()
+    Returns: (connection, {'connection': 'hit'/'shared'/'miss', 'connectSeconds'})
+    """
+    start = time.perf_counter()
+    while True:
+        entry, outcome = checkout(key, shareable)
+        if entry is not None:
+            return entry['conn'], {'connection': outcome, 'connectSeconds': round(time.perf_counter() - start, 3)}
+        with POOL_LOCK:
+            pending = CONNECTING.get(key) if shareable else None
+            if pending is None:
+                if shareable:
+                    CONNECTING[key] = threading.Event()
+                break
+        pending.wait()
+
+    try:
+        conn = connect()
+        seconds = time.perf_counter() - start
+        with POOL_LOCK:
+            POOL_COUNTERS['misses'] += 1
+            POOL_COUNTERS['connects'] += 1
+            POOL_COUNTERS['connectSeconds'] += seconds
+            entries = POOL.setdefault(key, [])
+            if len(entries) < POOL_MAX_PER_KEY:
+                entries.append({'conn': conn, 'users': 1, 'lastUsed': time.time()})
+            else:
+                POOL_COUNTERS['overflow'] += 1
+    finally:
+        if shareable:
+            with POOL_LOCK:
+                CONNECTING.pop(key).set()
+    return conn, {'connection': 'miss', 'connectSeconds': round(seconds, 3)}
+
+
+def release(key: Tuple[str, ...], conn: Any, broken: bool = False) -> None:
+    """Return a connection from acquire; broken or overflow connections are closed"""
+    with POOL_LOCK:
+        entries = POOL.get(key, [])
+        entry = next((e for e in entries if e['conn'] is conn), None)
+        if entry is not None:
+            entry['users'] -= 1
+            entry['lastUsed'] = time.time()
+            broken = broken or entry.get('broken', False)
+            if not broken:
+                return
+            if entry['users'] > 0:
+                # Still in use by a sharer; it is dropped when the last one releases it
+                entry['broken'] = True
+                return
+            entries.remove(entry)
+            POOL_COUNTERS['brokenClosed'] += 1
+        elif broken:
+            POOL_COUNTERS['brokenClosed'] += 1
+    close_quietly(conn)
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Counters plus the connections currently pooled"""
+    with POOL_LOCK:
+        stats = dict(POOL_COUNTERS)
+        stats['pid'] = os.getpid()
+        stats['pooled'] = sum(len(entries) for entries in POOL.values())
+        stats['inUse'] = sum(1 for entries in POOL.values() for entry in entries if entry['users'] > 0)
+        stats['keys'] = len(POOL)
+    requests = stats['hits'] + stats['misses'] + stats['shared']
+    stats['hitRate'] = round((stats['hits'] + stats['shared']) / requests, 3) if requests else None
+    stats['avgConnectSeconds'] = round(stats['connectSeconds'] / stats['connects'], 3) if stats['connects'] else None
+    stats['connectSeconds'] = round(stats['connectSeconds'], 3)
+    return stats
+
+
+@atexit.register
+def close_all() -> None:
+    """Close every pooled connection (worker shutdown)"""
+    with POOL_LOCK:
+        connections = [entry['conn'] for entries in POOL.values() for entry in entries]
+        POOL.clear()
+    for conn in connections:
+        close_quietly(conn)
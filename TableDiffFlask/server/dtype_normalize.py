@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Ingest-time dtype normalization
+pymssql hands back Decimal, datetime and str objects, so SQL Server frames arrive as mostly
+object columns while Snowflake's Arrow fetch is already typed. Both sides are mapped to the
+same compact dtypes right after the fetch: integral decimals to int64, other decimals to
+float64 (as Snowflake and datacompy treat them), dates and datetimes to datetime64[ns],
+low-cardinality text to categoricals and other text to Arrow-backed strings.
+Only object columns are touched; typed columns pass through unchanged.
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional
+
+# Text becomes categorical when distinct values are at most this share of the non-null values,
+# on columns with enough rows for the dictionary to pay off
+CATEGORY_MAX_RATIO = 0.1
+CATEGORY_MIN_ROWS = 1000
+
+# Largest integer magnitude float64 holds exactly
+FLOAT_EXACT_LIMIT = 2 ** 53
+INT64_LIMIT = 2 ** 63 - 1
+
+STRING_DTYPE = pd.StringDtype('pyarrow')
+
+
+def normalize_decimals(series: pd.Series) -> Optional[pd.Series]:
+    """
+    Decimal column as int64 (integral, no nulls) or float64 when that is exact enough
+    Returns None for values float64 cannot hold within their scale; those stay Decimal.
+    """
+    values = series.dropna()
+    if not len(values):
+        return None
+    try:
+        # NaN/Infinity decimals have a letter for an exponent
+        exponents = np.fromiter((value.as_tuple().exponent for value in values), dtype=np.int64, count=len(values))
+    except (TypeError, ValueError):
+        return None
+    scale = max(0, -int(exponents.min()))
+    floats = series.astype(np.float64)
+    largest = float(np.nanmax(np.abs(floats.to_numpy()))) * (10 ** scale)
+    integral = scale == 0 and len(values) == len(series)
+
+    if largest <= FLOAT_EXACT_LIMIT:
+        return floats.astype(np.int64) if integral else floats
+    if integral and largest < INT64_LIMIT:
+        return pd.Series([int(value) for value in series], index=series.index, dtype=np.int64, name=series.name)
+    return None
+
+
+def normalize_datetimes(series: pd.Series) -> Optional[pd.Series]:
+    """date/datetime objects as datetime64[ns]; None when out of range or mixing time zones"""
+    try:
+        return pd.to_datetime(series)
+    except (ValueError, TypeError, OverflowError, pd.errors.OutOfBoundsDatetime):
+        return None
+
+
+def normalize_strings(series: pd.Series) -> pd.Series:
+    """Low-cardinality text as a categorical, everything else as Arrow-backed strings"""
+    non_null = int(series.notna().sum())
+    if non_null >= CATEGORY_MIN_ROWS and series.nunique(dropna=True) <= non_null * CATEGORY_MAX_RATIO:
+        return series.astype('category')
+    return series.astype(STRING_DTYPE)
+
+
+def normalize_column(series: pd.Series) -> Optional[pd.Series]:
+    """Compact replacement for an object column, or None to keep it as it is"""
+    if series.dtype != object:
+        return None
+    inferred = pd.api.types.infer_dtype(series, skipna=True)
+    if inferred == 'decimal':
+        return normalize_decimals(series)
+    if inferred in ('date', 'datetime'):
+        return normalize_datetimes(series)
+    if inferred == 'string':
+        return normalize_strings(series)
+    return None
+
+
+def normalize_frame(df: pd.DataFrame, report: Optional[List[Dict[str, Any]]] = None) -> pd.DataFrame:
+    """
+    Normalize every object column of a fetched frame (in place)
+    Each converted column's dtypes and bytes before/after are appended to report when given.
+    """
+    for column in df.columns:
+        normalized = normalize_column(df[column])
+        if normalized is None:
+            continue
+        if report is not None:
+            report.append({
+                'column': str(column),
+                'from': str(df[column].dtype),
+                'to': str(normalized.dtype),
+                'bytesBefore': int(df[column].memory_usage(index=False, deep=True)),
+                'bytesAfter': int(normalized.memory_usage(index=False, deep=True)),
+            })
+        df[column] = normalized
+    return df
+
+
+def normalization_summary(report: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Memory saved by normalization, per column and in total"""
+    if not report:
+        return None
+    saved = sum(entry['bytesBefore'] - entry['bytesAfter'] for entry in report)
+    return {
+        'savedMb': round(saved / (1024 * 1024), 2),
+        'columns': [
+            {**entry, 'savedMb': round((entry['bytesBefore'] - entry['bytesAfter']) / (1024 * 1024), 2)}
+            for entry in report
+        ],
+    }
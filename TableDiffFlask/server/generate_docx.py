@@ -10,6 +10,7 @@ from docx.shared import Inches, Pt, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 import io
 import base64
+from json_worker import serve
 
 
 def generate_word_document(result_data: dict) -> bytes:
@@ -82,7 +83,7 @@ def generate_word_document(result_data: dict) -> bytes:
     # Rows only in Database 1
     doc.add_page_break()
     doc.add_heading('Rows Only in Database 1', level=1)
-    only_in_db1 = result_data.get('onlyInDatabase1', [])
+    only_in_db1 = as_records(result_data.get('onlyInDatabase1', []))
     
     if only_in_db1:
         add_data_table(doc, only_in_db1, f'{len(only_in_db1)} rows found (showing first 100)')
@@ -92,7 +93,7 @@ def generate_word_document(result_data: dict) -> bytes:
     # Rows only in Database 2
     doc.add_page_break()
     doc.add_heading('Rows Only in Database 2', level=1)
-    only_in_db2 = result_data.get('onlyInDatabase2', [])
+    only_in_db2 = as_records(result_data.get('onlyInDatabase2', []))
     
     if only_in_db2:
         add_data_table(doc, only_in_db2, f'{len(only_in_db2)} rows found (showing first 100)')
@@ -102,7 +103,7 @@ def generate_word_document(result_data: dict) -> bytes:
     # Mismatched rows
     doc.add_page_break()
     doc.add_heading('Mismatched Rows', level=1)
-    mismatched = result_data.get('mismatchedRows', [])
+    mismatched = as_records(result_data.get('mismatchedRows', []))
     
     if mismatched:
         add_data_table(doc, mismatched, f'{len(mismatched)} mismatched rows found (showing first 100)')
@@ -126,6 +127,13 @@ def generate_word_document(result_data: dict) -> bytes:
     return doc_bytes.getvalue()
 
 
+def as_records(rows) -> list:
+    """Sample rows as records, whether sent as records or as the columnar {columns, rows} payload"""
+    if isinstance(rows, dict):
+        return [dict(zip(rows['columns'], row)) for row in rows['rows']]
+    return rows
+
+
 def add_data_table(doc, rows: list, caption: str = ''):
     """Add a data table to the document"""
     if not rows:
@@ -170,18 +178,25 @@ def add_data_table(doc, rows: list, caption: str = ''):
         doc.add_paragraph(f'Note: Showing 50 of {len(rows)} rows for document size.', style='Intense Quote')
 
 
+def generate_encoded_document(result_data: dict) -> dict:
+    """Generate a Word document and return it base64-encoded for JSON transport"""
+    doc_bytes = generate_word_document(result_data)
+    return {'docx': base64.b64encode(doc_bytes).decode('utf-8')}
+
+
 def main():
     """Main function to handle command line execution"""
+    # Long-lived worker mode used by the Express worker pool
+    if '--serve' in sys.argv[1:]:
+        serve(generate_encoded_document)
+        return
+    
     try:
         # Read JSON input from stdin
         input_data = json.loads(sys.stdin.read())
         
-        # Generate Word document
-        doc_bytes = generate_word_document(input_data)
-        
-        # Output base64-encoded document
-        encoded = base64.b64encode(doc_bytes).decode('utf-8')
-        print(json.dumps({'docx': encoded}))
+        # Generate Word document and output it base64-encoded
+        print(json.dumps(generate_encoded_document(input_data)))
         sys.exit(0)
         
     except Exception as e:
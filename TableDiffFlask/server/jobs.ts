@@ -0,0 +1,129 @@
+import { randomUUID } from "crypto";
+import type { JobEvent, JobStatus } from "@shared/schema";
+import { PythonJobCancelled, type RunOptions } from "./pythonPool";
+
+export interface Job {
+  id: string;
+  status: JobStatus;
+  createdAt: string;
+  startedAt: string | null;
+  finishedAt: string | null;
+  events: JobEvent[];
+  result?: unknown;
+  error?: string;
+  controller: AbortController;
+  listeners: Set<(event: JobEvent | null) => void>;
+}
+
+// Progress events kept per job; older ones are dropped (the first, "started", is always kept)
+const MAX_EVENTS_PER_JOB = 200;
+
+/**
+ * Bounded table of asynchronous comparison jobs.
+ * A job runs one pool task; its progress events are kept for polling and pushed to
+ * subscribers (Server-Sent Events). Once the table is full the oldest finished job is dropped,
+ * and new jobs are refused while every slot holds an unfinished one.
+ */
+export class JobStore {
+  private jobs = new Map<string, Job>();
+
+  constructor(private readonly maxJobs: number) {}
+
+  // Start a job, or return null when the table is full of unfinished jobs
+  create(run: (options: RunOptions) => Promise<unknown>): Job | null {
+    if (!this.makeRoom()) return null;
+
+    const job: Job = {
+      id: randomUUID(),
+      status: "queued",
+      createdAt: new Date().toISOString(),
+      startedAt: null,
+      finishedAt: null,
+      events: [],
+      controller: new AbortController(),
+      listeners: new Set(),
+    };
+    this.jobs.set(job.id, job);
+
+    run({ onEvent: (event) => this.record(job, event), signal: job.controller.signal }).then(
+      (result) => this.finish(job, "succeeded", { result }),
+      (error) =>
+        this.finish(job, error instanceof PythonJobCancelled ? "cancelled" : "failed", {
+          error: error instanceof Error ? error.message : String(error),
+        }),
+    );
+    return job;
+  }
+
+  get(id: string): Job | undefined {
+    return this.jobs.get(id);
+  }
+
+  // Ask a queued or running job to stop; false when it has already finished
+  cancel(job: Job): boolean {
+    if (finished(job)) return false;
+    job.controller.abort();
+    return true;
+  }
+
+  // Listen for a job's events; the listener gets null once the job finishes
+  subscribe(job: Job, listener: (event: JobEvent | null) => void): () => void {
+    job.listeners.add(listener);
+    return () => job.listeners.delete(listener);
+  }
+
+  // Public view of a job, with the events after index `since` (for polling)
+  view(job: Job, since = 0) {
+    return {
+      jobId: job.id,
+      status: job.status,
+      createdAt: job.createdAt,
+      startedAt: job.startedAt,
+      finishedAt: job.finishedAt,
+      events: job.events.slice(since),
+      nextEvent: job.events.length,
+      ...(job.result !== undefined ? { result: job.result } : {}),
+      ...(job.error !== undefined ? { error: job.error } : {}),
+    };
+  }
+
+  private record(job: Job, payload: Record<string, unknown>) {
+    const event = { ...payload, phase: String(payload.phase), time: new Date().toISOString() } as JobEvent;
+    if (event.phase === "started" && job.status === "queued") {
+      job.status = "running";
+      job.startedAt = event.time;
+    }
+    job.events.push(event);
+    if (job.events.length > MAX_EVENTS_PER_JOB) job.events.splice(1, 1);
+    job.listeners.forEach((listener) => listener(event));
+  }
+
+  private finish(job: Job, status: JobStatus, outcome: { result?: unknown; error?: string }) {
+    job.status = status;
+    job.finishedAt = new Date().toISOString();
+    job.result = outcome.result;
+    job.error = outcome.error;
+    job.listeners.forEach((listener) => listener(null));
+    job.listeners.clear();
+  }
+
+  private makeRoom(): boolean {
+    if (this.jobs.size < this.maxJobs) return true;
+    // Map iteration follows insertion order, so the first finished job is the oldest
+    for (const job of Array.from(this.jobs.values())) {
+      if (finished(job)) {
+        this.jobs.delete(job.id);
+        return true;
+      }
+    }
+    return false;
+  }
+}
+
+function finished(job: Job): boolean {
+  return job.finishedAt !== null;
+}
+
+export function jobStoreFromEnv(): JobStore {
+  return new JobStore(Math.max(1, parseInt(process.env.COMPARE_JOB_HISTORY || "100", 10)));
+}
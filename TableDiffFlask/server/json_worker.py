@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+JSON-lines worker loop shared by the long-lived Python scripts
+The Express server keeps a pool of these workers warm so each request
+skips interpreter start-up and the heavy pandas/database driver imports
+"""
+
+import os
+import sys
+import json
+import math
+import queue
+import threading
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import orjson
+except ImportError:  # optional fast encoder
+    orjson = None
+
+# Job being handled by this worker and the jobs the server has asked to cancel
+JOB_LOCK = threading.Lock()
+CURRENT_JOB: Dict[str, Any] = {'id': None, 'write': None, 'pid': None}
+CANCELLED_JOBS = set()
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler whose job the server has cancelled"""
+
+
+class ResultExpired(LookupError):
+    """Raised by a handler asked for state the worker no longer keeps (e.g. an expired stored result)"""
+
+
+def json_safe(value: Any) -> Any:
+    """A value with NaN and infinities replaced by None, which orjson writes as null"""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(item) for item in value]
+    return value
+
+
+def json_default(value: Any) -> Any:
+    """Fallback encoding: numpy scalars and arrays as Python values, anything else as text"""
+    if hasattr(value, 'tolist'):
+        return json_safe(value.tolist())
+    return str(value)
+
+
+def dumps(message: Any) -> str:
+    """
+    Encode a message as JSON, with orjson when it is installed
+    The json module fallback writes NaN and infinities as null like orjson (bare NaN is not JSON).
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(message, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        except TypeError:  # e.g. Decimal or integers beyond 64 bits
+            pass
+    return json.dumps(json_safe(message), default=json_default, allow_nan=False)
+
+
+def emit(event: Dict[str, Any]) -> None:
+    """
+    Send a progress event for the current job
+    A no-op outside serve (e.g. command line runs) and in forked pool processes, whose stdout is
+    the worker's protocol stream.
+    """
+    if CURRENT_JOB['pid'] != os.getpid():
+        return
+    with JOB_LOCK:
+        job_id, write = CURRENT_JOB['id'], CURRENT_JOB['write']
+    if job_id is not None:
+        write({'id': job_id, 'event': event})
+
+
+def cancelled() -> bool:
+    """True once the server has cancelled the current job (always False outside the serving process)"""
+    if CURRENT_JOB['pid'] != os.getpid():
+        return False
+    with JOB_LOCK:
+        return CURRENT_JOB['id'] is not None and CURRENT_JOB['id'] in CANCELLED_JOBS
+
+
+def check_cancelled() -> None:
+    """Raise JobCancelled if the current job has been cancelled"""
+    if cancelled():
+        raise JobCancelled('Cancelled')
+
+
+def serve(handler: Callable[[Dict[str, Any]], Any], cancel: Optional[Callable[[], None]] = None) -> None:
+    """
+    Read one JSON request per line from stdin and write one JSON response per line
+    Request: {"id": <job id>, "payload": {...}}
+    Response: {"id": <job id>, "result": ...} or
+              {"id": <job id>, "error": "...", "cancelled": bool, "expired": bool}
+    While a job runs the handler may send {"id": <job id>, "event": {...}} lines with emit().
+    A {"cancel": <job id>} line marks the job cancelled and calls cancel() from the stdin reader
+    thread if the job is running, so it can abort blocking database calls.
+    """
+    # Keep the protocol stream clean: stray prints from libraries go to stderr
+    protocol_out = sys.stdout
+    sys.stdout = sys.stderr
+    write_lock = threading.Lock()
+
+    def write_message(message: Dict[str, Any]) -> None:
+        with write_lock:
+            protocol_out.write(dumps(message) + '\n')
+            protocol_out.flush()
+
+    # Requests are read on their own thread so cancel lines arrive while a job is running
+    requests: 'queue.Queue[Optional[str]]' = queue.Queue()
+
+    def read_requests() -> None:
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job_id = json.loads(line).get('cancel')
+            except (ValueError, AttributeError):
+                job_id = None
+            if job_id is None:
+                requests.put(line)
+                continue
+            with JOB_LOCK:
+                CANCELLED_JOBS.add(job_id)
+                running = CURRENT_JOB['id'] == job_id
+            if running and cancel is not None:
+                cancel()
+        requests.put(None)
+
+    threading.Thread(target=read_requests, name='stdin-reader', daemon=True).start()
+    CURRENT_JOB['write'] = write_message
+    CURRENT_JOB['pid'] = os.getpid()
+
+    # Tell the pool the imports are done and the worker can take jobs
+    write_message({'ready': True})
+
+    while True:
+        line = requests.get()
+        if line is None:
+            break
+
+        job_id = None
+        try:
+            message = json.loads(line)
+            job_id = message.get('id')
+            with JOB_LOCK:
+                CURRENT_JOB['id'] = job_id
+            check_cancelled()
+            response = {'id': job_id, 'result': handler(message['payload'])}
+        except Exception as e:
+            response = {'id': job_id, 'error': str(e), 'cancelled': cancelled(),
+                        'expired': isinstance(e, ResultExpired)}
+        finally:
+            with JOB_LOCK:
+                CURRENT_JOB['id'] = None
+                CANCELLED_JOBS.discard(job_id)
+
+        write_message(response)
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Native comparison engine
+A drop-in replacement for datacompy.Compare: both sides are aligned once on a shared sorted key
+code, every shared column is compared in one vectorized pass into a match mask, and the counts,
+column statistics and sample rows are all derived from those masks instead of a merged frame.
+The text report is datacompy's own, rendered from the same statistics.
+Very wide tables can spread the column comparisons over a process pool: both sides and the row
+alignment are written once as memory-mapped Arrow/numpy files that every worker reads in place.
+"""
+
+import os
+import math
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import datacompy
+from concurrent.futures import ProcessPoolExecutor
+from datacompy.core import calculate_max_diff, columns_equal, get_column_tolerance
+from typing import Any, Dict, List, Optional, Tuple
+
+# Shared files for parallel column comparison; /dev/shm keeps them in memory where available
+COLUMN_SHARE_DIR = os.environ.get('COLUMN_SHARE_DIR') or (
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+)
+
+# Column groups per worker when no chunk size is given, so uneven columns still balance out
+COLUMN_TASKS_PER_WORKER = 4
+
+
+def factorize_sorted(values: pd.Series) -> Tuple[np.ndarray, int]:
+    """Codes ordered like the sorted values; nulls get a code of their own, as in a pandas merge"""
+    try:
+        codes, uniques = pd.factorize(values, sort=True, use_na_sentinel=False)
+    except TypeError:  # mixed types cannot be sorted
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    return codes.astype(np.int64, copy=False), len(uniques)
+
+
+def key_codes(keys1: pd.DataFrame, keys2: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """One int64 code per row for the join key, shared by both sides and ordered like the key"""
+    codes = np.zeros(len(keys1) + len(keys2), dtype=np.int64)
+    for i, column in enumerate(keys1.columns):
+        column_codes, cardinality = factorize_sorted(pd.concat([keys1[column], keys2[column]], ignore_index=True))
+        codes = codes * cardinality + column_codes
+        # Keep the combined code dense so the next multiplication cannot overflow
+        if i < len(keys1.columns) - 1:
+            codes, _ = factorize_sorted(pd.Series(codes))
+    return codes[:len(keys1)], codes[len(keys1):]
+
+
+def occurrence_numbers(codes: np.ndarray) -> np.ndarray:
+    """Position of each row among the rows sharing its key (datacompy's order column for duplicates)"""
+    return pd.Series(codes).groupby(codes).cumcount().to_numpy()
+
+
+def merged_values(series: pd.Series, rows: np.ndarray, padded: bool) -> pd.Series:
+    """
+    Values of a column at rows, with the dtype the column has in datacompy's outer merge
+    padded: the other side has rows this one lacks, so the merged column gained nulls
+    """
+    return merged_dtype(series.take(rows).reset_index(drop=True), padded)
+
+
+def merged_dtype(values: pd.Series, padded: bool) -> pd.Series:
+    """Upcast a column the way an outer merge does when it gains nulls (ints to float, bools to object)"""
+    if padded and isinstance(values.dtype, np.dtype):
+        if values.dtype.kind in 'iu':
+            values = values.astype('float64')
+        elif values.dtype.kind == 'b':
+            values = values.astype(object)
+    return values
+
+
+def column_matches(col1: pd.Series, col2: pd.Series, rel_tol: float, abs_tol: float) -> np.ndarray:
+    """
+    Match mask with datacompy.columns_equal semantics
+    Plain numeric and same-typed datetime columns are compared directly on their numpy arrays
+    """
+    dtype1, dtype2 = col1.dtype, col2.dtype
+    if isinstance(dtype1, np.dtype) and isinstance(dtype2, np.dtype):
+        if dtype1.kind in 'iuf' and dtype2.kind in 'iuf':
+            values1, values2 = col1.to_numpy(), col2.to_numpy()
+            if rel_tol or abs_tol:
+                return np.isclose(values1, values2, rtol=rel_tol, atol=abs_tol, equal_nan=True)
+            matches = values1 == values2
+            if dtype1.kind == 'f' and dtype2.kind == 'f':
+                matches |= np.isnan(values1) & np.isnan(values2)
+            return matches
+        if dtype1.kind == 'M' and dtype1 == dtype2:
+            values1, values2 = col1.to_numpy(), col2.to_numpy()
+            return (values1 == values2) | (np.isnat(values1) & np.isnat(values2))
+    return columns_equal(col1, col2, rel_tol=rel_tol, abs_tol=abs_tol).to_numpy(dtype=bool)
+
+
+def compare_column(col1: pd.Series, col2: pd.Series, rel_tol: float, abs_tol: float) -> Dict[str, Any]:
+    """Match mask plus the report's max_diff and null_diff for one aligned column"""
+    return {
+        'matches': column_matches(col1, col2, rel_tol, abs_tol),
+        'max_diff': calculate_max_diff(col1, col2),
+        'null_diff': int((col1.isnull() ^ col2.isnull()).sum()),
+    }
+
+
+def column_groups(columns: List[str], workers: int, chunk_size: Optional[int] = None) -> List[List[str]]:
+    """Split columns into process-pool tasks of chunk_size columns (default: a few tasks per worker)"""
+    if not chunk_size:
+        chunk_size = max(1, math.ceil(len(columns) / (workers * COLUMN_TASKS_PER_WORKER)))
+    return [columns[i:i + chunk_size] for i in range(0, len(columns), chunk_size)]
+
+
+def compare_column_group(share_dir: str, columns: List[str], padded: Tuple[bool, bool],
+                         tolerances: Dict[str, Tuple[float, float]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Compare a group of columns from the shared files; runs in a worker process
+    Returns per column the mismatched positions (sparse, unlike the mask), max_diff and null_diff
+    """
+    rows = [np.load(os.path.join(share_dir, f'rows{side}.npy'), mmap_mode='r') for side in (1, 2)]
+    tables = [feather.read_table(os.path.join(share_dir, f'side{side}.arrow'), columns=columns, memory_map=True)
+              for side in (1, 2)]
+    outcomes = {}
+    for column in columns:
+        col1, col2 = (merged_dtype(tables[i].column(column).take(pa.array(rows[i])).to_pandas(), padded[i])
+                      for i in (0, 1))
+        outcome = compare_column(col1, col2, *tolerances[column])
+        outcome['mismatched'] = np.flatnonzero(~outcome.pop('matches'))
+        outcomes[column] = outcome
+    return outcomes
+
+
+class NativeCompare(datacompy.Compare):
+    """
+    datacompy.Compare computed from per-column match masks
+    Exposes the same attributes, column_stats and report; intersect_rows is only built on request.
+    Tolerances, ignore_spaces and ignore_case are not supported.
+    column_workers > 1 compares groups of column_chunk_size columns in a process pool.
+    """
+
+    def __init__(self, df1: Any, df2: Any, join_columns: List[str] | str | None = None,
+                 column_workers: int = 1, column_chunk_size: Optional[int] = None, **kwargs: Any) -> None:
+        self.column_workers = column_workers
+        self.column_chunk_size = column_chunk_size
+        super().__init__(df1, df2, join_columns, **kwargs)
+
+    def _compare(self, ignore_spaces: bool, ignore_case: bool) -> None:
+        """Align both sides on the join key and compare every shared column once"""
+        if self.on_index or ignore_spaces or ignore_case:
+            raise ValueError("The native engine compares on join columns without normalization")
+
+        codes1, codes2 = key_codes(self.df1[self.join_columns], self.df2[self.join_columns])
+        if self._any_dupes:
+            # Duplicate keys pair up in order of appearance, like datacompy's order column
+            occurrence1 = occurrence_numbers(codes1)
+            occurrence2 = occurrence_numbers(codes2)
+            width = int(max(occurrence1.max(initial=0), occurrence2.max(initial=0))) + 1
+            codes1 = codes1 * width + occurrence1
+            codes2 = codes2 * width + occurrence2
+
+        # Row positions on each side, in key order like the outer merge
+        positions = pd.Index(codes2).get_indexer(codes1)
+        common = np.flatnonzero(positions >= 0)
+        common = common[np.argsort(codes1[common], kind='stable')]
+        self._rows1 = common
+        self._rows2 = positions[common]
+        only1 = np.flatnonzero(positions < 0)
+        only1 = only1[np.argsort(codes1[only1], kind='stable')]
+        in_common2 = np.zeros(len(codes2), dtype=bool)
+        in_common2[self._rows2] = True
+        only2 = np.flatnonzero(~in_common2)
+        only2 = only2[np.argsort(codes2[only2], kind='stable')]
+
+        # Non-key columns are padded with nulls in the merge wherever the other side has extra rows
+        self._padded1 = len(only2) > 0
+        self._padded2 = len(only1) > 0
+        self.df1_unq_rows = self.side_frame(self.df1, only1, self._padded1)
+        self.df2_unq_rows = self.side_frame(self.df2, only2, self._padded2)
+        self._intersect_rows: Optional[pd.DataFrame] = None
+
+        common_count = len(common)
+        self._common_count = common_count
+        only_join_columns = self.only_join_columns()
+        compared = [column for column in self.intersect_columns() if column not in self.join_columns]
+        outcomes = self.compare_columns_parallel(compared) if self.column_workers > 1 and len(compared) > 1 else {}
+        self._matches: Dict[str, np.ndarray] = {}
+        row_mismatch = np.zeros(common_count, dtype=bool)
+        for column in self.intersect_columns():
+            rel_tol = get_column_tolerance(column, self._rel_tol_dict)
+            abs_tol = get_column_tolerance(column, self._abs_tol_dict)
+            if column in self.join_columns:
+                match_cnt = common_count
+                row_cnt = common_count
+                if only_join_columns:
+                    row_cnt += len(only1) + len(only2)
+                max_diff = 0.0
+                null_diff = 0
+            else:
+                row_cnt = common_count
+                outcome = outcomes.get(column)
+                if outcome is None:
+                    outcome = compare_column(*self.aligned_pair(column, np.arange(common_count)), rel_tol, abs_tol)
+                matches = outcome['matches']
+                self._matches[column] = matches
+                row_mismatch |= ~matches
+                match_cnt = int(matches.sum())
+                max_diff = outcome['max_diff']
+                null_diff = outcome['null_diff']
+
+            self.column_stats.append({
+                'column': column,
+                'match_column': column + '_match',
+                'match_cnt': match_cnt,
+                'unequal_cnt': row_cnt - match_cnt,
+                'dtype1': self.dtype_label(self.df1[column]),
+                'dtype2': self.dtype_label(self.df2[column]),
+                'all_match': self.df1[column].dtype == self.df2[column].dtype and row_cnt == match_cnt,
+                'max_diff': max_diff,
+                'null_diff': null_diff,
+                'rel_tol': rel_tol,
+                'abs_tol': abs_tol,
+            })
+
+        self._row_mismatch = row_mismatch
+        self._matching_count = int(common_count - row_mismatch.sum())
+
+    def share_sides(self, columns: List[str], share_dir: str) -> List[str]:
+        """
+        Write both sides' columns and the row alignment for the worker processes
+        Returns the columns written; columns Arrow cannot represent stay in this process.
+        """
+        shareable = []
+        arrays: Dict[int, List[pa.Array]] = {1: [], 2: []}
+        for column in columns:
+            try:
+                pair = [pa.Array.from_pandas(df[column]) for df in (self.df1, self.df2)]
+            except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+                continue
+            shareable.append(column)
+            arrays[1].append(pair[0])
+            arrays[2].append(pair[1])
+
+        for side, rows in ((1, self._rows1), (2, self._rows2)):
+            table = pa.Table.from_arrays(arrays[side], names=shareable)
+            feather.write_feather(table, os.path.join(share_dir, f'side{side}.arrow'), compression='uncompressed')
+            np.save(os.path.join(share_dir, f'rows{side}.npy'), rows)
+        return shareable
+
+    def compare_columns_parallel(self, columns: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Compare columns in a process pool over memory-mapped copies of both sides"""
+        share_dir = tempfile.mkdtemp(prefix='tablediff-columns-', dir=COLUMN_SHARE_DIR)
+        try:
+            shareable = self.share_sides(columns, share_dir)
+            tolerances = {column: (get_column_tolerance(column, self._rel_tol_dict),
+                                   get_column_tolerance(column, self._abs_tol_dict)) for column in shareable}
+            groups = column_groups(shareable, self.column_workers, self.column_chunk_size)
+            outcomes = {}
+            with ProcessPoolExecutor(max_workers=min(self.column_workers, len(groups) or 1)) as executor:
+                for partial in executor.map(compare_column_group, [share_dir] * len(groups), groups,
+                                            [(self._padded1, self._padded2)] * len(groups),
+                                            [tolerances] * len(groups)):
+                    outcomes.update(partial)
+        finally:
+            shutil.rmtree(share_dir, ignore_errors=True)
+
+        # Back to dense masks, as the serial path keeps them
+        for outcome in outcomes.values():
+            matches = np.ones(len(self._rows1), dtype=bool)
+            matches[outcome.pop('mismatched')] = False
+            outcome['matches'] = matches
+        return outcomes
+
+    @staticmethod
+    def dtype_label(column: pd.Series) -> str:
+        """Column dtype as datacompy labels it in column_stats"""
+        return repr(column.dtype) if str(column.dtype) == 'string' else str(column.dtype)
+
+    def side_values(self, df: Any, column: str, rows: np.ndarray, padded: bool) -> pd.Series:
+        """Values of one side's column at row positions (see merged_values)"""
+        return merged_values(df[column], rows, padded)
+
+    def side_frame(self, df: Any, rows: np.ndarray, padded: bool) -> pd.DataFrame:
+        """Rows of one side with merged dtypes (key columns are never padded)"""
+        return pd.DataFrame({
+            column: self.side_values(df, column, rows, padded and column not in self.join_columns)
+            for column in df.columns
+        })
+
+    def aligned_pair(self, column: str, common: np.ndarray) -> Tuple[pd.Series, pd.Series]:
+        """Both sides' values of a shared column for positions among the common rows"""
+        return (self.side_values(self.df1, column, self._rows1[common], self._padded1),
+                self.side_values(self.df2, column, self._rows2[common], self._padded2))
+
+    def common_frame(self, common: np.ndarray, columns: List[str]) -> pd.DataFrame:
+        """Join columns plus both sides of each column, for positions among the common rows"""
+        frame = {key: self.side_values(self.df1, key, self._rows1[common], False) for key in self.join_columns}
+        for column in columns:
+            frame[f'{column}_{self.df1_name}'], frame[f'{column}_{self.df2_name}'] = self.aligned_pair(column, common)
+        return pd.DataFrame(frame, index=pd.RangeIndex(len(common)))
+
+    @property
+    def intersect_rows(self) -> pd.DataFrame:
+        """datacompy's intersect_rows layout, built on first access"""
+        if self._intersect_rows is None:
+            common = np.arange(len(self._rows1))
+            frame = self.common_frame(common, list(self._matches))
+            for column in self.df1.columns.difference(self.df2.columns, sort=False):
+                frame[column] = merged_values(self.df1[column], self._rows1, False)
+            for column in self.df2.columns.difference(self.df1.columns, sort=False):
+                frame[column] = merged_values(self.df2[column], self._rows2, False)
+            frame['_merge'] = 'both'
+            for column, matches in self._matches.items():
+                frame[column + '_match'] = matches
+            self._intersect_rows = frame
+        return self._intersect_rows
+
+    def common_row_count(self) -> int:
+        """Number of rows on both sides, i.e. len(intersect_rows) without building it"""
+        return self._common_count
+
+    def count_matching_rows(self) -> int:
+        """Number of common rows whose shared columns all match"""
+        return self._matching_count
+
+    def intersect_rows_match(self) -> bool:
+        """Check whether the intersect rows all match"""
+        return self._common_count > 0 and self._matching_count == self._common_count
+
+    def all_mismatch(self, ignore_matching_cols: bool = False) -> pd.DataFrame:
+        """Common rows with any mismatching column, as join columns plus both sides of each column"""
+        if self.only_join_columns():
+            return pd.concat([self.df1_unq_rows, self.df2_unq_rows])
+
+        columns = [column for column, matches in self._matches.items()
+                   if not ignore_matching_cols or not matches.all()]
+        if not columns:
+            return pd.concat([self.df1_unq_rows[self.join_columns], self.df2_unq_rows[self.join_columns]])
+        return self.common_frame(np.flatnonzero(self._row_mismatch), columns)
+
+    def sample_mismatch(self, column: str, sample_count: int = 10,
+                        for_display: bool = False) -> Optional[pd.DataFrame]:
+        """Random sample of the common rows that differ on one column"""
+        if column not in self._matches:
+            return super().sample_mismatch(column, sample_count, for_display)
+
+        mismatched = pd.Series(np.flatnonzero(~self._matches[column]))
+        picked = mismatched.sample(min(sample_count, len(mismatched))).to_numpy()
+        sample = self.common_frame(picked, [column])
+        if for_display:
+            sample.columns = pd.Index([*self.join_columns, f'{column} ({self.df1_name})',
+                                       f'{column} ({self.df2_name})'])
+        return sample
+
+    def _get_row_summary(self) -> Dict[str, Any]:
+        """Row summary section of the report, from the stored counts"""
+        common_count = self._common_count
+        return {
+            'row_summary': {
+                'match_columns': ', '.join(self.join_columns),
+                'abs_tol': self.abs_tol,
+                'rel_tol': self.rel_tol,
+                'common_rows': common_count,
+                'df1_unique': self.df1_unq_rows.shape[0],
+                'df2_unique': self.df2_unq_rows.shape[0],
+                'unequal_rows': common_count - self._matching_count,
+                'equal_rows': self._matching_count,
+                'df1_name': self.df1_name,
+                'df2_name': self.df2_name,
+                'has_duplicates': 'Yes' if self._any_dupes else 'No',
+            }
+        }
@@ -0,0 +1,318 @@
+import { spawn, type ChildProcessWithoutNullStreams } from "child_process";
+import { log } from "./vite";
+
+export interface PythonPoolOptions {
+  // Number of warm worker processes kept alive
+  size: number;
+  // Recycle a worker after it has completed this many jobs (0 = never)
+  maxJobsPerWorker: number;
+}
+
+export interface RunOptions {
+  // Run on the worker with this PID (for follow-up tasks on state kept in that worker)
+  pid?: number;
+  // Progress events the script sends while the job runs (see emit() in server/json_worker.py)
+  onEvent?: (event: Record<string, unknown>) => void;
+  // Aborting cancels the job: a queued job is dropped, a running one is asked to stop
+  signal?: AbortSignal;
+}
+
+interface PendingJob {
+  id: number;
+  payload: unknown;
+  pid?: number;
+  enqueuedAt: number;
+  onEvent?: (event: Record<string, unknown>) => void;
+  cancelled: boolean;
+  resolve: (result: any) => void;
+  reject: (error: Error) => void;
+}
+
+interface Worker {
+  process: ChildProcessWithoutNullStreams;
+  ready: boolean;
+  retiring: boolean;
+  jobsCompleted: number;
+  current: PendingJob | null;
+  stdoutBuffer: string;
+  stderrTail: string;
+}
+
+// Error reported by the Python script itself (as opposed to a crashed worker)
+export class PythonJobError extends Error {}
+
+// The job was cancelled through its AbortSignal
+export class PythonJobCancelled extends PythonJobError {}
+
+// A follow-up task asked for state its worker no longer keeps: the stored result expired, or the
+// worker that held it has been recycled or has exited
+export class PythonResultExpired extends PythonJobError {}
+
+const LATENCY_SAMPLE_SIZE = 500;
+const STDERR_TAIL_LENGTH = 4000;
+const RESTART_BACKOFF_MS = 1000;
+// A cancelled job that has not stopped after this long (e.g. inside a long in-memory compare)
+// has its worker killed; the pool starts a replacement
+const CANCEL_GRACE_MS = 10000;
+
+function percentile(sorted: number[], fraction: number): number | null {
+  if (sorted.length === 0) return null;
+  const index = Math.min(sorted.length - 1, Math.floor(sorted.length * fraction));
+  return sorted[index];
+}
+
+/**
+ * Pool of long-lived Python processes started with `--serve`.
+ * Workers speak JSON lines over stdin/stdout (see server/json_worker.py),
+ * so pandas and the database drivers are imported once per worker instead of once per request.
+ */
+export class PythonWorkerPool {
+  private workers: Worker[] = [];
+  private queue: PendingJob[] = [];
+  private nextJobId = 1;
+  private latenciesMs: number[] = [];
+  private restarts = 0;
+  private recycled = 0;
+
+  constructor(
+    private readonly script: string,
+    private readonly options: PythonPoolOptions,
+  ) {
+    for (let i = 0; i < options.size; i++) {
+      this.workers.push(this.startWorker());
+    }
+  }
+
+  run<T = any>(payload: unknown, options: RunOptions = {}): Promise<T> {
+    return new Promise<T>((resolve, reject) => {
+      if (options.signal?.aborted) {
+        reject(new PythonJobCancelled("Cancelled"));
+        return;
+      }
+      const job: PendingJob = {
+        id: this.nextJobId++,
+        payload,
+        pid: options.pid,
+        enqueuedAt: Date.now(),
+        onEvent: options.onEvent,
+        cancelled: false,
+        resolve,
+        reject,
+      };
+      options.signal?.addEventListener("abort", () => this.cancel(job), { once: true });
+      this.queue.push(job);
+      this.dispatch();
+    });
+  }
+
+  // PIDs of the live workers, for follow-up tasks that should reach each one (e.g. their counters)
+  workerPids(): number[] {
+    return this.workers
+      .filter((w) => !w.retiring && w.process.pid !== undefined)
+      .map((w) => w.process.pid as number);
+  }
+
+  stats() {
+    const sorted = [...this.latenciesMs].sort((a, b) => a - b);
+    return {
+      script: this.script,
+      size: this.options.size,
+      busy: this.workers.filter((w) => w.current !== null).length,
+      ready: this.workers.filter((w) => w.ready).length,
+      queued: this.queue.length,
+      restarts: this.restarts,
+      recycled: this.recycled,
+      p50Ms: percentile(sorted, 0.5),
+      p95Ms: percentile(sorted, 0.95),
+    };
+  }
+
+  private cancel(job: PendingJob) {
+    const queued = this.queue.indexOf(job);
+    if (queued >= 0) {
+      this.queue.splice(queued, 1);
+      job.reject(new PythonJobCancelled("Cancelled"));
+      return;
+    }
+
+    const worker = this.workers.find((w) => w.current === job);
+    if (!worker || job.cancelled) return;
+    job.cancelled = true;
+    worker.process.stdin.write(JSON.stringify({ cancel: job.id }) + "\n");
+    setTimeout(() => {
+      if (worker.current !== job) return;
+      log(`Python worker for ${this.script} did not stop cancelled job ${job.id}, killing it`, "python");
+      worker.retiring = true;
+      worker.ready = false;
+      worker.process.kill("SIGKILL");
+    }, CANCEL_GRACE_MS);
+  }
+
+  private startWorker(): Worker {
+    const child = spawn("python3", [this.script, "--serve"]);
+    const worker: Worker = {
+      process: child,
+      ready: false,
+      retiring: false,
+      jobsCompleted: 0,
+      current: null,
+      stdoutBuffer: "",
+      stderrTail: "",
+    };
+
+    child.stdout.on("data", (data) => {
+      worker.stdoutBuffer += data.toString();
+      let newline = worker.stdoutBuffer.indexOf("\n");
+      while (newline >= 0) {
+        const line = worker.stdoutBuffer.slice(0, newline).trim();
+        worker.stdoutBuffer = worker.stdoutBuffer.slice(newline + 1);
+        if (line) this.handleMessage(worker, line);
+        newline = worker.stdoutBuffer.indexOf("\n");
+      }
+    });
+
+    // Keep only the end of stderr so a crashing worker can explain itself
+    child.stderr.on("data", (data) => {
+      worker.stderrTail = (worker.stderrTail + data.toString()).slice(-STDERR_TAIL_LENGTH);
+    });
+
+    // Writes to a worker that just died surface here; the exit handler deals with the job
+    child.stdin.on("error", (error) => {
+      console.error(`Lost stdin of Python worker for ${this.script}:`, error.message);
+    });
+
+    child.on("error", (error) => {
+      console.error(`Failed to start Python worker for ${this.script}:`, error);
+    });
+
+    child.on("exit", (code, signal) => this.handleExit(worker, code, signal));
+
+    return worker;
+  }
+
+  private handleMessage(worker: Worker, line: string) {
+    let message: any;
+    try {
+      message = JSON.parse(line);
+    } catch {
+      console.error(`Unparseable output from Python worker ${this.script}:`, line);
+      return;
+    }
+
+    if (message.ready) {
+      worker.ready = true;
+      this.dispatch();
+      return;
+    }
+
+    const job = worker.current;
+    if (!job || message.id !== job.id) {
+      // Progress events can trail the response of a job that was just cancelled
+      if (message.event === undefined) {
+        console.error(`Unexpected response from Python worker ${this.script}:`, line);
+      }
+      return;
+    }
+
+    if (message.event !== undefined) {
+      job.onEvent?.(message.event);
+      return;
+    }
+
+    worker.current = null;
+    worker.jobsCompleted += 1;
+    this.recordLatency(Date.now() - job.enqueuedAt);
+
+    if (message.error !== undefined && (message.cancelled || job.cancelled)) {
+      job.reject(new PythonJobCancelled("Cancelled"));
+    } else if (message.error !== undefined && message.expired) {
+      job.reject(new PythonResultExpired(message.error));
+    } else if (message.error !== undefined) {
+      job.reject(new PythonJobError(message.error));
+    } else {
+      job.resolve(message.result);
+    }
+
+    if (this.options.maxJobsPerWorker > 0 && worker.jobsCompleted >= this.options.maxJobsPerWorker) {
+      this.retire(worker);
+    }
+    this.dispatch();
+  }
+
+  private handleExit(worker: Worker, code: number | null, signal: NodeJS.Signals | null) {
+    this.workers = this.workers.filter((w) => w !== worker);
+
+    if (worker.current?.cancelled) {
+      worker.current.reject(new PythonJobCancelled("Cancelled"));
+      worker.current = null;
+    } else if (worker.current) {
+      const details = worker.stderrTail.trim() || `exit code ${code ?? signal}`;
+      worker.current.reject(new Error(`Python worker crashed: ${details}`));
+      worker.current = null;
+    }
+
+    if (!worker.retiring) {
+      this.restarts += 1;
+      log(`Python worker for ${this.script} exited (${code ?? signal}), restarting`, "python");
+    }
+
+    // Back off when a worker dies before finishing its imports, to avoid a tight crash loop
+    setTimeout(() => this.replenish(), worker.ready || worker.retiring ? 0 : RESTART_BACKOFF_MS);
+  }
+
+  // Keep the pool at its configured size
+  private replenish() {
+    while (this.workers.length < this.options.size) {
+      this.workers.push(this.startWorker());
+    }
+    this.dispatch();
+  }
+
+  private retire(worker: Worker) {
+    worker.retiring = true;
+    worker.ready = false;
+    this.recycled += 1;
+    // Closing stdin ends the serve loop; the exit handler starts a replacement
+    worker.process.stdin.end();
+  }
+
+  private dispatch() {
+    let index = 0;
+    while (index < this.queue.length) {
+      const job = this.queue[index];
+
+      // State kept by a worker that has exited or is being recycled is gone
+      if (job.pid !== undefined && !this.workers.some((w) => w.process.pid === job.pid && !w.retiring)) {
+        this.queue.splice(index, 1);
+        job.reject(new PythonResultExpired("Result is no longer available; run the comparison again"));
+        continue;
+      }
+
+      const worker = this.workers.find(
+        (w) => w.ready && !w.retiring && !w.current && (job.pid === undefined || w.process.pid === job.pid),
+      );
+      if (!worker) {
+        index += 1;
+        continue;
+      }
+
+      this.queue.splice(index, 1);
+      worker.current = job;
+      worker.process.stdin.write(JSON.stringify({ id: job.id, payload: job.payload }) + "\n");
+    }
+  }
+
+  private recordLatency(ms: number) {
+    this.latenciesMs.push(ms);
+    if (this.latenciesMs.length > LATENCY_SAMPLE_SIZE) {
+      this.latenciesMs.shift();
+    }
+  }
+}
+
+export function poolOptionsFromEnv(prefix: string, defaultSize: number): PythonPoolOptions {
+  return {
+    size: Math.max(1, parseInt(process.env[`${prefix}_POOL_SIZE`] || String(defaultSize), 10)),
+    maxJobsPerWorker: Math.max(0, parseInt(process.env[`${prefix}_MAX_JOBS_PER_WORKER`] || "50", 10)),
+  };
+}
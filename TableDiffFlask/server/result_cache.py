@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of comparison results
+Each entry is one JSON file holding the result, its report text (when it was built) and the
+creation time. Entries expire after a TTL, and the least recently used ones are evicted once the
+cache grows past its size cap. Shared by every worker on the machine.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import tempfile
+from typing import Any, Dict, Optional
+from json_worker import dumps
+
+# Cache location, total size cap and entry lifetime
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'tablediff-results')
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_MB', '256')) * 1024 * 1024
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get('RESULT_CACHE_TTL_SECONDS', '3600'))
+
+
+def cache_key(parts: Any) -> str:
+    """Stable file name for a normalized request and its table fingerprints"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def entry_path(key: str) -> str:
+    """JSON file of a cache entry"""
+    return os.path.join(RESULT_CACHE_DIR, key + '.json')
+
+
+def lookup(key: str, ttl_seconds: float = RESULT_CACHE_TTL_SECONDS) -> Optional[Dict[str, Any]]:
+    """
+    A live cache entry marked as recently used, or None when it is missing or expired
+    Returns: {'createdAt', 'result', 'report'} (report is None when it had been deferred)
+    """
+    path = entry_path(key)
+    try:
+        with open(path) as f:
+            entry = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    if time.time() - entry['createdAt'] > ttl_seconds:
+        remove(key)
+        return None
+    os.utime(path)
+    return entry
+
+
+def store(key: str, result: Dict[str, Any], report: Optional[str]) -> None:
+    """Write an entry atomically and evict old ones past the size cap"""
+    os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+    path = entry_path(key)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'w') as f:
+            f.write(dumps({'createdAt': time.time(), 'result': result, 'report': report}))
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"Result not cached: {str(e)}", file=sys.stderr)
+        return
+    evict(RESULT_CACHE_MAX_BYTES)
+
+
+def remove(key: str) -> None:
+    """Delete a cache entry"""
+    try:
+        os.remove(entry_path(key))
+    except FileNotFoundError:
+        pass
+
+
+def evict(max_bytes: int) -> None:
+    """Remove least recently used entries until the cache fits in max_bytes"""
+    entries = []
+    for name in os.listdir(RESULT_CACHE_DIR):
+        if not name.endswith('.json'):
+            continue
+        try:
+            stat = os.stat(os.path.join(RESULT_CACHE_DIR, name))
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, name[:-len('.json')]))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, key in sorted(entries):
+        if total <= max_bytes:
+            break
+        remove(key)
+        total -= size
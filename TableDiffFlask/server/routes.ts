@@ -1,163 +1,321 @@
-import type { Express } from "express";
+import type { Express, Response } from "express";
 import { createServer, type Server } from "http";
-import { spawn } from "child_process";
-import { comparisonRequestSchema } from "@shared/schema";
+import { comparisonRequestSchema, type ComparisonRequest } from "@shared/schema";
 import { z } from "zod";
+import {
+  PythonJobError,
+  PythonResultExpired,
+  PythonWorkerPool,
+  poolOptionsFromEnv,
+  type RunOptions,
+} from "./pythonPool";
+import { jobStoreFromEnv } from "./jobs";
+import { AdmissionController, AdmissionRejected, admissionOptionsFromEnv } from "./admission";
 
-export async function registerRoutes(app: Express): Promise<Server> {
-  // POST /api/compare - Compare two Snowflake tables
-  app.post("/api/compare", async (req, res) => {
-    try {
-      // Validate request body
-      const validatedData = comparisonRequestSchema.parse(req.body);
+// Comment line sent on idle event streams so proxies do not time them out
+const SSE_HEARTBEAT_MS = 15000;
+// Stored results whose worker is remembered for follow-up tasks (oldest forgotten first)
+const MAX_TRACKED_RESULTS = 10000;
 
-      // Spawn Python process to perform comparison
-      const pythonProcess = spawn("python3", ["server/table_compare.py"]);
+export async function registerRoutes(app: Express): Promise<Server> {
+  // Warm Python workers: pandas, datacompy and the database drivers are imported once per worker
+  const compareOptions = poolOptionsFromEnv("COMPARE", 2);
+  const comparePool = new PythonWorkerPool("server/table_compare.py", compareOptions);
+  const docxPool = new PythonWorkerPool(
+    "server/generate_docx.py",
+    poolOptionsFromEnv("DOCX", 1),
+  );
 
-      let resultData = "";
-      let errorData = "";
+  // Comparisons are admitted by estimated memory so concurrent large jobs cannot exhaust the host
+  const admission = new AdmissionController(admissionOptionsFromEnv(compareOptions.size));
 
-      // Send request data to Python script via stdin
-      pythonProcess.stdin.write(JSON.stringify(validatedData));
-      pythonProcess.stdin.end();
+  // Worker holding each stored result (resultId -> PID), for the follow-up tasks under /api/results
+  const resultWorkers = new Map<string, number>();
+  const trackResult = (result: { resultId?: string; memory?: { pid?: number } }) => {
+    const live = new Set(comparePool.workerPids());
+    Array.from(resultWorkers.entries()).forEach(([resultId, pid]) => {
+      if (!live.has(pid)) resultWorkers.delete(resultId);
+    });
+    if (result.resultId && result.memory?.pid !== undefined) {
+      resultWorkers.set(result.resultId, result.memory.pid);
+    }
+    while (resultWorkers.size > MAX_TRACKED_RESULTS) {
+      resultWorkers.delete(resultWorkers.keys().next().value as string);
+    }
+  };
 
-      // Collect stdout (results)
-      pythonProcess.stdout.on("data", (data) => {
-        resultData += data.toString();
-      });
+  // Estimate a comparison from metadata, wait for admission, then run it on a warm Python worker.
+  // A result cache hit is answered by the estimate task itself, without admission or a second task.
+  const runComparison = async (data: ComparisonRequest, options: RunOptions = {}) => {
+    admission.retainWorkers(comparePool.workerPids());
+    const estimate = await comparePool.run(
+      { ...data, task: "estimate" },
+      { signal: options.signal, onEvent: options.onEvent },
+    );
+    if (estimate.cacheHit) {
+      admission.retain(estimate.result.memory);
+      trackResult(estimate.result);
+      return estimate.result;
+    }
+    options.onEvent?.({ phase: "estimated", ...estimate });
+    const ticket = await admission.admit(estimate, {
+      signal: options.signal,
+      onQueued: (position) => options.onEvent?.({ phase: "queued", position }),
+    });
+    const admissionInfo = {
+      estimatedMb: ticket.estimatedMb,
+      queuePosition: ticket.queuePosition,
+      waitSeconds: ((ticket.admittedAt ?? ticket.enqueuedAt) - ticket.enqueuedAt) / 1000,
+    };
+    options.onEvent?.({ phase: "admitted", ...admissionInfo });
 
-      // Collect stderr (errors)
-      pythonProcess.stderr.on("data", (data) => {
-        errorData += data.toString();
-      });
+    try {
+      const result = await comparePool.run(data, options);
+      admission.release(ticket, result.memory);
+      trackResult(result);
+      return { ...result, admission: admissionInfo };
+    } catch (error) {
+      admission.release(ticket);
+      throw error;
+    }
+  };
 
-      // Handle process completion
-      pythonProcess.on("close", (code) => {
-        if (code === 0) {
-          try {
-            const result = JSON.parse(resultData);
-            res.json(result);
-          } catch (parseError) {
-            console.error("Failed to parse Python output:", parseError);
-            res.status(500).json({
-              error: "Failed to parse comparison results",
-              details: resultData,
-            });
-          }
-        } else {
-          console.error("Python process failed:", errorData);
-          try {
-            const errorResult = JSON.parse(errorData);
-            res.status(500).json({
-              error: errorResult.error || "Comparison failed",
-            });
-          } catch {
-            res.status(500).json({
-              error: "Comparison failed",
-              details: errorData || "Unknown error occurred",
-            });
-          }
-        }
-      });
+  // POST /api/compare - Compare two Snowflake tables
+  app.post("/api/compare", async (req, res) => {
+    try {
+      // Validate request body
+      const validatedData = comparisonRequestSchema.parse(req.body);
 
-      // Handle process errors
-      pythonProcess.on("error", (error) => {
-        console.error("Failed to start Python process:", error);
-        res.status(500).json({
-          error: "Failed to start comparison process",
-          details: error.message,
-        });
-      });
+      const result = await runComparison(validatedData);
+      res.json(result);
     } catch (error) {
       if (error instanceof z.ZodError) {
         res.status(400).json({
           error: "Invalid request data",
           details: error.errors,
         });
+      } else if (error instanceof AdmissionRejected) {
+        res.status(error.status).json({ error: error.message });
+      } else if (error instanceof PythonJobError) {
+        console.error("Python comparison failed:", error.message);
+        res.status(500).json({
+          error: error.message || "Comparison failed",
+        });
       } else {
         console.error("Comparison error:", error);
         res.status(500).json({
-          error: error instanceof Error ? error.message : "Unknown error",
+          error: "Comparison failed",
+          details: error instanceof Error ? error.message : "Unknown error occurred",
         });
       }
     }
   });
 
-  // POST /api/generate-docx - Generate Word document from comparison results
-  app.post("/api/generate-docx", async (req, res) => {
+  // Asynchronous comparisons: submission returns a job ID, progress is polled or streamed
+  const jobs = jobStoreFromEnv();
+
+  // POST /api/jobs - Start a comparison in the background
+  app.post("/api/jobs", (req, res) => {
     try {
-      // Spawn Python process to generate Word document
-      const pythonProcess = spawn("python3", ["server/generate_docx.py"]);
+      const validatedData = comparisonRequestSchema.parse(req.body);
+      const job = jobs.create((options) => runComparison(validatedData, options));
+      if (!job) {
+        res.status(429).json({ error: "Too many comparisons in progress; try again later" });
+        return;
+      }
+      res.status(202).json({ jobId: job.id, status: job.status });
+    } catch (error) {
+      if (error instanceof z.ZodError) {
+        res.status(400).json({ error: "Invalid request data", details: error.errors });
+      } else {
+        console.error("Job submission error:", error);
+        res.status(500).json({ error: error instanceof Error ? error.message : "Job submission failed" });
+      }
+    }
+  });
 
-      let resultData = "";
-      let errorData = "";
+  // GET /api/jobs/:id - Job status, progress events after ?since=<n>, and the result once finished
+  app.get("/api/jobs/:id", (req, res) => {
+    const job = jobs.get(req.params.id);
+    if (!job) {
+      res.status(404).json({ error: "Job not found" });
+      return;
+    }
+    res.json(jobs.view(job, Math.max(0, parseInt(String(req.query.since ?? "0"), 10) || 0)));
+  });
 
-      // Send result data to Python script via stdin
-      pythonProcess.stdin.write(JSON.stringify(req.body));
-      pythonProcess.stdin.end();
+  // GET /api/jobs/:id/events - Server-Sent Events: "progress" per event (past ones first), then
+  // "done" with the final status; the result itself is read from GET /api/jobs/:id
+  app.get("/api/jobs/:id/events", (req, res) => {
+    const job = jobs.get(req.params.id);
+    if (!job) {
+      res.status(404).json({ error: "Job not found" });
+      return;
+    }
 
-      // Collect stdout (base64 encoded document)
-      pythonProcess.stdout.on("data", (data) => {
-        resultData += data.toString();
-      });
+    res.writeHead(200, {
+      "Content-Type": "text/event-stream",
+      "Cache-Control": "no-cache",
+      Connection: "keep-alive",
+      "X-Accel-Buffering": "no",
+    });
+    const send = (event: string, data: unknown) => res.write(`event: ${event}\ndata: ${JSON.stringify(data)}\n\n`);
+    const done = () => {
+      send("done", { status: job.status, error: job.error });
+      res.end();
+    };
 
-      // Collect stderr (errors)
-      pythonProcess.stderr.on("data", (data) => {
-        errorData += data.toString();
-      });
+    job.events.forEach((event) => send("progress", event));
+    if (job.finishedAt !== null) {
+      done();
+      return;
+    }
 
-      // Handle process completion
-      pythonProcess.on("close", (code) => {
-        if (code === 0) {
-          try {
-            const result = JSON.parse(resultData);
-            
-            // Decode base64 document
-            const docBuffer = Buffer.from(result.docx, 'base64');
-            
-            // Set headers for file download
-            const filename = `table-comparison-${new Date().toISOString().slice(0, 10)}.docx`;
-            res.setHeader('Content-Type', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document');
-            res.setHeader('Content-Disposition', `attachment; filename="${filename}"`);
-            res.setHeader('Content-Length', docBuffer.length);
-            
-            // Send the document
-            res.send(docBuffer);
-          } catch (parseError) {
-            console.error("Failed to parse Python output:", parseError);
-            res.status(500).json({
-              error: "Failed to generate Word document",
-              details: resultData,
-            });
-          }
-        } else {
-          console.error("Python process failed:", errorData);
-          try {
-            const errorResult = JSON.parse(errorData);
-            res.status(500).json({
-              error: errorResult.error || "Document generation failed",
-            });
-          } catch {
-            res.status(500).json({
-              error: "Document generation failed",
-              details: errorData || "Unknown error occurred",
-            });
-          }
-        }
+    const heartbeat = setInterval(() => res.write(": keep-alive\n\n"), SSE_HEARTBEAT_MS);
+    const unsubscribe = jobs.subscribe(job, (event) => {
+      if (event) {
+        send("progress", event);
+      } else {
+        clearInterval(heartbeat);
+        done();
+      }
+    });
+    req.on("close", () => {
+      clearInterval(heartbeat);
+      unsubscribe();
+    });
+  });
+
+  // DELETE /api/jobs/:id - Cancel a job; running database queries are aborted
+  app.delete("/api/jobs/:id", (req, res) => {
+    const job = jobs.get(req.params.id);
+    if (!job) {
+      res.status(404).json({ error: "Job not found" });
+      return;
+    }
+    if (!jobs.cancel(job)) {
+      res.status(409).json({ error: `Job already ${job.status}`, status: job.status });
+      return;
+    }
+    res.status(202).json({ jobId: job.id, status: job.status });
+  });
+
+  // Generate a Word document from a full comparison result and send it as a download
+  const sendDocx = async (res: Response, result: unknown) => {
+    // Generate the document on a warm Python worker (returned base64 encoded)
+    const encoded = await docxPool.run<{ docx: string }>(result);
+
+    // Decode base64 document
+    const docBuffer = Buffer.from(encoded.docx, 'base64');
+
+    // Set headers for file download
+    const filename = `table-comparison-${new Date().toISOString().slice(0, 10)}.docx`;
+    res.setHeader('Content-Type', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document');
+    res.setHeader('Content-Disposition', `attachment; filename="${filename}"`);
+    res.setHeader('Content-Length', docBuffer.length);
+
+    // Send the document
+    res.send(docBuffer);
+  };
+
+  const sendDocxError = (res: Response, error: unknown) => {
+    console.error("Document generation error:", error);
+    res.status(error instanceof PythonResultExpired ? 410 : 500).json({
+      error: error instanceof PythonJobError ? error.message : "Document generation failed",
+      details: error instanceof Error ? error.message : "Unknown error occurred",
+    });
+  };
+
+  // Comparison results stay in the worker that produced them; unknown IDs and IDs of recycled
+  // workers have expired (410 Gone)
+  const resultWorker = (resultId: string): RunOptions => {
+    const pid = resultWorkers.get(resultId);
+    if (pid === undefined) {
+      throw new PythonResultExpired("Result is no longer available; run the comparison again");
+    }
+    return { pid };
+  };
+
+  // POST /api/generate-docx - Generate Word document from comparison results
+  app.post("/api/generate-docx", async (req, res) => {
+    try {
+      await sendDocx(res, req.body);
+    } catch (error) {
+      sendDocxError(res, error);
+    }
+  });
+
+  // GET /api/results/:id/report - Build the text report of a comparison run with includeReport: false
+  app.get("/api/results/:id/report", async (req, res) => {
+    try {
+      const result = await comparePool.run(
+        { task: "report", resultId: req.params.id },
+        resultWorker(req.params.id),
+      );
+      res.json(result);
+    } catch (error) {
+      console.error("Report generation error:", error);
+      res.status(error instanceof PythonResultExpired ? 410 : 500).json({
+        error: error instanceof Error ? error.message : "Report generation failed",
       });
+    }
+  });
 
-      // Handle process errors
-      pythonProcess.on("error", (error) => {
-        console.error("Failed to start Python process:", error);
-        res.status(500).json({
-          error: "Failed to start document generation process",
-          details: error.message,
+  // GET /api/results/:id/docx - Word document for a stored comparison result
+  app.get("/api/results/:id/docx", async (req, res) => {
+    try {
+      const result = await comparePool.run(
+        { task: "result", resultId: req.params.id },
+        resultWorker(req.params.id),
+      );
+      await sendDocx(res, result);
+    } catch (error) {
+      sendDocxError(res, error);
+    }
+  });
+
+  // POST /api/results/:id/email - Email the report of a stored comparison result
+  app.post("/api/results/:id/email", async (req, res) => {
+    try {
+      const { emailAddress } = z.object({ emailAddress: z.string().email() }).parse(req.body);
+      const result = await comparePool.run(
+        { task: "email", resultId: req.params.id, emailAddress },
+        resultWorker(req.params.id),
+      );
+      res.json(result);
+    } catch (error) {
+      if (error instanceof z.ZodError) {
+        res.status(400).json({ error: "Invalid request data", details: error.errors });
+      } else {
+        console.error("Email error:", error);
+        res.status(error instanceof PythonResultExpired ? 410 : 500).json({
+          error: error instanceof Error ? error.message : "Email failed",
         });
-      });
+      }
+    }
+  });
+
+  // GET /api/workers - Python worker pool health and latency percentiles
+  app.get("/api/workers", (_req, res) => {
+    res.json({
+      compare: comparePool.stats(),
+      docx: docxPool.stats(),
+      admission: admission.stats(),
+    });
+  });
+
+  // GET /api/connections - Database connection pool counters of each comparison worker
+  // (a worker busy with a comparison answers once it finishes)
+  app.get("/api/connections", async (_req, res) => {
+    try {
+      const workers = await Promise.all(
+        comparePool.workerPids().map((pid) => comparePool.run({ task: "poolStats" }, { pid })),
+      );
+      res.json({ workers });
     } catch (error) {
-      console.error("Document generation error:", error);
+      console.error("Connection pool stats error:", error);
       res.status(500).json({
-        error: error instanceof Error ? error.message : "Unknown error",
+        error: error instanceof Error ? error.message : "Connection pool stats failed",
       });
     }
   });
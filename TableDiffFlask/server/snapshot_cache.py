@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+On-disk snapshot cache of fetched tables
+Snapshots are uncompressed Arrow IPC files, memory-mapped on load, with a JSON sidecar
+holding the creation time and table fingerprint. Least recently used snapshots are
+evicted once the cache grows past its size cap.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import tempfile
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from typing import Any, Dict, List, Optional
+
+# Cache location and total size cap, shared by every worker on the machine
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'tablediff-snapshots')
+SNAPSHOT_MAX_BYTES = int(os.environ.get('SNAPSHOT_CACHE_MAX_MB', '2048')) * 1024 * 1024
+
+# Snapshot age after which it is fetched again
+SNAPSHOT_TTL_SECONDS = 3600
+
+
+def snapshot_key(parts: List[Any]) -> str:
+    """Stable file name for the identifying parts of a fetch"""
+    return hashlib.sha256(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+
+
+def snapshot_paths(key: str) -> Dict[str, str]:
+    """Data and sidecar paths for a snapshot key"""
+    base = os.path.join(SNAPSHOT_DIR, key)
+    return {'data': base + '.arrow', 'meta': base + '.json'}
+
+
+def remove_snapshot(key: str) -> None:
+    """Delete a snapshot; open memory maps stay valid until they are released"""
+    for path in snapshot_paths(key).values():
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def lookup(key: str, ttl_seconds: float = SNAPSHOT_TTL_SECONDS) -> Optional[Dict[str, Any]]:
+    """
+    Sidecar metadata of a live snapshot, or None when it is missing or expired
+    Returns: {'createdAt', 'fingerprint', 'rows', 'bytes'}
+    """
+    paths = snapshot_paths(key)
+    try:
+        with open(paths['meta']) as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    if not os.path.exists(paths['data']) or time.time() - meta['createdAt'] > ttl_seconds:
+        remove_snapshot(key)
+        return None
+    return meta
+
+
+def load_table(key: str) -> pa.Table:
+    """Memory-map a snapshot as an Arrow table and mark it as recently used"""
+    path = snapshot_paths(key)['data']
+    table = feather.read_table(path, memory_map=True)
+    os.utime(path)
+    return table
+
+
+def load(key: str) -> pd.DataFrame:
+    """Memory-map a snapshot as a DataFrame and mark it as recently used"""
+    return load_table(key).to_pandas(split_blocks=True)
+
+
+def store(key: str, df: pd.DataFrame | pa.Table, fingerprint: Optional[List[Any]]) -> bool:
+    """
+    Write a snapshot (DataFrame or Arrow table) atomically and evict old ones past the size cap
+    Frames Arrow cannot represent (e.g. mixed-type object columns) are not cached, and neither
+    is anything when the write fails (e.g. a full disk)
+    """
+    paths = snapshot_paths(key)
+    try:
+        table = df if isinstance(df, pa.Table) else pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+        print(f"Snapshot not cached: {str(e)}", file=sys.stderr)
+        return False
+
+    temp_path = f"{paths['data']}.{os.getpid()}.tmp"
+    meta_temp_path = f"{paths['meta']}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        feather.write_feather(table, temp_path, compression='uncompressed')
+        meta = {
+            'createdAt': time.time(),
+            'fingerprint': fingerprint,
+            'rows': int(len(df)),
+            'bytes': os.path.getsize(temp_path),
+        }
+        os.replace(temp_path, paths['data'])
+        with open(meta_temp_path, 'w') as f:
+            json.dump(meta, f, default=str)
+        os.replace(meta_temp_path, paths['meta'])
+    except OSError as e:
+        print(f"Snapshot not cached: {str(e)}", file=sys.stderr)
+        for path in (temp_path, meta_temp_path):
+            if os.path.exists(path):
+                os.remove(path)
+        remove_snapshot(key)
+        return False
+
+    evict(SNAPSHOT_MAX_BYTES)
+    return True
+
+
+def evict(max_bytes: int) -> None:
+    """Remove least recently used snapshots until the cache fits in max_bytes"""
+    entries = []
+    for name in os.listdir(SNAPSHOT_DIR):
+        if not name.endswith('.arrow'):
+            continue
+        try:
+            stat = os.stat(os.path.join(SNAPSHOT_DIR, name))
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, name[:-len('.arrow')]))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, key in sorted(entries):
+        if total <= max_bytes:
+            break
+        remove_snapshot(key)
+        total -= size
@@ -5,18 +5,123 @@ Compares two database tables (Snowflake and/or SQL Server) and returns detailed
 """
 
 import sys
+import re
 import json
+import time
+import math
+import statistics
+import decimal
 import datetime
 import snowflake.connector
 import pymssql
 import pandas as pd
 import numpy as np
+import pyarrow as pa
 import datacompy
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
+import uuid
+import types
+import shutil
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+import threading
+from json_worker import ResultExpired, cancelled, check_cancelled, dumps, emit, serve
+import snapshot_cache
+import connection_pool
+import result_cache
+import watermark_state
+from dtype_normalize import normalization_summary, normalize_frame
+from native_compare import NativeCompare
+from columnar_compare import DuckDBCompare, polars_compare
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Number of sample rows returned for each kind of difference
+SAMPLE_ROWS = 100
+
+# Rows per fetchmany batch when streaming SQL Server results
+FETCH_BATCH_ROWS = 50000
+
+# Keys per IN (...) / OR predicate when fetching rows for specific keys
+KEY_FETCH_CHUNK = 1000
+
+# Rows fetched and compared together by the key pre-diff mode, and its partition cap for text keys
+KEY_DETAIL_BATCH = 50000
+KEY_DETAIL_MAX_PARTITIONS = 64
+NULL_KEY_RANGE = (None, None, 'null')
+
+# Cap on mismatched rows fetched in full by the hash comparison mode
+MAX_HASH_DETAIL_ROWS = 10000
+
+# Bisection mode defaults: segments per split, leaf size fetched raw, and a recursion limit
+BISECT_SEGMENTS = 16
+BISECT_LEAF_ROWS = 10000
+BISECT_MAX_ROUNDS = 12
+
+# Leaf segments OR-ed into one predicate when fetching raw rows
+SEGMENT_FETCH_CHUNK = 100
+
+# Default number of hash partitions for the partitioned comparison mode
+PARTITION_COUNT = 16
+
+# Loaded partition size multiplier covering datacompy's merge and intermediate frames
+COMPARE_MEMORY_FACTOR = 4
+
+# How many times an oversized spilled partition may be split again
+MAX_REPARTITION_LEVELS = 3
+
+# Admission estimates: bytes per fetched value by source type family (text is a rough average the
+# server corrects by calibrating against measured peaks) and per row hash
+TEXT_WIDTH_BYTES = 64
+HASH_WIDTH_BYTES = 80
+
+# Rows assumed for a table the catalog has no count for (views, SQL Server tables without partition
+# stats), rather than counting them with a scan before admission
+UNKNOWN_TABLE_ROWS = int(os.environ.get('ESTIMATE_UNKNOWN_ROWS', '1000000'))
+
+# Extra memory per engine over a pandas fetch: the columnar engines hold the Arrow fetch plus their
+# own copy of it
+ENGINE_MEMORY_FACTORS = {'datacompy': 1.0, 'native': 1.0, 'polars': 1.5, 'duckdb': 1.5}
+
+# Comparisons kept per worker for deferred reports, DOCX export and email (each may hold datacompy
+# state): at most this many, holding at most RESULT_STORE_MAX_MB together, each dropped once unused
+# for RESULT_STORE_TTL_SECONDS
+RESULT_STORE_SIZE = 4
+RESULT_STORE_MAX_BYTES = int(os.environ.get('RESULT_STORE_MAX_MB', '512')) * 1024 * 1024
+RESULT_STORE_TTL_SECONDS = float(os.environ.get('RESULT_STORE_TTL_SECONDS', '900'))
+RESULT_STORE: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+
+# Relative tolerance when comparing aggregate profiles (float sums depend on summation order)
+PROFILE_REL_TOLERANCE = 1e-9
+
+# Sampled mode: fraction used when neither sampleFraction nor targetError is given, the default
+# confidence of the reported intervals, and the key hash range the fraction is taken from
+SAMPLE_FRACTION = 0.01
+SAMPLE_CONFIDENCE = 0.95
+SAMPLE_HASH_BUCKETS = 2 ** 32
+
+# Request fields left out of the result cache key: credentials, and options that only shape how
+# the result is delivered rather than what is compared
+RESULT_CACHE_IGNORED_FIELDS = {
+    'snowflakePassword', 'sqlserver1Password', 'sqlserver2Password',
+    'emailAddress', 'sendEmail', 'includeReport', 'payloadFormat', 'resultCache', 'forceRefresh', 'cacheChecksum', 'storeResult', 'task',
+}
+
+# Connections with a query in flight, so a cancelled job can abort them
+ACTIVE_CONNECTIONS: Dict[int, Tuple[Dict[str, Any], Any]] = {}
+ACTIVE_CONNECTIONS_LOCK = threading.Lock()
+
+# INFORMATION_SCHEMA column lists by table, kept for the life of the worker process
+COLUMN_METADATA_CACHE: Dict[Tuple[str, ...], List[Tuple[str, str]]] = {}
 
 
 def convert_to_json_serializable(obj):
@@ -31,14 +136,16 @@ def convert_to_json_serializable(obj):
         return obj.tolist()
     elif isinstance(obj, (pd.Timestamp, datetime.datetime)):
         return obj.isoformat()
+    elif isinstance(obj, decimal.Decimal):
+        return None if obj.is_nan() else float(obj)
     elif isinstance(obj, pd.NaT.__class__):
         return None
-    elif pd.isna(obj):
-        return None
     elif isinstance(obj, dict):
         return {key: convert_to_json_serializable(value) for key, value in obj.items()}
     elif isinstance(obj, list):
         return [convert_to_json_serializable(item) for item in obj]
+    elif pd.isna(obj):
+        return None
     else:
         return obj
 
@@ -125,28 +232,83 @@ def connect_sqlserver(host: str, user: str, password: str, database: str,
     return conn, cursor
 
 
-def query_snowflake(cursor: Any, database: str, schema: str, table: str, 
-                    columns: str = '*', filter_clause: str = '') -> pd.DataFrame:
-    """Query a Snowflake table and return DataFrame"""
-    cursor.execute(f'USE DATABASE {database}')
-    cursor.execute(f'USE SCHEMA {schema}')
-    
+def execute_snowflake_select(cursor: Any, database: str, schema: str, table: str,
+                             columns: str = '*', filter_clause: str = '') -> None:
+    """
+    Run the SELECT for a Snowflake table, leaving the result on the cursor
+    The table is fully qualified, so a pooled session shared by both sides needs no USE round trips
+    """
     query = f'SELECT {columns} FROM {database}.{schema}.{table}'
     if filter_clause:
         query += f' {filter_clause}'
     
     cursor.execute(query)
+
+
+def query_snowflake(cursor: Any, database: str, schema: str, table: str, 
+                    columns: str = '*', filter_clause: str = '', normalize: bool = True,
+                    report: Optional[List[Dict[str, Any]]] = None) -> pd.DataFrame:
+    """
+    Query a Snowflake table and return DataFrame
+    Columns get compact dtypes unless normalize is False; report collects what was converted
+    """
+    execute_snowflake_select(cursor, database, schema, table, columns, filter_clause)
     df = cursor.fetch_pandas_all()
     
     # Normalize column names to lowercase for consistent comparison
     df.columns = [col.lower() for col in df.columns]
     
+    return normalize_frame(df, report) if normalize else df
+
+
+def iter_snowflake_chunks(cursor: Any, database: str, schema: str, table: str,
+                          columns: str = '*', filter_clause: str = '') -> Iterator[pd.DataFrame]:
+    """
+    Stream a Snowflake query as DataFrame chunks using the connector's Arrow result batches
+    Column names are lowercased; an empty result yields a single empty frame with the columns
+    """
+    execute_snowflake_select(cursor, database, schema, table, columns, filter_clause)
+    column_names = [desc[0].lower() for desc in cursor.description]
+    
+    yielded = False
+    for batch in cursor.fetch_pandas_batches():
+        batch.columns = [col.lower() for col in batch.columns]
+        yielded = True
+        yield batch
+    
+    if not yielded:
+        yield pd.DataFrame(columns=column_names)
+
+
+def rows_to_frame(rows: List[Tuple], column_names: List[str]) -> pd.DataFrame:
+    """
+    Build a DataFrame column by column from one batch of row tuples
+    pandas infers int64/float64/datetime64 where every value allows it; Decimal and mixed columns
+    stay object until normalize_frame. The per-row tuples can be freed before the next batch.
+    """
+    columns = list(zip(*rows))
+    df = pd.DataFrame({i: pd.Series(values) for i, values in enumerate(columns)})
+    df.columns = column_names
     return df
 
 
-def query_sqlserver(cursor: Any, database: str, schema: str, table: str, 
-                    columns: str = '*', filter_clause: str = '') -> pd.DataFrame:
-    """Query a SQL Server table and return DataFrame"""
+def rows_to_table(rows: List[Tuple], column_names: List[str]) -> pa.Table:
+    """
+    Arrow counterpart of rows_to_frame, used by the columnar engines
+    A column Arrow cannot type (mixed Python types) is kept as text.
+    """
+    arrays = []
+    for values in zip(*rows):
+        try:
+            arrays.append(pa.array(values))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.array([None if value is None else str(value) for value in values], pa.string()))
+    return pa.Table.from_arrays(arrays, names=column_names)
+
+
+def execute_sqlserver_select(cursor: Any, database: str, schema: str, table: str,
+                             columns: str = '*', filter_clause: str = '') -> List[str]:
+    """Run the SELECT for a SQL Server table and return its lowercased column names"""
     # SQL Server doesn't need USE DATABASE if connection already specifies it
     # But we can include it for safety
     cursor.execute(f'USE [{database}]')
@@ -157,186 +319,3011 @@ def query_sqlserver(cursor: Any, database: str, schema: str, table: str,
     
     cursor.execute(query)
     
-    # Fetch all rows and column names
-    columns_info = [desc[0] for desc in cursor.description]
-    rows = cursor.fetchall()
+    # Normalize column names to lowercase for consistent comparison
+    return [desc[0].lower() for desc in cursor.description]
+
+
+def iter_sqlserver_chunks(cursor: Any, database: str, schema: str, table: str,
+                          columns: str = '*', filter_clause: str = '',
+                          batch_size: int = FETCH_BATCH_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Stream a SQL Server query as DataFrame chunks of up to batch_size rows using fetchmany
+    Column names are lowercased; an empty result yields a single empty frame with the columns
+    """
+    column_names = execute_sqlserver_select(cursor, database, schema, table, columns, filter_clause)
     
-    # Create DataFrame
-    df = pd.DataFrame.from_records(rows, columns=columns_info)
+    yielded = False
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yielded = True
+        yield rows_to_frame(rows, column_names)
     
-    # Normalize column names to lowercase for consistent comparison
-    df.columns = [col.lower() for col in df.columns]
+    if not yielded:
+        yield pd.DataFrame(columns=column_names)
+
+
+def query_sqlserver(cursor: Any, database: str, schema: str, table: str, 
+                    columns: str = '*', filter_clause: str = '',
+                    batch_size: int = FETCH_BATCH_ROWS, normalize: bool = True,
+                    report: Optional[List[Dict[str, Any]]] = None) -> pd.DataFrame:
+    """
+    Query a SQL Server table and return DataFrame (fetched in batches of batch_size rows)
+    Decimal/datetime/str objects are mapped to compact dtypes unless normalize is False;
+    report collects what was converted
+    """
+    chunks = list(iter_sqlserver_chunks(cursor, database, schema, table, columns,
+                                        filter_clause, batch_size))
+    df = chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+    return normalize_frame(df, report) if normalize else df
+
+
+def empty_arrow_table(column_names: List[str]) -> pa.Table:
+    """Zero-row Arrow table with untyped columns, for an empty result"""
+    return pa.table({name: pa.array([], pa.null()) for name in column_names})
+
+
+def concat_arrow_tables(tables: List[pa.Table]) -> pa.Table:
+    """Concatenate fetched Arrow pieces, widening types that differ between them (e.g. all-null batches)"""
+    if len(tables) == 1:
+        return tables[0]
+    return pa.concat_tables(tables, promote_options='permissive')
+
+
+def query_snowflake_arrow(cursor: Any, database: str, schema: str, table: str,
+                          columns: str = '*', filter_clause: str = '') -> pa.Table:
+    """Query a Snowflake table into an Arrow table straight from the connector's result batches"""
+    execute_snowflake_select(cursor, database, schema, table, columns, filter_clause)
+    arrow_table = cursor.fetch_arrow_all(force_return_table=True)
+    return arrow_table.rename_columns([col.lower() for col in arrow_table.column_names])
+
+
+def query_sqlserver_arrow(cursor: Any, database: str, schema: str, table: str,
+                          columns: str = '*', filter_clause: str = '',
+                          batch_size: int = FETCH_BATCH_ROWS) -> pa.Table:
+    """Query a SQL Server table into an Arrow table, built batch by batch without pandas"""
+    column_names = execute_sqlserver_select(cursor, database, schema, table, columns, filter_clause)
     
-    return df
+    tables = []
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        tables.append(rows_to_table(rows, column_names))
+    
+    if not tables:
+        return empty_arrow_table(column_names)
+    return concat_arrow_tables(tables)
 
 
-def compare_tables(request_data: Dict[str, Any]) -> Dict[str, Any]:
+def peak_rss_mb() -> Optional[float]:
     """
-    Compare two database tables and return comparison results
-    Supports Snowflake-to-Snowflake, SQL Server-to-SQL Server, 
-    and cross-database comparisons
+    Peak resident set size in MB during the current job: VmHWM, which handle_request restarts
+    for each job (reset_peak_rss). Where /proc is unavailable this falls back to ru_maxrss, the
+    whole process's high-water mark; None where neither is supported.
     """
+    peak = proc_status_mb('VmHWM')
+    if peak is not None:
+        return peak
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(usage / divisor, 1)
+
+
+def reset_peak_rss() -> None:
+    """Restart this process's peak RSS (VmHWM) from its current size; Linux only, else a no-op"""
     try:
-        # Get database types
-        db1_type = request_data.get('db1Type', 'snowflake')
-        db2_type = request_data.get('db2Type', 'snowflake')
-        
-        # Database details
-        database1 = request_data['database1']
-        schema1 = request_data['schema1']
-        table1 = request_data['table1']
-        columns1 = request_data.get('columns1', '*')
-        filter1 = request_data.get('filter1', '')
-        
-        database2 = request_data['database2']
-        schema2 = request_data['schema2']
-        table2 = request_data['table2']
-        columns2 = request_data.get('columns2', '*')
-        filter2 = request_data.get('filter2', '')
-        
-        # Primary keys
-        primary_key1 = request_data['primaryKey1']
-        primary_key2 = request_data.get('primaryKey2', '')
-        primary_key3 = request_data.get('primaryKey3', '')
-        primary_key4 = request_data.get('primaryKey4', '')
-        
-        # Email configuration
-        email_address = request_data.get('emailAddress', '')
-        send_email_flag = request_data.get('sendEmail', False)
-        
-        # Connect to database 1 based on type
-        if db1_type == 'snowflake':
-            user = request_data.get('snowflakeUser')
-            password = request_data.get('snowflakePassword')
-            account = request_data.get('snowflakeAccount')
-            warehouse1 = request_data.get('warehouse1', '')
-            
-            conn1, cursor1 = connect_snowflake(user, password, account, warehouse1)
-            df1 = query_snowflake(cursor1, database1, schema1, table1, columns1, filter1)
-        else:  # sqlserver
-            host = request_data.get('sqlserver1Host')
-            port = request_data.get('sqlserver1Port', 1433)
-            user = request_data.get('sqlserver1User')
-            password = request_data.get('sqlserver1Password')
-            
-            conn1, cursor1 = connect_sqlserver(host, user, password, database1, port)
-            df1 = query_sqlserver(cursor1, database1, schema1, table1, columns1, filter1)
-        
-        # Connect to database 2 based on type
-        if db2_type == 'snowflake':
-            # Use Snowflake credentials from request (may be same as db1 if both are Snowflake)
-            user = request_data.get('snowflakeUser')
-            password = request_data.get('snowflakePassword')
-            account = request_data.get('snowflakeAccount')
-            warehouse2 = request_data.get('warehouse2', '')
-            
-            conn2, cursor2 = connect_snowflake(user, password, account, warehouse2)
-            df2 = query_snowflake(cursor2, database2, schema2, table2, columns2, filter2)
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def proc_status_mb(field: str) -> Optional[float]:
+    """A memory field of /proc/self/status (e.g. VmRSS, VmHWM) in MB, or None where unavailable"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def get_side_config(request_data: Dict[str, Any], side: int) -> Dict[str, Any]:
+    """
+    Collect connection and table settings for database 1 or database 2
+    Snowflake credentials are shared by both sides, SQL Server credentials are per side
+    """
+    db_type = request_data.get(f'db{side}Type', 'snowflake')
+    config = {
+        'side': side,
+        'dbType': db_type,
+        'database': request_data[f'database{side}'],
+        'schema': request_data[f'schema{side}'],
+        'table': request_data[f'table{side}'],
+        'columns': request_data.get(f'columns{side}', '*') or '*',
+        'filter': request_data.get(f'filter{side}', '') or '',
+        'fetchBatchSize': int(request_data.get('fetchBatchSize') or FETCH_BATCH_ROWS),
+        'parallelFetch': max(1, int(request_data.get('parallelFetch') or 1)),
+        'parallelFetchMethod': request_data.get('parallelFetchMethod') or 'range',
+        'parallelKey': (request_data.get('primaryKey1') or '').strip().lower(),
+        'sampleRows': int(request_data['sampleRows']) if request_data.get('sampleRows') is not None else SAMPLE_ROWS,
+        'snapshotCache': bool(request_data.get('snapshotCache')),
+        'snapshotTtlSeconds': float(request_data.get('snapshotTtlSeconds') or snapshot_cache.SNAPSHOT_TTL_SECONDS),
+        'validateSnapshot': bool(request_data.get('validateSnapshot')),
+        'engine': request_data.get('engine') or 'datacompy',
+        'normalizeDtypes': request_data.get('normalizeDtypes') is not False,
+    }
+    
+    if db_type == 'snowflake':
+        config['user'] = request_data.get('snowflakeUser')
+        config['password'] = request_data.get('snowflakePassword')
+        config['account'] = request_data.get('snowflakeAccount')
+        config['warehouse'] = request_data.get(f'warehouse{side}', '')
+    else:  # sqlserver
+        config['host'] = request_data.get(f'sqlserver{side}Host')
+        config['port'] = request_data.get(f'sqlserver{side}Port') or 1433
+        config['user'] = request_data.get(f'sqlserver{side}User')
+        config['password'] = request_data.get(f'sqlserver{side}Password')
+    
+    return config
+
+
+def connect_side(config: Dict[str, Any]) -> Tuple[Any, Any]:
+    """Open a connection for one side of the comparison"""
+    if config['dbType'] == 'snowflake':
+        return connect_snowflake(config['user'], config['password'],
+                                 config['account'], config['warehouse'])
+    return connect_sqlserver(config['host'], config['user'], config['password'],
+                             config['database'], config['port'])
+
+
+def side_pool_key(config: Dict[str, Any]) -> Tuple[str, ...]:
+    """Connection pool key: driver, target and credentials (Snowflake sessions carry the warehouse)"""
+    if config['dbType'] == 'snowflake':
+        return connection_pool.pool_key(['snowflake', config['account'], config['user'], config['warehouse']],
+                                        config['password'])
+    return connection_pool.pool_key(['sqlserver', config['host'], config['port'], config['user'], config['database']],
+                                    config['password'])
+
+
+def acquire_connection(config: Dict[str, Any]) -> Tuple[Any, Any, Dict[str, Any]]:
+    """
+    Pooled connection plus a fresh cursor for one side
+    Snowflake sessions are shared by concurrent users with the same pool key (both sides of a
+    Snowflake-to-Snowflake comparison, parallel range fetches); SQL Server connections are not.
+    Returns: (connection, cursor, {'connection': 'hit'/'shared'/'miss', 'connectSeconds'})
+    """
+    def connect():
+        conn, cursor = connect_side(config)
+        close_connection(None, cursor)
+        return conn
+    
+    check_cancelled()
+    key = side_pool_key(config)
+    conn, info = connection_pool.acquire(key, connect, shareable=config['dbType'] == 'snowflake')
+    try:
+        cursor = conn.cursor()
+    except Exception:
+        connection_pool.release(key, conn, broken=True)
+        raise
+    with ACTIVE_CONNECTIONS_LOCK:
+        ACTIVE_CONNECTIONS[id(conn)] = (config, conn)
+    return conn, cursor, info
+
+
+def release_connection(config: Dict[str, Any], conn: Any, cursor: Any) -> None:
+    """
+    Close the cursor and return the connection to the pool; one that cannot roll back, or that
+    served a cancelled job, is dropped
+    """
+    with ACTIVE_CONNECTIONS_LOCK:
+        ACTIVE_CONNECTIONS.pop(id(conn), None)
+    close_connection(None, cursor)
+    broken = cancelled()
+    if config['dbType'] == 'sqlserver' and not broken:
+        # pymssql runs without autocommit; end the read transaction before the connection is reused
+        try:
+            conn.rollback()
+        except Exception:
+            broken = True
+    connection_pool.release(side_pool_key(config), conn, broken)
+
+
+def abort_active_queries() -> None:
+    """
+    Cancel the queries running on this worker's connections (called when the job is cancelled)
+    Snowflake cancels every query of the session; pymssql sends the query an attention signal.
+    """
+    with ACTIVE_CONNECTIONS_LOCK:
+        active = list(ACTIVE_CONNECTIONS.values())
+    for config, conn in active:
+        try:
+            if config['dbType'] == 'snowflake':
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(f"SELECT SYSTEM$CANCEL_ALL_QUERIES({int(conn.session_id)})")
+                finally:
+                    cursor.close()
+            else:
+                conn.cancel()
+        except Exception as e:
+            print(f"Failed to cancel query on database {config['side']}: {str(e)}", file=sys.stderr)
+
+
+def progress(phase: str, **details: Any) -> None:
+    """
+    Report a comparison phase to the server (connected, fetched, comparing, report, ...)
+    Also the point where a cancelled job stops between phases.
+    """
+    check_cancelled()
+    emit({'phase': phase, **details})
+
+
+def query_side(cursor: Any, config: Dict[str, Any], columns: Optional[str] = None,
+               filter_clause: Optional[str] = None, normalize: Optional[bool] = None,
+               report: Optional[List[Dict[str, Any]]] = None) -> pd.DataFrame:
+    """
+    Fetch the configured table for one side of the comparison
+    columns/filter_clause override the user's settings for multi-step comparison modes;
+    normalize defaults to the side's normalizeDtypes setting
+    """
+    columns = columns if columns is not None else config['columns']
+    filter_clause = filter_clause if filter_clause is not None else config['filter']
+    normalize = config['normalizeDtypes'] if normalize is None else normalize
+    if config['dbType'] == 'snowflake':
+        return query_snowflake(cursor, config['database'], config['schema'], config['table'],
+                               columns, filter_clause, normalize, report)
+    return query_sqlserver(cursor, config['database'], config['schema'], config['table'],
+                           columns, filter_clause, config['fetchBatchSize'], normalize, report)
+
+
+def query_side_arrow(cursor: Any, config: Dict[str, Any], columns: Optional[str] = None,
+                     filter_clause: Optional[str] = None) -> pa.Table:
+    """query_side for the columnar engines, returning an Arrow table"""
+    columns = columns if columns is not None else config['columns']
+    filter_clause = filter_clause if filter_clause is not None else config['filter']
+    if config['dbType'] == 'snowflake':
+        return query_snowflake_arrow(cursor, config['database'], config['schema'], config['table'],
+                                     columns, filter_clause)
+    return query_sqlserver_arrow(cursor, config['database'], config['schema'], config['table'],
+                                 columns, filter_clause, config['fetchBatchSize'])
+
+
+def iter_side_chunks(cursor: Any, config: Dict[str, Any], columns: Optional[str] = None,
+                     filter_clause: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """Stream the configured table for one side as DataFrame chunks"""
+    columns = columns if columns is not None else config['columns']
+    filter_clause = filter_clause if filter_clause is not None else config['filter']
+    if config['dbType'] == 'snowflake':
+        yield from iter_snowflake_chunks(cursor, config['database'], config['schema'], config['table'],
+                                         columns, filter_clause)
+        return
+    yield from iter_sqlserver_chunks(cursor, config['database'], config['schema'], config['table'],
+                                     columns, filter_clause, config['fetchBatchSize'])
+
+
+def close_connection(conn: Any, cursor: Any) -> None:
+    """Close a cursor and its connection, ignoring errors during cleanup"""
+    for resource in (cursor, conn):
+        if resource is None:
+            continue
+        try:
+            resource.close()
+        except Exception as e:
+            print(f"Failed to close database resource: {str(e)}", file=sys.stderr)
+
+
+def side_snapshot_key(config: Dict[str, Any]) -> str:
+    """
+    Snapshot cache key: connection identity (user and a password digest, so a snapshot is only
+    served to the credentials that fetched it), table, column list, filter, and the stored form
+    (raw Arrow for the columnar engines, or a pandas frame with or without normalization)
+    """
+    stored_form = 'arrow' if config['engine'] in ARROW_ENGINES else f"pandas:{config['normalizeDtypes']}"
+    return snapshot_cache.snapshot_key([
+        *connection_pool.pool_key([*metadata_cache_key(config), config.get('user')], config.get('password')),
+        config['columns'].strip(), config['filter'].strip(), stored_form,
+    ])
+
+
+def table_fingerprint(session: Dict[str, Any]) -> Optional[List[Any]]:
+    """
+    Cheap change marker for the whole table: [row count, last altered]
+    Snowflake reads INFORMATION_SCHEMA.TABLES; SQL Server reads partition row counts and the
+    last user update from sys.dm_db_index_usage_stats (needs VIEW SERVER STATE).
+    Returns None when the metadata cannot be read.
+    """
+    config = session['config']
+    try:
+        if config['dbType'] == 'snowflake':
+            session['cursor'].execute(
+                f"SELECT ROW_COUNT, LAST_ALTERED FROM {config['database']}.INFORMATION_SCHEMA.TABLES "
+                f"WHERE UPPER(TABLE_SCHEMA) = UPPER(%s) AND UPPER(TABLE_NAME) = UPPER(%s)",
+                (config['schema'], config['table'])
+            )
         else:  # sqlserver
-            host = request_data.get('sqlserver2Host')
-            port = request_data.get('sqlserver2Port', 1433)
-            user = request_data.get('sqlserver2User')
-            password = request_data.get('sqlserver2Password')
-            
-            conn2, cursor2 = connect_sqlserver(host, user, password, database2, port)
-            df2 = query_sqlserver(cursor2, database2, schema2, table2, columns2, filter2)
-        
-        # Build primary keys (normalize to lowercase)
-        join_columns = build_primary_keys(
-            primary_key1.lower() if primary_key1 else '',
-            primary_key2.lower() if primary_key2 else '',
-            primary_key3.lower() if primary_key3 else '',
-            primary_key4.lower() if primary_key4 else ''
-        )
-        
-        # Perform comparison using datacompy
-        compare = datacompy.Compare(
-            df1,
-            df2,
-            join_columns=join_columns,
-            df1_name='Database_1',
-            df2_name='Database_2'
-        )
-        
-        # Get comparison report
-        report = compare.report()
-        
-        # Extract summary statistics (convert to native Python ints)
-        summary = {
-            'totalRows1': int(len(df1)),
-            'totalRows2': int(len(df2)),
-            'matchingRows': int(len(compare.intersect_rows)),
-            'mismatchedRows': int(len(compare.intersect_rows) - compare.count_matching_rows()),
-            'onlyInDatabase1': int(len(compare.df1_unq_rows)),
-            'onlyInDatabase2': int(len(compare.df2_unq_rows)),
-            'columnsCompared': int(len(compare.intersect_columns())),
-        }
-        
-        # Extract structured difference data
-        # Rows only in Database 1
-        only_in_db1 = []
-        if not compare.df1_unq_rows.empty:
-            raw_data = compare.df1_unq_rows.head(100).to_dict('records')
-            only_in_db1 = convert_to_json_serializable(raw_data)
-        
-        # Rows only in Database 2
-        only_in_db2 = []
-        if not compare.df2_unq_rows.empty:
-            raw_data = compare.df2_unq_rows.head(100).to_dict('records')
-            only_in_db2 = convert_to_json_serializable(raw_data)
-        
-        # Mismatched rows - get sample of rows with differences
-        mismatched_rows = []
-        if compare.count_matching_rows() < len(compare.intersect_rows):
-            # Get rows that intersect but don't match
-            try:
-                # Get sample of all columns that differ
-                all_mismatch = compare.all_mismatch()
-                if not all_mismatch.empty:
-                    raw_data = all_mismatch.head(100).to_dict('records')
-                    mismatched_rows = convert_to_json_serializable(raw_data)
-            except:
-                # Fallback if all_mismatch fails
-                pass
+            session['cursor'].execute(
+                f"SELECT (SELECT SUM(p.rows) FROM sys.partitions p "
+                f"WHERE p.object_id = t.object_id AND p.index_id IN (0, 1)) AS ROW_COUNT, "
+                f"(SELECT MAX(u.last_user_update) FROM sys.dm_db_index_usage_stats u "
+                f"WHERE u.database_id = DB_ID() AND u.object_id = t.object_id) AS LAST_ALTERED "
+                f"FROM sys.tables t JOIN sys.schemas s ON s.schema_id = t.schema_id "
+                f"WHERE s.name = %s AND t.name = %s",
+                (config['schema'], config['table'])
+            )
+        row = session['cursor'].fetchone()
+    except Exception as e:
+        print(f"Table fingerprint unavailable: {str(e)}", file=sys.stderr)
+        return None
+    
+    if row is None or row[1] is None:
+        return None
+    return [int(row[0] or 0), str(row[1])]
+
+
+def checksum_fingerprint(session: Dict[str, Any]) -> Optional[List[Any]]:
+    """
+    Change marker computed in the database when the metadata has none: [row count, row hash sum]
+    over every column of the filtered table. Returns None when the query fails.
+    """
+    config = session['config']
+    db_type = config['dbType']
+    try:
+        canonical = [canonical_expression(db_type, name, data_type) for name, data_type in describe_side(config)]
+        row = execute_query(
+            session['cursor'], db_type,
+            f"SELECT COUNT(*) AS ROW_COUNT, "
+            f"{hash_sum_expression(db_type, row_hash_number_expression(db_type, canonical))} AS ROW_HASH "
+            f"FROM {table_reference(config)} {config['filter']}"
+        ).iloc[0]
+    except Exception as e:
+        print(f"Table checksum unavailable: {str(e)}", file=sys.stderr)
+        return None
+    return [int(row['row_count']), str(row['row_hash'])]
+
+
+def result_fingerprint(config: Dict[str, Any], checksum: bool = False) -> Optional[List[Any]]:
+    """
+    Fingerprint of one side for the result cache: table_fingerprint, else (with checksum, as it
+    scans the whole table) checksum_fingerprint
+    Connecting also checks the request's credentials before a cached result is handed out.
+    """
+    session = open_session(config)
+    try:
+        fingerprint = table_fingerprint(session)
+        if fingerprint is None and checksum:
+            fingerprint = checksum_fingerprint(session)
+        return fingerprint
+    finally:
+        close_session(session)
+
+
+def fetch_side(config: Dict[str, Any]) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Connect to one database and fetch its table
+    With parallelFetch > 1 the read is split into key ranges fetched over that many connections.
+    With snapshotCache a live snapshot of the same fetch is loaded instead; validateSnapshot
+    first checks it against the table fingerprint.
+    The columnar engines get an Arrow table instead of a DataFrame.
+    Returns: (DataFrame or Arrow table, timings) - the connections are always closed before returning
+    """
+    arrow = config['engine'] in ARROW_ENGINES
+    query = query_side_arrow if arrow else query_side
+    snapshot_key = side_snapshot_key(config) if config['snapshotCache'] else None
+    snapshot = snapshot_cache.lookup(snapshot_key, config['snapshotTtlSeconds']) if snapshot_key else None
+    if snapshot is not None and not config['validateSnapshot']:
+        return load_side_snapshot(snapshot_key, {}, arrow)
+    
+    session = open_session(config)
+    timings = session['timings']
+    start = time.perf_counter()
+    try:
+        fingerprint = None
+        if snapshot_key and config['validateSnapshot']:
+            fingerprint = table_fingerprint(session)
+            if snapshot is not None and fingerprint is not None and snapshot['fingerprint'] == fingerprint:
+                return load_side_snapshot(snapshot_key, timings, arrow)
+        if snapshot_key:
+            timings['snapshot'] = 'stale' if snapshot is not None else 'miss'
         
-        # Generate timestamp
-        timestamp = datetime.datetime.now().isoformat()
+        report: List[Dict[str, Any]] = []
+        if config['parallelFetch'] > 1:
+            filters = parallel_fetch_filters(session)
+            if arrow:
+                tables = run_parallel_ranges(
+                    session, filters, lambda cursor, filter_clause, _: query(cursor, config, filter_clause=filter_clause)
+                )
+                df = concat_arrow_tables(tables)
+            else:
+                # Normalized once after the concat, so categoricals share one set of categories
+                frames = run_parallel_ranges(
+                    session, filters,
+                    lambda cursor, filter_clause, _: query(cursor, config, filter_clause=filter_clause, normalize=False)
+                )
+                df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+                if config['normalizeDtypes']:
+                    df = normalize_frame(df, report)
+            timings['connections'] = len(filters)
+        elif arrow:
+            df = query(session['cursor'], config)
+        else:
+            df = query(session['cursor'], config, report=report)
         
-        # Build database info strings with type labels
-        db1_info = f"{db1_type.upper()}: {database1}.{schema1}.{table1}"
-        db2_info = f"{db2_type.upper()}: {database2}.{schema2}.{table2}"
+        normalization = normalization_summary(report)
+        if normalization:
+            timings['normalization'] = normalization
         
-        # Send email if requested
-        email_sent = False
-        if send_email_flag and email_address:
-            subject = f"TableMigrationCheck Results: {db1_info} vs {db2_info} - {timestamp}"
-            email_sent = send_email(email_address, subject, report)
+        fetch_seconds = time.perf_counter() - start
+        timings['fetchSeconds'] = round(fetch_seconds, 3)
+        timings['rows'] = int(len(df))
+        timings['rowsPerSecond'] = int(len(df) / fetch_seconds) if fetch_seconds > 0 else None
+        timings['peakRssMb'] = peak_rss_mb()
+        progress('fetched', side=config['side'], rows=timings['rows'], seconds=timings['fetchSeconds'])
         
-        # Close connections
-        cursor1.close()
-        cursor2.close()
-        conn1.close()
-        conn2.close()
+        if snapshot_key:
+            snapshot_cache.store(snapshot_key, df, fingerprint)
+        return df, timings
+    except Exception as e:
+        raise Exception(f"Database {config['side']} ({config['dbType']}): {str(e)}")
+    finally:
+        close_session(session)
+
+
+def load_side_snapshot(snapshot_key: str, timings: Dict[str, Any],
+                       arrow: bool = False) -> Tuple[Any, Dict[str, Any]]:
+    """Load a cached snapshot in place of fetching, recording the load in the side's timings"""
+    start = time.perf_counter()
+    df = snapshot_cache.load_table(snapshot_key) if arrow else snapshot_cache.load(snapshot_key)
+    timings['snapshot'] = 'hit'
+    timings['fetchSeconds'] = round(time.perf_counter() - start, 3)
+    timings['rows'] = int(len(df))
+    return df, timings
+
+
+def run_on_both_sides(func, config1: Any, config2: Any) -> Tuple[Any, Any]:
+    """
+    Run func(config) for both sides concurrently
+    Both drivers release the GIL during network I/O, so threads overlap the two fetches.
+    Each side handles its own cleanup; the first error is raised once both have finished.
+    """
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        future1 = executor.submit(func, config1)
+        future2 = executor.submit(func, config2)
+        wait([future1, future2])
+    
+    return future1.result(), future2.result()
+
+
+def open_session(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Take a pooled connection for one side and keep it for multi-step comparison modes
+    Returns: {'config', 'conn', 'cursor', 'timings'}; timings say whether the pool had a connection
+    """
+    try:
+        conn, cursor, timings = acquire_connection(config)
+    except Exception as e:
+        raise Exception(f"Database {config['side']} ({config['dbType']}): {str(e)}")
+    
+    emit({'phase': 'connected', 'side': config['side'], 'connection': timings['connection']})
+    return {
+        'config': config,
+        'conn': conn,
+        'cursor': cursor,
+        'timings': timings,
+    }
+
+
+def close_session(session: Dict[str, Any]) -> None:
+    """Return a session's connection to the pool"""
+    release_connection(session['config'], session['conn'], session['cursor'])
+
+
+def open_sessions(config1: Dict[str, Any], config2: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Open both sides concurrently; if either side fails, the other is closed again"""
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(open_session, config) for config in (config1, config2)]
+    
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    if errors:
+        for future in futures:
+            if future.exception() is None:
+                close_session(future.result())
+        raise errors[0]
+    
+    return futures[0].result(), futures[1].result()
+
+
+def as_column_list(join_columns: List[str] | str) -> List[str]:
+    """Join columns as a list, whether build_primary_keys returned one key or several"""
+    return [join_columns] if isinstance(join_columns, str) else list(join_columns)
+
+
+def integer_key_values(series: pd.Series) -> Optional[pd.Series]:
+    """
+    Key values as exact nullable Int64 when every value is a whole number, else None
+    Floats only qualify below 2**53, where they are still exact.
+    """
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return None
+    if pd.api.types.is_integer_dtype(series.dtype):
+        return series.astype('Int64')
+    if pd.api.types.is_float_dtype(series.dtype):
+        values = series.dropna()
+        if ((values % 1 == 0) & (values.abs() < 2 ** 53)).all():
+            return series.astype('Int64')
+        return None
+    if series.dtype != object:
+        return None
+    
+    values = []
+    for value in series:
+        if value is None or value is pd.NA or (isinstance(value, float) and math.isnan(value)):
+            values.append(pd.NA)
+        elif isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_)):
+            values.append(int(value))
+        elif isinstance(value, decimal.Decimal) and value.is_finite() and value == value.to_integral_value():
+            values.append(int(value))
+        else:
+            return None
+    try:
+        return pd.Series(values, index=series.index, dtype='Int64')
+    except (OverflowError, TypeError, ValueError):
+        return None
+
+
+def align_key_dtypes(df1: pd.DataFrame, df2: pd.DataFrame, key_columns: List[str]) -> None:
+    """
+    Give the join columns the same dtype on both sides (in place)
+    Cross-engine fetches often disagree (e.g. Decimal objects vs int64), which breaks merges.
+    Whole-number keys become exact Int64 rather than float, so keys above 2**53 keep their value
+    (and the literals key_predicate builds from them stay right).
+    """
+    for key in key_columns:
+        if df1[key].dtype == df2[key].dtype:
+            continue
         
-        # Return results
-        return {
-            'timestamp': timestamp,
-            'database1Info': db1_info,
-            'database2Info': db2_info,
-            'summary': summary,
-            'fullReport': report,
-            'onlyInDatabase1': only_in_db1,
-            'onlyInDatabase2': only_in_db2,
-            'mismatchedRows': mismatched_rows,
-            'emailSent': email_sent
-        }
+        integers1 = integer_key_values(df1[key])
+        integers2 = integer_key_values(df2[key])
+        if integers1 is not None and integers2 is not None:
+            df1[key] = integers1
+            df2[key] = integers2
+            continue
         
-    except Exception as e:
-        raise Exception(f"Comparison failed: {str(e)}")
+        numeric1 = pd.to_numeric(df1[key], errors='coerce')
+        numeric2 = pd.to_numeric(df2[key], errors='coerce')
+        lost1 = (numeric1.isna() & df1[key].notna()).any()
+        lost2 = (numeric2.isna() & df2[key].notna()).any()
+        if not lost1 and not lost2:
+            df1[key] = numeric1
+            df2[key] = numeric2
+        else:
+            df1[key] = df1[key].astype(str)
+            df2[key] = df2[key].astype(str)
 
 
-def main():
-    """Main function to handle command line execution"""
+def column_values(series: pd.Series) -> List[Any]:
+    """
+    One column as JSON-serializable Python values, converted in a single vectorized pass
+    Timestamps become ISO strings, NaN/NaT/NA become None; only object columns fall back
+    to convert_to_json_serializable per value.
+    """
+    missing = series.isna().to_numpy()
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        if getattr(series.dt, 'tz', None) is not None:
+            text = np.datetime_as_string(series.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy(), unit='us')
+            values = np.char.add(text.astype(str), '+00:00').astype(object)
+        else:
+            values = np.datetime_as_string(series.to_numpy(), unit='us').astype(object)
+    elif pd.api.types.is_timedelta64_dtype(series.dtype):
+        values = series.astype(str).to_numpy(dtype=object)
+    elif series.dtype == object:
+        values = series.to_numpy(dtype=object).copy()
+        inferred = pd.api.types.infer_dtype(series, skipna=True)
+        if inferred == 'decimal':
+            values[~missing] = [float(value) for value in values[~missing]]
+        elif inferred not in ('string', 'empty'):
+            values = np.array([convert_to_json_serializable(value) for value in values], dtype=object)
+    else:
+        # numpy ints/floats/bools and pandas nullable types become native Python scalars
+        values = series.to_numpy(dtype=object)
+        if not missing.any():
+            return series.to_numpy().tolist() if series.dtype.kind in 'iufb' else values.tolist()
+    
+    if missing.any():
+        values[missing] = None
+    return values.tolist()
+
+
+def frame_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """JSON-serializable records built column by column"""
+    columns = [str(col) for col in df.columns]
+    values = [column_values(df.iloc[:, i]) for i in range(df.shape[1])]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def frame_sample(df: Any, sample_rows: int = SAMPLE_ROWS) -> List[Dict[str, Any]]:
+    """First sample_rows rows of a pandas or Polars frame as JSON-serializable records"""
+    if df is None or len(df) == 0 or sample_rows <= 0:
+        return []
+    sample = df.head(sample_rows)
+    if not isinstance(sample, pd.DataFrame):
+        sample = sample.to_pandas()
+    return frame_records(sample)
+
+
+def columnar_rows(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Records as {'columns': [...], 'rows': [[...], ...]}, naming each column once"""
+    columns = list(dict.fromkeys(col for record in records for col in record))
+    return {
+        'columns': columns,
+        'rows': [[record.get(col) for col in columns] for record in records],
+    }
+
+
+def summarize_compare(compare: Any, sample_rows: int = SAMPLE_ROWS) -> Dict[str, Any]:
+    """Extract summary counts and sample difference rows from a datacompy comparison"""
+    # The native engine builds intersect_rows only on request
+    if isinstance(compare, NativeCompare):
+        intersect_count = compare.common_row_count()
+    else:
+        intersect_count = len(compare.intersect_rows)
+    matching_count = compare.count_matching_rows()
+    
+    # Extract summary statistics (convert to native Python ints)
+    summary = {
+        'totalRows1': int(len(compare.df1)),
+        'totalRows2': int(len(compare.df2)),
+        'matchingRows': int(intersect_count),
+        'mismatchedRows': int(intersect_count - matching_count),
+        'onlyInDatabase1': int(len(compare.df1_unq_rows)),
+        'onlyInDatabase2': int(len(compare.df2_unq_rows)),
+        'columnsCompared': int(len(compare.intersect_columns())),
+    }
+    
+    # Mismatched rows - get sample of rows with differences
+    mismatched_rows = []
+    if matching_count < intersect_count:
+        try:
+            mismatched_rows = frame_sample(compare.all_mismatch(), sample_rows)
+        except Exception:
+            # Fallback if all_mismatch fails
+            pass
+    
+    return {
+        'summary': summary,
+        'onlyInDatabase1': frame_sample(compare.df1_unq_rows, sample_rows),
+        'onlyInDatabase2': frame_sample(compare.df2_unq_rows, sample_rows),
+        'mismatchedRows': mismatched_rows,
+    }
+
+
+def summarize_compare_empty() -> Dict[str, Any]:
+    """summarize_compare output for a comparison that had no rows to compare"""
+    return {
+        'summary': {
+            'totalRows1': 0,
+            'totalRows2': 0,
+            'matchingRows': 0,
+            'mismatchedRows': 0,
+            'onlyInDatabase1': 0,
+            'onlyInDatabase2': 0,
+            'columnsCompared': 0,
+        },
+        'onlyInDatabase1': [],
+        'onlyInDatabase2': [],
+        'mismatchedRows': [],
+    }
+
+
+def deferred_report(parts: List[Any], separator: str = '\n') -> Callable[[], str]:
+    """
+    Report text built only when needed
+    parts are strings or zero-argument callables such as a datacompy comparison's report method
+    """
+    return lambda: separator.join(part() if callable(part) else part for part in parts)
+
+
+# Row comparison engines, all with datacompy.Compare's interface: datacompy itself, the mask-based
+# NativeCompare, and the multi-core columnar engines (which take Arrow tables straight from the fetch)
+COMPARE_ENGINES = {
+    'datacompy': datacompy.Compare,
+    'native': NativeCompare,
+    'polars': polars_compare,
+    'duckdb': DuckDBCompare,
+}
+ARROW_ENGINES = {'polars', 'duckdb'}
+
+
+def run_datacompy(df1: pd.DataFrame, df2: pd.DataFrame, join_columns: List[str] | str,
+                  engine: str = 'datacompy', **options: Any) -> Any:
+    """Run the comparison engine with the database labels used throughout the report"""
+    progress('comparing', engine=engine, rows1=len(df1), rows2=len(df2))
+    return COMPARE_ENGINES[engine](
+        df1,
+        df2,
+        join_columns=join_columns,
+        df1_name='Database_1',
+        df2_name='Database_2',
+        **options
+    )
+
+
+def column_worker_options(request_data: Dict[str, Any], engine: str) -> Dict[str, Any]:
+    """Process-pool column comparison settings; only the native engine splits work by column"""
+    workers = max(1, int(request_data.get('columnWorkers') or 1))
+    if workers == 1:
+        return {}
+    if engine != 'native':
+        print(f"columnWorkers only applies to the native engine; ignored for '{engine}'", file=sys.stderr)
+        return {}
+    chunk_size = request_data.get('columnChunkSize')
+    return {'column_workers': workers, 'column_chunk_size': int(chunk_size) if chunk_size else None}
+
+
+def compare_full(config1: Dict[str, Any], config2: Dict[str, Any],
+                 join_columns: List[str] | str, request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Fetch both tables completely and compare them with datacompy"""
+    # Connect to and fetch both databases concurrently
+    fetch_start = time.perf_counter()
+    (df1, timings1), (df2, timings2) = run_on_both_sides(fetch_side, config1, config2)
+    timings = {
+        'database1': timings1,
+        'database2': timings2,
+        'fetchSeconds': round(time.perf_counter() - fetch_start, 3),
+    }
+    
+    # Perform comparison using datacompy
+    compare_start = time.perf_counter()
+    compare = run_datacompy(df1, df2, join_columns, config1['engine'],
+                            **column_worker_options(request_data, config1['engine']))
+    outcome = summarize_compare(compare, config1['sampleRows'])
+    outcome['fullReport'] = compare.report
+    timings['compareSeconds'] = round(time.perf_counter() - compare_start, 3)
+    
+    outcome['timings'] = timings
+    return outcome
+
+
+# Source type families used to cast values to a canonical text form before hashing
+NUMERIC_TYPES = {
+    'number', 'decimal', 'numeric', 'int', 'integer', 'bigint', 'smallint', 'tinyint', 'byteint',
+    'float', 'float4', 'float8', 'double', 'double precision', 'real', 'money', 'smallmoney',
+}
+BOOLEAN_TYPES = {'boolean', 'bit'}
+DATETIME_TYPES = {'date', 'datetime', 'datetime2', 'smalldatetime', 'timestamp', 'timestamp_ntz'}
+ZONED_DATETIME_TYPES = {'timestamp_ltz', 'timestamp_tz', 'datetimeoffset'}
+NULL_TOKEN = '<NULL>'
+
+
+# A column list item that names a column: bare, "quoted" (Snowflake) or [bracketed] (SQL Server)
+PLAIN_COLUMN = re.compile(r'^(?:[A-Za-z_][A-Za-z0-9_$#@]*|"(?:[^"]|"")+"|\[(?:[^\]]|\]\])+\])$')
+
+
+def quote_identifier(db_type: str, name: str) -> str:
+    """Quote a column name exactly as stored in the database"""
+    if db_type == 'snowflake':
+        return '"' + name.replace('"', '""') + '"'
+    return '[' + name.replace(']', ']]') + ']'
+
+
+def metadata_cache_key(config: Dict[str, Any]) -> Tuple[str, ...]:
+    """Identify a table across requests: engine, server, database, schema and table"""
+    server = config.get('account') if config['dbType'] == 'snowflake' else f"{config.get('host')}:{config.get('port')}"
+    return (config['dbType'], str(server).lower(), config['database'].lower(),
+            config['schema'].lower(), config['table'].lower())
+
+
+def describe_columns(cursor: Any, config: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """
+    Look up the table's columns in INFORMATION_SCHEMA (cached per table for the worker's lifetime)
+    Returns: [(column name as stored, lowercase data type), ...] in ordinal order
+    """
+    cache_key = metadata_cache_key(config)
+    if cache_key in COLUMN_METADATA_CACHE:
+        return COLUMN_METADATA_CACHE[cache_key]
+    
+    if config['dbType'] == 'snowflake':
+        cursor.execute(
+            f"SELECT COLUMN_NAME, DATA_TYPE FROM {config['database']}.INFORMATION_SCHEMA.COLUMNS "
+            f"WHERE UPPER(TABLE_SCHEMA) = UPPER(%s) AND UPPER(TABLE_NAME) = UPPER(%s) "
+            f"ORDER BY ORDINAL_POSITION",
+            (config['schema'], config['table'])
+        )
+    else:  # sqlserver
+        cursor.execute(
+            f"SELECT COLUMN_NAME, DATA_TYPE FROM [{config['database']}].INFORMATION_SCHEMA.COLUMNS "
+            f"WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s "
+            f"ORDER BY ORDINAL_POSITION",
+            (config['schema'], config['table'])
+        )
+    
+    rows = cursor.fetchall()
+    if not rows:
+        raise ValueError(f"No columns found for {config['database']}.{config['schema']}.{config['table']}")
+    
+    columns = [(str(name), str(data_type).lower()) for name, data_type in rows]
+    COLUMN_METADATA_CACHE[cache_key] = columns
+    return columns
+
+
+def plain_column_list(config: Dict[str, Any]) -> bool:
+    """True when the user's column list is '*' or only plain, optionally quoted column names"""
+    columns = config['columns'].strip()
+    return columns == '*' or all(PLAIN_COLUMN.match(col.strip()) for col in columns.split(','))
+
+
+def requested_columns(config: Dict[str, Any]) -> Optional[List[str]]:
+    """
+    Lowercase column names from the user's column list, or None for '*'
+    Raises ValueError when the list holds expressions or aliases, which cannot be matched to
+    the table's columns.
+    """
+    columns = config['columns'].strip()
+    if columns == '*':
+        return None
+    if not plain_column_list(config):
+        raise ValueError(f"Database {config['side']}: this comparison needs plain column names in the "
+                         f"column list, not expressions or aliases ({columns})")
+    return [col.strip().strip('"[]').lower() for col in columns.split(',')]
+
+
+def resolve_compare_columns(meta1: List[Tuple[str, str]], meta2: List[Tuple[str, str]],
+                            config1: Dict[str, Any], config2: Dict[str, Any],
+                            key_columns: List[str]) -> List[Dict[str, str]]:
+    """
+    Match columns present on both sides (case-insensitive), keeping the join columns
+    Returns: [{'name', 'column1', 'type1', 'column2', 'type2'}, ...]
+    """
+    lookup1 = {name.lower(): (name, data_type) for name, data_type in meta1}
+    lookup2 = {name.lower(): (name, data_type) for name, data_type in meta2}
+    
+    for key in key_columns:
+        if key not in lookup1 or key not in lookup2:
+            raise ValueError(f"Primary key column '{key}' must exist in both tables")
+    
+    names = [name for name in lookup1 if name in lookup2]
+    for config in (config1, config2):
+        requested = requested_columns(config)
+        if requested is not None:
+            names = [name for name in names if name in requested or name in key_columns]
+    
+    return [
+        {
+            'name': name,
+            'column1': lookup1[name][0],
+            'type1': lookup1[name][1],
+            'column2': lookup2[name][0],
+            'type2': lookup2[name][1],
+        }
+        for name in names
+    ]
+
+
+def describe_side(config: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """describe_columns for one side, connecting only when the table is not cached yet"""
+    cache_key = metadata_cache_key(config)
+    if cache_key in COLUMN_METADATA_CACHE:
+        return COLUMN_METADATA_CACHE[cache_key]
+    
+    session = open_session(config)
+    try:
+        return describe_columns(session['cursor'], config)
+    finally:
+        close_session(session)
+
+
+def project_columns(config1: Dict[str, Any], config2: Dict[str, Any],
+                    key_columns: List[str]) -> Dict[str, List[str]]:
+    """
+    Replace each side's column list with the columns both tables share (plus the join columns)
+    so columns datacompy would ignore are never fetched (in place)
+    A column list with expressions or aliases is fetched exactly as written instead.
+    Returns: {'database1': [...], 'database2': [...]} columns left out on each side
+    """
+    if not (plain_column_list(config1) and plain_column_list(config2)):
+        print("Column lists with expressions are fetched as written, without projection", file=sys.stderr)
+        return {'database1': [], 'database2': []}
+    
+    meta1, meta2 = run_on_both_sides(describe_side, config1, config2)
+    columns = resolve_compare_columns(meta1, meta2, config1, config2, key_columns)
+    
+    dropped = {}
+    for config, meta in ((config1, meta1), (config2, meta2)):
+        side = config['side']
+        kept = {col[f'column{side}'] for col in columns}
+        dropped[f'database{side}'] = [name for name, _ in meta if name not in kept]
+        config['columns'] = ', '.join(quote_identifier(config['dbType'], col[f'column{side}']) for col in columns)
+    return dropped
+
+
+def dropped_columns_report(dropped: Dict[str, List[str]]) -> str:
+    """Report section listing the columns left out of the comparison"""
+    title = 'Columns Not Compared'
+    lines = ['', '', title, '-' * len(title)]
+    for side in ('database1', 'database2'):
+        names = ', '.join(dropped[side]) if dropped[side] else '(none)'
+        lines.append(f"Database_{side[-1]}: {names}")
+    return '\n'.join(lines)
+
+
+def canonical_expression(db_type: str, column: str, data_type: str) -> str:
+    """
+    SQL expression rendering a column as canonical text, so Snowflake and SQL Server agree
+    Numbers as DECIMAL(38, 10), timestamps as 'YYYY-MM-DD HH:MI:SS.ffffff' (UTC for zoned types),
+    booleans as '1'/'0' and NULL as a fixed token. Text is hashed as single-byte VARCHAR on
+    SQL Server, so non-ASCII text only matches when the column collation is UTF-8.
+    """
+    col = quote_identifier(db_type, column)
+    if db_type == 'snowflake':
+        if data_type in NUMERIC_TYPES:
+            expr = f"TO_VARCHAR(CAST({col} AS NUMBER(38, 10)))"
+        elif data_type in BOOLEAN_TYPES:
+            # IFF alone maps NULL to '0'; keep it NULL as SQL Server does
+            expr = f"IFF({col} IS NULL, NULL, IFF({col}, '1', '0'))"
+        elif data_type in ZONED_DATETIME_TYPES:
+            expr = f"TO_VARCHAR(CONVERT_TIMEZONE('UTC', {col})::TIMESTAMP_NTZ, 'YYYY-MM-DD HH24:MI:SS.FF6')"
+        elif data_type in DATETIME_TYPES:
+            expr = f"TO_VARCHAR(CAST({col} AS TIMESTAMP_NTZ), 'YYYY-MM-DD HH24:MI:SS.FF6')"
+        else:
+            expr = f"CAST({col} AS VARCHAR)"
+    else:  # sqlserver
+        if data_type in NUMERIC_TYPES:
+            expr = f"CAST(CAST({col} AS DECIMAL(38, 10)) AS VARCHAR(64))"
+        elif data_type in BOOLEAN_TYPES:
+            expr = f"CAST({col} AS VARCHAR(1))"
+        elif data_type in ZONED_DATETIME_TYPES:
+            expr = f"CONVERT(VARCHAR(26), CAST(SWITCHOFFSET({col}, '+00:00') AS DATETIME2(6)), 121)"
+        elif data_type in DATETIME_TYPES:
+            expr = f"CONVERT(VARCHAR(26), CAST({col} AS DATETIME2(6)), 121)"
+        else:
+            expr = f"CAST({col} AS VARCHAR(MAX))"
+    
+    return f"COALESCE({expr}, '{NULL_TOKEN}')"
+
+
+def row_hash_expression(db_type: str, expressions: List[str]) -> str:
+    """SQL expression for the lowercase hex MD5 of the '|'-joined canonical column values"""
+    joined = expressions[0] if len(expressions) == 1 else f"CONCAT_WS('|', {', '.join(expressions)})"
+    if db_type == 'snowflake':
+        return f"MD5({joined})"
+    return f"LOWER(CONVERT(VARCHAR(32), HASHBYTES('MD5', {joined}), 2))"
+
+
+def side_columns(session: Dict[str, Any], columns: List[Dict[str, str]]) -> List[Tuple[str, str]]:
+    """(column name as stored, data type) for this session's side of the resolved columns"""
+    side = session['config']['side']
+    return [(col[f'column{side}'], col[f'type{side}']) for col in columns]
+
+
+def sql_literal(value: Any) -> str:
+    """Render a fetched key value as a SQL literal"""
+    if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NaT or value is pd.NA:
+        return 'NULL'
+    if isinstance(value, (bool, np.bool_)):
+        return '1' if value else '0'
+    if isinstance(value, (int, float, decimal.Decimal, np.integer, np.floating)):
+        return str(value)
+    if isinstance(value, (pd.Timestamp, datetime.datetime)):
+        return f"'{value.isoformat(sep=' ')}'"
+    if isinstance(value, datetime.date):
+        return f"'{value.isoformat()}'"
+    
+    text = str(value).replace("'", "''")
+    return f"'{text}'"
+
+
+def key_predicate(db_type: str, key_columns: List[str], keys: pd.DataFrame) -> str:
+    """WHERE predicate matching exactly the given key rows (NULL keys through IS NULL)"""
+    quoted = [quote_identifier(db_type, col) for col in key_columns]
+    if len(quoted) == 1:
+        literals = [sql_literal(value) for value in keys.iloc[:, 0]]
+        values = [literal for literal in literals if literal != 'NULL']
+        clauses = [f"{quoted[0]} IN ({', '.join(values)})"] if values else []
+        if len(values) < len(literals):
+            clauses.append(f"{quoted[0]} IS NULL")
+        return ' OR '.join(clauses)
+    
+    clauses = []
+    for row in keys.itertuples(index=False):
+        conditions = ' AND '.join(
+            f"{col} IS NULL" if literal == 'NULL' else f"{col} = {literal}"
+            for col, literal in zip(quoted, (sql_literal(value) for value in row))
+        )
+        clauses.append(f"({conditions})")
+    return ' OR '.join(clauses)
+
+
+def append_predicate(filter_clause: str, predicate: str) -> str:
+    """
+    Add a predicate to the user's filter clause
+    'WHERE a = 1' becomes 'WHERE (a = 1) AND (predicate)'; other clauses follow the new WHERE
+    """
+    stripped = (filter_clause or '').strip()
+    match = re.match(r'where\s+(.*)$', stripped, re.IGNORECASE | re.DOTALL)
+    if match:
+        return f"WHERE ({match.group(1)}) AND ({predicate})"
+    if stripped:
+        return f"WHERE ({predicate}) {stripped}"
+    return f"WHERE ({predicate})"
+
+
+def fetch_row_hashes(session: Dict[str, Any], columns: List[Dict[str, str]],
+                     key_columns: List[str]) -> pd.DataFrame:
+    """Fetch (join columns, row_hash) for every row, with the hash computed in the database"""
+    config = session['config']
+    db_type = config['dbType']
+    resolved = side_columns(session, columns)
+    names = [col['name'] for col in columns]
+    
+    key_select = [quote_identifier(db_type, resolved[names.index(key)][0]) for key in key_columns]
+    hash_expr = row_hash_expression(
+        db_type, [canonical_expression(db_type, name, data_type) for name, data_type in resolved]
+    )
+    
+    start = time.perf_counter()
+    df = query_side(session['cursor'], config, columns=', '.join(key_select + [f'{hash_expr} AS ROW_HASH']))
+    session['timings']['hashFetchSeconds'] = round(time.perf_counter() - start, 3)
+    session['timings']['rows'] = int(len(df))
+    progress('fetched', side=config['side'], rows=int(len(df)), seconds=session['timings']['hashFetchSeconds'])
+    return df
+
+
+def fetch_rows_for_keys(session: Dict[str, Any], keys: pd.DataFrame, columns: List[Dict[str, str]],
+                        key_columns: List[str]) -> pd.DataFrame:
+    """Fetch full rows (resolved columns only) for the given keys, KEY_FETCH_CHUNK keys per query"""
+    if keys.empty:
+        return pd.DataFrame()
+    
+    config = session['config']
+    db_type = config['dbType']
+    resolved = side_columns(session, columns)
+    names = [col['name'] for col in columns]
+    key_names = [resolved[names.index(key)][0] for key in key_columns]
+    select = ', '.join(quote_identifier(db_type, name) for name, _ in resolved)
+    
+    frames = []
+    for start in range(0, len(keys), KEY_FETCH_CHUNK):
+        check_cancelled()
+        predicate = key_predicate(db_type, key_names, keys.iloc[start:start + KEY_FETCH_CHUNK])
+        frames.append(query_side(session['cursor'], config, columns=select,
+                                 filter_clause=append_predicate(config['filter'], predicate)))
+    
+    return pd.concat(frames, ignore_index=True)
+
+
+def compare_by_hash(config1: Dict[str, Any], config2: Dict[str, Any],
+                    join_columns: List[str] | str, request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compare per-row checksums computed inside each database
+    Only (key, hash) pairs cross the network; full rows are fetched just for mismatched keys
+    (up to MAX_HASH_DETAIL_ROWS) and a sample of one-sided keys, then reported with datacompy.
+    """
+    key_columns = as_column_list(join_columns)
+    session1, session2 = open_sessions(config1, config2)
+    try:
+        timings = {}
+        
+        # Resolve the shared columns, then pull key + hash for every row on both sides
+        hash_start = time.perf_counter()
+        meta1, meta2 = run_on_both_sides(lambda s: describe_columns(s['cursor'], s['config']),
+                                         session1, session2)
+        columns = resolve_compare_columns(meta1, meta2, config1, config2, key_columns)
+        hashes1, hashes2 = run_on_both_sides(lambda s: fetch_row_hashes(s, columns, key_columns),
+                                             session1, session2)
+        timings['hashSeconds'] = round(time.perf_counter() - hash_start, 3)
+        
+        # Classify keys by comparing hashes
+        align_key_dtypes(hashes1, hashes2, key_columns)
+        merged = hashes1.merge(hashes2, on=key_columns, how='outer', suffixes=('_1', '_2'), indicator=True)
+        in_both = merged['_merge'] == 'both'
+        differs = in_both & (merged['row_hash_1'] != merged['row_hash_2'])
+        
+        summary = {
+            'totalRows1': int(len(hashes1)),
+            'totalRows2': int(len(hashes2)),
+            'matchingRows': int(in_both.sum()),
+            'mismatchedRows': int(differs.sum()),
+            'onlyInDatabase1': int((merged['_merge'] == 'left_only').sum()),
+            'onlyInDatabase2': int((merged['_merge'] == 'right_only').sum()),
+            'columnsCompared': int(len(columns)),
+        }
+        
+        # Fetch full rows only for mismatched keys and a sample of one-sided keys
+        detail_start = time.perf_counter()
+        mismatched_keys = merged.loc[differs, key_columns].head(MAX_HASH_DETAIL_ROWS)
+        unique_keys = {
+            1: merged.loc[merged['_merge'] == 'left_only', key_columns].head(config1['sampleRows']),
+            2: merged.loc[merged['_merge'] == 'right_only', key_columns].head(config1['sampleRows']),
+        }
+        
+        def fetch_details(session):
+            side = session['config']['side']
+            return (fetch_rows_for_keys(session, mismatched_keys, columns, key_columns),
+                    fetch_rows_for_keys(session, unique_keys[side], columns, key_columns))
+        
+        (mismatched1, unique1), (mismatched2, unique2) = run_on_both_sides(fetch_details, session1, session2)
+        timings['detailFetchSeconds'] = round(time.perf_counter() - detail_start, 3)
+    finally:
+        close_session(session1)
+        close_session(session2)
+    
+    report_lines = [
+        'Hash Comparison (row checksums computed in each database)',
+        '---------------------------------------------------------',
+        f"Rows in Database_1: {summary['totalRows1']}",
+        f"Rows in Database_2: {summary['totalRows2']}",
+        f"Rows in both: {summary['matchingRows']}",
+        f"Rows with different checksums: {summary['mismatchedRows']}",
+        f"Rows only in Database_1: {summary['onlyInDatabase1']}",
+        f"Rows only in Database_2: {summary['onlyInDatabase2']}",
+        f"Columns hashed: {', '.join(col['name'] for col in columns)}",
+    ]
+    
+    # Send the fetched mismatches through the usual datacompy report
+    mismatched_rows = []
+    compare_start = time.perf_counter()
+    if not mismatched1.empty and not mismatched2.empty:
+        align_key_dtypes(mismatched1, mismatched2, key_columns)
+        compare = run_datacompy(mismatched1, mismatched2, join_columns, config1['engine'])
+        mismatched_rows = summarize_compare(compare, config1['sampleRows'])['mismatchedRows']
+        report_lines += [
+            '',
+            f"Detailed report for {len(mismatched_keys)} of {summary['mismatchedRows']} mismatched rows:",
+            '',
+            compare.report,
+        ]
+    timings['compareSeconds'] = round(time.perf_counter() - compare_start, 3)
+    timings['database1'] = session1['timings']
+    timings['database2'] = session2['timings']
+    
+    return {
+        'summary': summary,
+        'fullReport': deferred_report(report_lines),
+        'onlyInDatabase1': frame_sample(unique1, config1['sampleRows']),
+        'onlyInDatabase2': frame_sample(unique2, config1['sampleRows']),
+        'mismatchedRows': mismatched_rows,
+        'timings': timings,
+        'hashStats': {
+            'hashRowsTransferred': int(len(hashes1) + len(hashes2)),
+            'detailRowsFetched': int(len(mismatched1) + len(mismatched2) + len(unique1) + len(unique2)),
+        },
+    }
+
+
+def table_reference(config: Dict[str, Any]) -> str:
+    """Fully qualified table name for hand-built queries"""
+    if config['dbType'] == 'snowflake':
+        return f"{config['database']}.{config['schema']}.{config['table']}"
+    return f"[{config['database']}].[{config['schema']}].[{config['table']}]"
+
+
+def execute_query(cursor: Any, db_type: str, sql: str) -> pd.DataFrame:
+    """Run an arbitrary SELECT and return the result with lowercase column names"""
+    cursor.execute(sql)
+    if db_type == 'snowflake':
+        df = cursor.fetch_pandas_all()
+    else:  # sqlserver
+        columns_info = [desc[0] for desc in cursor.description]
+        df = pd.DataFrame.from_records(cursor.fetchall(), columns=columns_info)
+    
+    df.columns = [col.lower() for col in df.columns]
+    return df
+
+
+def row_hash_number_expression(db_type: str, expressions: List[str]) -> str:
+    """SQL expression for the first 32 bits of the row MD5 as a non-negative integer"""
+    joined = expressions[0] if len(expressions) == 1 else f"CONCAT_WS('|', {', '.join(expressions)})"
+    if db_type == 'snowflake':
+        return f"TO_NUMBER(SUBSTR(MD5({joined}), 1, 8), 'XXXXXXXX')"
+    return f"CAST(CONVERT(BINARY(4), SUBSTRING(HASHBYTES('MD5', {joined}), 1, 4)) AS BIGINT)"
+
+
+def hash_sum_expression(db_type: str, hash_number: str) -> str:
+    """SUM of a row_hash_number_expression as text, so large sums survive both drivers exactly"""
+    if db_type == 'snowflake':
+        return f"TO_VARCHAR(SUM({hash_number}))"
+    return f"CAST(SUM(CAST({hash_number} AS DECIMAL(38, 0))) AS VARCHAR(40))"
+
+
+def is_numeric_value(value: Any) -> bool:
+    """True for fetched numeric scalars (booleans excluded)"""
+    return (isinstance(value, (int, float, decimal.Decimal, np.integer, np.floating))
+            and not isinstance(value, (bool, np.bool_)))
+
+
+def segment_predicate(db_type: str, key_column: str, segment: Tuple[Any, Any]) -> str:
+    """
+    Predicate for a half-open key segment [low, high); None means unbounded
+    Rows with a NULL key always belong to the lowest segment
+    """
+    col = quote_identifier(db_type, key_column)
+    low, high = segment
+    if low is None and high is None:
+        return '1 = 1'
+    if low is None:
+        return f"({col} < {sql_literal(high)} OR {col} IS NULL)"
+    if high is None:
+        return f"{col} >= {sql_literal(low)}"
+    return f"{col} >= {sql_literal(low)} AND {col} < {sql_literal(high)}"
+
+
+def key_bounds(session: Dict[str, Any], key_column: str) -> Tuple[Any, Any]:
+    """MIN and MAX of a key column within the user's filter"""
+    config = session['config']
+    col = quote_identifier(config['dbType'], key_column)
+    df = execute_query(
+        session['cursor'], config['dbType'],
+        f"SELECT MIN({col}) AS MIN_KEY, MAX({col}) AS MAX_KEY FROM {table_reference(config)} {config['filter']}"
+    )
+    if df.empty:
+        return None, None
+    return df['min_key'].iloc[0], df['max_key'].iloc[0]
+
+
+def split_numeric_segment(segment: Tuple[Any, Any], key_range: Tuple[Any, Any],
+                          fanout: int) -> List[Tuple[Any, Any]]:
+    """Split a numeric key segment into up to fanout equal-width pieces"""
+    low = segment[0] if segment[0] is not None else key_range[0]
+    high = segment[1] if segment[1] is not None else key_range[1]
+    
+    boundaries = []
+    for i in range(1, fanout):
+        if isinstance(low, int) and isinstance(high, int):
+            boundary = low + (high - low) * i // fanout
+        else:
+            boundary = low + (high - low) * i / fanout
+        # Interior boundaries only; the observed maximum is inclusive for an unbounded segment
+        inside_high = boundary <= high if segment[1] is None else boundary < high
+        if boundary > low and inside_high and boundary not in boundaries:
+            boundaries.append(boundary)
+    
+    edges = [segment[0]] + boundaries + [segment[1]]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def split_quantile_segment(session: Dict[str, Any], key_column: str, segment: Tuple[Any, Any],
+                           fanout: int) -> List[Tuple[Any, Any]]:
+    """Split a segment of a non-numeric key at NTILE boundaries computed by one database"""
+    config = session['config']
+    col = quote_identifier(config['dbType'], key_column)
+    predicate = segment_predicate(config['dbType'], key_column, segment)
+    df = execute_query(
+        session['cursor'], config['dbType'],
+        f"SELECT MIN(K) AS BOUNDARY FROM ("
+        f"SELECT {col} AS K, NTILE({fanout}) OVER (ORDER BY {col}) AS TILE "
+        f"FROM {table_reference(config)} {append_predicate(config['filter'], predicate)}"
+        f") T WHERE K IS NOT NULL GROUP BY TILE ORDER BY TILE"
+    )
+    
+    boundaries = []
+    for boundary in df['boundary'].tolist() if not df.empty else []:
+        if segment[0] is not None and boundary <= segment[0]:
+            continue
+        if boundaries and boundary <= boundaries[-1]:
+            continue
+        boundaries.append(boundary)
+    # The lowest tile minimum starts the segment itself, so it is not a split point
+    if boundaries and segment[0] is None:
+        boundaries = boundaries[1:]
+    
+    edges = [segment[0]] + boundaries + [segment[1]]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def segment_checksums(session: Dict[str, Any], segments: List[Tuple[Any, Any]], key_column: str,
+                      hash_number: str) -> Dict[int, Tuple[int, Optional[str]]]:
+    """
+    Row count and hash sum for each segment in a single grouped query
+    Returns: {segment index: (row count, hash sum as text)}
+    """
+    config = session['config']
+    db_type = config['dbType']
+    predicates = [segment_predicate(db_type, key_column, segment) for segment in segments]
+    cases = ' '.join(f"WHEN {predicate} THEN {i}" for i, predicate in enumerate(predicates))
+    where = ' OR '.join(f"({predicate})" for predicate in predicates)
+    
+    df = execute_query(
+        session['cursor'], db_type,
+        f"SELECT SEG, COUNT(*) AS ROW_COUNT, {hash_sum_expression(db_type, 'H')} AS HASH_SUM FROM ("
+        f"SELECT CASE {cases} END AS SEG, {hash_number} AS H "
+        f"FROM {table_reference(config)} {append_predicate(config['filter'], where)}"
+        f") S GROUP BY SEG"
+    )
+    if df.empty:
+        return {}
+    return {
+        int(row.seg): (int(row.row_count), None if pd.isna(row.hash_sum) else str(row.hash_sum))
+        for row in df.itertuples(index=False)
+    }
+
+
+def fetch_segment_rows(session: Dict[str, Any], segments: List[Tuple[Any, Any]], key_column: str,
+                       columns: List[Dict[str, str]]) -> pd.DataFrame:
+    """Fetch full rows (resolved columns only) for a list of key segments"""
+    if not segments:
+        return pd.DataFrame()
+    
+    config = session['config']
+    db_type = config['dbType']
+    select = ', '.join(quote_identifier(db_type, name) for name, _ in side_columns(session, columns))
+    
+    frames = []
+    for start in range(0, len(segments), SEGMENT_FETCH_CHUNK):
+        check_cancelled()
+        predicate = ' OR '.join(
+            f"({segment_predicate(db_type, key_column, segment)})"
+            for segment in segments[start:start + SEGMENT_FETCH_CHUNK]
+        )
+        frames.append(query_side(session['cursor'], config, columns=select,
+                                 filter_clause=append_predicate(config['filter'], predicate)))
+    
+    return pd.concat(frames, ignore_index=True)
+
+
+def key_range_of(bounds: List[Any]) -> Tuple[bool, Tuple[Any, Any]]:
+    """
+    Overall (min, max) of fetched key bounds and whether the key is numeric
+    Numeric bounds become Python ints (or floats) so ranges can be split arithmetically
+    """
+    bounds = [value for value in bounds if value is not None and not pd.isna(value)]
+    numeric_key = bool(bounds) and all(is_numeric_value(value) for value in bounds)
+    if numeric_key:
+        integral = all(float(value).is_integer() for value in bounds)
+        bounds = [int(value) if integral else float(value) for value in bounds]
+    return numeric_key, ((min(bounds), max(bounds)) if bounds else (None, None))
+
+
+def parallel_fetch_filters(session: Dict[str, Any]) -> List[str]:
+    """
+    Split one side's read into parallelFetch filter clauses on the first primary key
+    'range' splits MIN..MAX into equal-width ranges for numeric keys (NTILE quantiles otherwise);
+    'hash' uses a hash of the key modulo N. Each clause extends the user's filter.
+    """
+    config = session['config']
+    db_type = config['dbType']
+    count = config['parallelFetch']
+    
+    matches = [name for name, _ in describe_columns(session['cursor'], config)
+               if name.lower() == config['parallelKey']]
+    if not matches:
+        raise ValueError(f"Primary key column '{config['parallelKey']}' not found for parallel fetch")
+    key_column = matches[0]
+    col = quote_identifier(db_type, key_column)
+    
+    if config['parallelFetchMethod'] == 'hash':
+        if db_type == 'snowflake':
+            bucket = f"MOD(ABS(HASH({col})), {count})"
+        else:
+            bucket = f"ABS(CAST(CHECKSUM({col}) AS BIGINT)) % {count}"
+        predicates = [f"({bucket} = 0 OR {col} IS NULL)"]
+        predicates += [f"({col} IS NOT NULL AND {bucket} = {i})" for i in range(1, count)]
+    else:
+        numeric_key, key_range = key_range_of(list(key_bounds(session, key_column)))
+        if key_range[0] is None:
+            return [config['filter']]
+        if numeric_key:
+            segments = split_numeric_segment((None, None), key_range, count)
+        else:
+            segments = split_quantile_segment(session, key_column, (None, None), count)
+        predicates = [segment_predicate(db_type, key_column, segment) for segment in segments]
+    
+    return [append_predicate(config['filter'], predicate) for predicate in predicates]
+
+
+def run_parallel_ranges(session: Dict[str, Any], filters: List[str], func) -> List[Any]:
+    """
+    Run func(cursor, filter_clause, index) for every filter concurrently
+    The first range reuses the session's connection; the others each take one from the pool.
+    """
+    config = session['config']
+    
+    def run(index):
+        if index == 0:
+            return func(session['cursor'], filters[0], 0)
+        conn, cursor, _ = acquire_connection(config)
+        try:
+            return func(cursor, filters[index], index)
+        finally:
+            release_connection(config, conn, cursor)
+    
+    with ThreadPoolExecutor(max_workers=len(filters)) as executor:
+        return list(executor.map(run, range(len(filters))))
+
+
+def compare_fetched(df1: pd.DataFrame, df2: pd.DataFrame, join_columns: List[str] | str,
+                    engine: str = 'datacompy') -> Optional[Any]:
+    """
+    Run datacompy on partial fetches where either side may have come back empty
+    Returns None when neither side has any rows
+    """
+    if df1.empty and df2.empty:
+        return None
+    # An empty result may lack columns entirely; borrow the other side's (typed) header
+    if df1.empty:
+        df1 = df2.iloc[0:0].copy()
+    if df2.empty:
+        df2 = df1.iloc[0:0].copy()
+    
+    align_key_dtypes(df1, df2, as_column_list(join_columns))
+    return run_datacompy(df1, df2, join_columns, engine)
+
+
+def compare_by_bisection(config1: Dict[str, Any], config2: Dict[str, Any],
+                         join_columns: List[str] | str, request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Recursive key-range bisection using per-segment checksums
+    The first primary key's range is split into segments; each database returns a row count and
+    hash sum per segment. Only segments whose checksums differ are split again, and raw rows are
+    fetched once a differing segment holds at most bisectLeafRows rows.
+    """
+    key_columns = as_column_list(join_columns)
+    fanout = max(2, int(request_data.get('bisectSegments') or BISECT_SEGMENTS))
+    leaf_rows = max(1, int(request_data.get('bisectLeafRows') or BISECT_LEAF_ROWS))
+    max_rounds = max(1, int(request_data.get('bisectMaxRounds') or BISECT_MAX_ROUNDS))
+    stats = {
+        'rounds': 0,
+        'segmentsChecked': 0,
+        'segmentsMatched': 0,
+        'leafSegments': 0,
+        'checksumRowsTransferred': 0,
+        'leafRowsTransferred': 0,
+    }
+    
+    session1, session2 = open_sessions(config1, config2)
+    try:
+        timings = {}
+        search_start = time.perf_counter()
+        meta1, meta2 = run_on_both_sides(lambda s: describe_columns(s['cursor'], s['config']),
+                                         session1, session2)
+        columns = resolve_compare_columns(meta1, meta2, config1, config2, key_columns)
+        names = [col['name'] for col in columns]
+        
+        def key_name(session):
+            return side_columns(session, columns)[names.index(key_columns[0])][0]
+        
+        def hash_number(session):
+            db_type = session['config']['dbType']
+            return row_hash_number_expression(
+                db_type, [canonical_expression(db_type, name, data_type)
+                          for name, data_type in side_columns(session, columns)]
+            )
+        
+        # The overall key range decides whether segments are split arithmetically or by quantiles
+        bounds1, bounds2 = run_on_both_sides(lambda s: key_bounds(s, key_name(s)), session1, session2)
+        numeric_key, key_range = key_range_of([*bounds1, *bounds2])
+        
+        def split(segment, count1, count2):
+            if key_range[0] is None:
+                return [segment]
+            if numeric_key:
+                return split_numeric_segment(segment, key_range, fanout)
+            session = session1 if count1 >= count2 else session2
+            return split_quantile_segment(session, key_name(session), segment, fanout)
+        
+        matched_rows = 0
+        leaves = []
+        to_split = [((None, None), 1, 1)]
+        while to_split:
+            stats['rounds'] += 1
+            progress('bisecting', round=stats['rounds'], segments=len(to_split))
+            segments = []
+            for segment, count1, count2 in to_split:
+                pieces = split(segment, count1, count2)
+                if len(pieces) > 1:
+                    segments.extend(pieces)
+                else:
+                    leaves.append(segment)
+            if not segments:
+                break
+            
+            checksums1, checksums2 = run_on_both_sides(
+                lambda s: segment_checksums(s, segments, key_name(s), hash_number(s)), session1, session2
+            )
+            stats['segmentsChecked'] += len(segments)
+            stats['checksumRowsTransferred'] += len(checksums1) + len(checksums2)
+            
+            to_split = []
+            for i, segment in enumerate(segments):
+                checksum1 = checksums1.get(i, (0, None))
+                checksum2 = checksums2.get(i, (0, None))
+                if checksum1 == checksum2:
+                    stats['segmentsMatched'] += 1
+                    matched_rows += checksum1[0]
+                elif max(checksum1[0], checksum2[0]) <= leaf_rows or stats['rounds'] >= max_rounds:
+                    leaves.append(segment)
+                else:
+                    to_split.append((segment, checksum1[0], checksum2[0]))
+        
+        stats['leafSegments'] = len(leaves)
+        timings['searchSeconds'] = round(time.perf_counter() - search_start, 3)
+        
+        # Pull raw rows only for the differing leaf segments
+        leaf_start = time.perf_counter()
+        leaf1, leaf2 = run_on_both_sides(lambda s: fetch_segment_rows(s, leaves, key_name(s), columns),
+                                         session1, session2)
+        stats['leafRowsTransferred'] = int(len(leaf1) + len(leaf2))
+        timings['leafFetchSeconds'] = round(time.perf_counter() - leaf_start, 3)
+    finally:
+        close_session(session1)
+        close_session(session2)
+    
+    compare_start = time.perf_counter()
+    compare = compare_fetched(leaf1, leaf2, join_columns, config1['engine'])
+    if compare is not None:
+        outcome = summarize_compare(compare, config1['sampleRows'])
+    else:
+        outcome = summarize_compare_empty()
+    timings['compareSeconds'] = round(time.perf_counter() - compare_start, 3)
+    timings['database1'] = session1['timings']
+    timings['database2'] = session2['timings']
+    
+    # Every row lies either in a matched segment or in a fetched leaf
+    summary = outcome['summary']
+    summary['totalRows1'] = int(matched_rows + len(leaf1))
+    summary['totalRows2'] = int(matched_rows + len(leaf2))
+    summary['matchingRows'] = int(matched_rows + summary['matchingRows'])
+    summary['columnsCompared'] = int(len(columns))
+    
+    report_lines = [
+        'Bisection Comparison (per-segment checksums computed in each database)',
+        '----------------------------------------------------------------------',
+        f"Segmented on: {key_columns[0]} ({'numeric ranges' if numeric_key else 'quantiles'})",
+        f"Rounds: {stats['rounds']}",
+        f"Segments checked: {stats['segmentsChecked']} ({stats['segmentsMatched']} matched)",
+        f"Leaf segments fetched: {stats['leafSegments']} ({stats['leafRowsTransferred']} rows)",
+        f"Rows in matched segments: {matched_rows}",
+    ]
+    if compare is not None:
+        report_lines += ['', 'Detailed report for rows in differing segments:', '', compare.report]
+    
+    outcome['fullReport'] = deferred_report(report_lines)
+    outcome['timings'] = timings
+    outcome['bisectStats'] = stats
+    return outcome
+
+
+def partition_key_kinds(config1: Dict[str, Any], config2: Dict[str, Any],
+                        key_columns: List[str]) -> Dict[str, str]:
+    """
+    How each join column is canonicalized for partition hashing, from both tables' catalog types:
+    'number', 'datetime', 'bool' or 'text' (also when the two sides' type families differ)
+    """
+    def kind(data_type: str) -> str:
+        if data_type in BOOLEAN_TYPES:
+            return 'bool'
+        if data_type in NUMERIC_TYPES:
+            return 'number'
+        if data_type in DATETIME_TYPES or data_type in ZONED_DATETIME_TYPES:
+            return 'datetime'
+        return 'text'
+    
+    meta1, meta2 = run_on_both_sides(describe_side, config1, config2)
+    types1 = {name.lower(): data_type for name, data_type in meta1}
+    types2 = {name.lower(): data_type for name, data_type in meta2}
+    kinds = {}
+    for key in key_columns:
+        if key not in types1 or key not in types2:
+            raise ValueError(f"Primary key column '{key}' must exist in both tables")
+        kind1, kind2 = kind(types1[key]), kind(types2[key])
+        kinds[key] = kind1 if kind1 == kind2 else 'text'
+    return kinds
+
+
+def canonical_key_frame(df: pd.DataFrame, key_kinds: Dict[str, str]) -> pd.DataFrame:
+    """
+    Key columns converted to a representation both engines share, for partition hashing
+    The choice comes from the catalog types (partition_key_kinds), never from the fetched values,
+    so every chunk of either side maps the same key to the same partition: numbers become
+    float64, dates UTC nanoseconds, everything else text.
+    """
+    canonical = {}
+    for key, kind in key_kinds.items():
+        values = df[key]
+        if kind == 'number':
+            canonical[key] = pd.to_numeric(values, errors='coerce').astype('float64')
+        elif kind == 'datetime':
+            canonical[key] = pd.to_datetime(values, errors='coerce', utc=True).dt.tz_localize(None).astype('int64')
+        else:
+            canonical[key] = values.astype(str)
+    return pd.DataFrame(canonical)
+
+
+def partition_ids(df: pd.DataFrame, key_kinds: Dict[str, str], partitions: int, level: int = 0) -> np.ndarray:
+    """
+    Hash partition number (0..partitions-1) for every row, based on the join columns
+    level salts the hash so an oversized partition can be split again independently
+    """
+    hashes = pd.util.hash_pandas_object(canonical_key_frame(df, key_kinds), index=False,
+                                        hash_key=f'tablediff{level:07d}')
+    return (hashes.to_numpy() % np.uint64(partitions)).astype(np.int64)
+
+
+def spill_piece(piece: pd.DataFrame, spill_dir: str, name: str) -> Dict[str, Any]:
+    """Write one partition piece to an Arrow IPC file and describe it"""
+    path = os.path.join(spill_dir, f'{name}.arrow')
+    piece.to_feather(path)
+    return {
+        'path': path,
+        'rows': int(len(piece)),
+        'bytes': int(piece.memory_usage(deep=True).sum()),
+    }
+
+
+def split_into_partitions(df: pd.DataFrame, key_kinds: Dict[str, str], partitions: int, level: int,
+                          spill_dir: Optional[str], name: str) -> Dict[int, Any]:
+    """Split a frame by partition, keeping pieces in memory or spilling them"""
+    pieces = {}
+    ids = partition_ids(df, key_kinds, partitions, level)
+    for partition, piece in df.groupby(ids, sort=False):
+        piece = piece.reset_index(drop=True)
+        if spill_dir:
+            pieces[int(partition)] = spill_piece(piece, spill_dir, f'{name}_part{partition}')
+        else:
+            pieces[int(partition)] = piece
+    return pieces
+
+
+def partition_side(session: Dict[str, Any], key_kinds: Dict[str, str], partitions: int,
+                   spill_dir: Optional[str] = None) -> Dict[int, List[Any]]:
+    """
+    Stream one side's rows into hash partitions by join key
+    Pieces are kept in memory, or written to spill_dir as Arrow files when it is given.
+    With parallelFetch > 1 each key range streams over its own connection.
+    Returns: {partition: [DataFrame or spill file description, ...]}
+    """
+    config = session['config']
+    side = config['side']
+    start = time.perf_counter()
+    
+    def consume(cursor, filter_clause, index):
+        buckets = {partition: [] for partition in range(partitions)}
+        rows = 0
+        for seq, chunk in enumerate(iter_side_chunks(cursor, config, filter_clause=filter_clause)):
+            missing = [key for key in key_kinds if key not in chunk.columns]
+            if missing:
+                raise ValueError(f"Primary key column(s) {', '.join(missing)} not found in Database {side}")
+            if chunk.empty:
+                continue
+            
+            rows += len(chunk)
+            progress('fetching', side=side, range=index, rows=rows)
+            pieces = split_into_partitions(chunk, key_kinds, partitions, 0, spill_dir,
+                                           f'side{side}_r{index}_{seq}')
+            for partition, piece in pieces.items():
+                buckets[partition].append(piece)
+        return buckets, rows
+    
+    if config['parallelFetch'] > 1:
+        filters = parallel_fetch_filters(session)
+        results = run_parallel_ranges(session, filters, consume)
+        session['timings']['connections'] = len(filters)
+    else:
+        results = [consume(session['cursor'], config['filter'], 0)]
+    
+    buckets = {partition: [] for partition in range(partitions)}
+    rows = 0
+    for range_buckets, range_rows in results:
+        rows += range_rows
+        for partition, pieces in range_buckets.items():
+            buckets[partition].extend(pieces)
+    
+    fetch_seconds = time.perf_counter() - start
+    session['timings']['fetchSeconds'] = round(fetch_seconds, 3)
+    session['timings']['rows'] = int(rows)
+    session['timings']['rowsPerSecond'] = int(rows / fetch_seconds) if fetch_seconds > 0 else None
+    session['timings']['peakRssMb'] = peak_rss_mb()
+    progress('fetched', side=side, rows=int(rows), seconds=session['timings']['fetchSeconds'])
+    return buckets
+
+
+def load_partition(pieces: List[Any]) -> pd.DataFrame:
+    """Reassemble one partition from in-memory pieces or spill files"""
+    frames = [pd.read_feather(piece['path']) if isinstance(piece, dict) else piece for piece in pieces]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+
+def partition_bytes(pieces: List[Any]) -> int:
+    """In-memory size of a partition's pieces"""
+    return sum(piece['bytes'] if isinstance(piece, dict) else int(piece.memory_usage(deep=True).sum())
+               for piece in pieces)
+
+
+def repartition(pieces: List[Dict[str, Any]], key_kinds: Dict[str, str], fanout: int, level: int,
+                spill_dir: str, name: str) -> Dict[int, List[Dict[str, Any]]]:
+    """Split an oversized spilled partition into fanout smaller ones, one piece at a time"""
+    buckets = {partition: [] for partition in range(fanout)}
+    for seq, piece in enumerate(pieces):
+        df = load_partition([piece])
+        for partition, sub_piece in split_into_partitions(df, key_kinds, fanout, level,
+                                                          spill_dir, f'{name}_{seq}').items():
+            buckets[partition].append(sub_piece)
+        os.remove(piece['path'])
+    return buckets
+
+
+def plan_partitions(buckets1: Dict[int, List[Any]], buckets2: Dict[int, List[Any]], key_kinds: Dict[str, str],
+                    budget_bytes: Optional[int], spill_dir: Optional[str], stats: Dict[str, Any],
+                    level: int = 0, name: str = 'p') -> List[Tuple[List[Any], List[Any]]]:
+    """
+    Pair up partitions for comparison, re-splitting spilled partitions that would not fit
+    in the memory budget once loaded and merged (up to MAX_REPARTITION_LEVELS deep)
+    """
+    work = []
+    for partition in sorted(set(buckets1) | set(buckets2)):
+        pieces1 = buckets1.get(partition, [])
+        pieces2 = buckets2.get(partition, [])
+        if not pieces1 and not pieces2:
+            continue
+        
+        estimate = (partition_bytes(pieces1) + partition_bytes(pieces2)) * COMPARE_MEMORY_FACTOR
+        if budget_bytes and spill_dir and estimate > budget_bytes and level < MAX_REPARTITION_LEVELS:
+            stats['repartitioned'] += 1
+            fanout = min(PARTITION_COUNT, max(2, -(-estimate // budget_bytes)))
+            sub_name = f'{name}{partition}x'
+            work.extend(plan_partitions(
+                repartition(pieces1, key_kinds, fanout, level + 1, spill_dir, f'{sub_name}s1'),
+                repartition(pieces2, key_kinds, fanout, level + 1, spill_dir, f'{sub_name}s2'),
+                key_kinds, budget_bytes, spill_dir, stats, level + 1, sub_name,
+            ))
+        else:
+            work.append((pieces1, pieces2))
+    return work
+
+
+def new_partition_totals() -> Dict[str, Any]:
+    """Running totals merged across per-partition comparisons"""
+    outcome = summarize_compare_empty()
+    outcome['columnMismatches'] = {}
+    return outcome
+
+
+def merge_partition_totals(totals: Dict[str, Any], partial: Dict[str, Any],
+                           sample_rows: int = SAMPLE_ROWS) -> None:
+    """Merge one partition's totals into the running totals"""
+    for name, value in partial['summary'].items():
+        if name == 'columnsCompared':
+            totals['summary'][name] = max(totals['summary'][name], value)
+        else:
+            totals['summary'][name] += value
+    
+    for name in ('onlyInDatabase1', 'onlyInDatabase2', 'mismatchedRows'):
+        room = sample_rows - len(totals[name])
+        if room > 0:
+            totals[name].extend(partial[name][:room])
+    
+    for column, count in partial['columnMismatches'].items():
+        totals['columnMismatches'][column] = totals['columnMismatches'].get(column, 0) + count
+
+
+def compare_partition(pieces1: List[Any], pieces2: List[Any], join_columns: List[str] | str,
+                      sample_rows: int = SAMPLE_ROWS, engine: str = 'datacompy') -> Dict[str, Any]:
+    """
+    Load and compare one pair of partitions; runs in a worker process when partitionWorkers > 1
+    Returns partition totals (see new_partition_totals) plus the partition's row count
+    """
+    df1 = load_partition(pieces1)
+    df2 = load_partition(pieces2)
+    partial = totals_from_compare(compare_fetched(df1, df2, join_columns, engine), sample_rows)
+    partial['rows'] = int(len(df1) + len(df2))
+    return partial
+
+
+def totals_from_compare(compare: Optional[Any], sample_rows: int = SAMPLE_ROWS) -> Dict[str, Any]:
+    """Partition totals (see new_partition_totals) for one datacompy comparison, or empty for None"""
+    partial = new_partition_totals()
+    if compare is None:
+        return partial
+    
+    outcome = summarize_compare(compare, sample_rows)
+    partial['summary'] = outcome['summary']
+    for name in ('onlyInDatabase1', 'onlyInDatabase2', 'mismatchedRows'):
+        partial[name] = outcome[name]
+    for stat in compare.column_stats:
+        if stat['unequal_cnt'] > 0:
+            partial['columnMismatches'][stat['column']] = int(stat['unequal_cnt'])
+    return partial
+
+
+def partition_report(title: str, totals: Dict[str, Any], details: List[str]) -> str:
+    """Text report for a comparison assembled from per-partition results"""
+    summary = totals['summary']
+    lines = [
+        title,
+        '-' * len(title),
+        *details,
+        '',
+        f"Rows in Database_1: {summary['totalRows1']}",
+        f"Rows in Database_2: {summary['totalRows2']}",
+        f"Rows in both: {summary['matchingRows']}",
+        f"Rows with some compared columns unequal: {summary['mismatchedRows']}",
+        f"Rows only in Database_1: {summary['onlyInDatabase1']}",
+        f"Rows only in Database_2: {summary['onlyInDatabase2']}",
+        f"Columns compared: {summary['columnsCompared']}",
+        '',
+        'Columns with Unequal Values',
+        '---------------------------',
+    ]
+    if totals['columnMismatches']:
+        for column, count in sorted(totals['columnMismatches'].items(), key=lambda item: -item[1]):
+            lines.append(f"{column}: {count}")
+    else:
+        lines.append('None')
+    return '\n'.join(lines)
+
+
+def compare_partitioned(config1: Dict[str, Any], config2: Dict[str, Any],
+                        join_columns: List[str] | str, request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Streaming, out-of-core comparison: both sides are fetched in batches and hash-partitioned
+    by join key, then matching partitions are compared pairwise with datacompy
+    The full tables are never concatenated or merged in one piece. The partitions live as Arrow
+    files in a temporary directory (unless spillToDisk is false), so only one partition pair is
+    in memory at a time, and with memoryBudgetMb partitions too large for the budget are split
+    again before they are loaded. partitionWorkers > 1
+    compares partitions in a process pool (the budget is shared between the workers).
+    """
+    key_columns = as_column_list(join_columns)
+    partitions = max(1, int(request_data.get('partitionCount') or PARTITION_COUNT))
+    workers = max(1, int(request_data.get('partitionWorkers') or 1))
+    sample_rows = config1['sampleRows']
+    budget_mb = request_data.get('memoryBudgetMb')
+    budget_bytes = int(float(budget_mb) * 1024 * 1024 / workers) if budget_mb else None
+    spill = request_data.get('spillToDisk', True) is not False or bool(budget_bytes)
+    spill_dir = tempfile.mkdtemp(prefix='tablediff-') if spill else None
+    stats = {
+        'partitions': partitions,
+        'spilledToDisk': spill,
+        'memoryBudgetMb': float(budget_mb) if budget_mb else None,
+        'workers': workers,
+        'repartitioned': 0,
+        'comparedPartitions': 0,
+        'largestPartitionRows': 0,
+    }
+    timings = {}
+    try:
+        fetch_start = time.perf_counter()
+        key_kinds = partition_key_kinds(config1, config2, key_columns)
+        session1, session2 = open_sessions(config1, config2)
+        try:
+            buckets1, buckets2 = run_on_both_sides(
+                lambda s: partition_side(s, key_kinds, partitions, spill_dir), session1, session2
+            )
+        finally:
+            close_session(session1)
+            close_session(session2)
+        timings['fetchSeconds'] = round(time.perf_counter() - fetch_start, 3)
+        
+        compare_start = time.perf_counter()
+        work = plan_partitions(buckets1, buckets2, key_kinds, budget_bytes, spill_dir, stats)
+        del buckets1, buckets2
+        stats['comparedPartitions'] = len(work)
+        
+        totals = new_partition_totals()
+        if workers > 1 and len(work) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                partials = executor.map(compare_partition, [pieces1 for pieces1, _ in work],
+                                        [pieces2 for _, pieces2 in work], [join_columns] * len(work),
+                                        [sample_rows] * len(work), [config1['engine']] * len(work))
+                for partial in partials:
+                    stats['largestPartitionRows'] = max(stats['largestPartitionRows'], partial['rows'])
+                    merge_partition_totals(totals, partial, sample_rows)
+        else:
+            while work:
+                pieces1, pieces2 = work.pop(0)
+                partial = compare_partition(pieces1, pieces2, join_columns, sample_rows, config1['engine'])
+                stats['largestPartitionRows'] = max(stats['largestPartitionRows'], partial['rows'])
+                merge_partition_totals(totals, partial, sample_rows)
+        timings['compareSeconds'] = round(time.perf_counter() - compare_start, 3)
+    finally:
+        if spill_dir:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+    
+    timings['database1'] = session1['timings']
+    timings['database2'] = session2['timings']
+    
+    details = [
+        f"Partitions: {partitions} initial, {stats['comparedPartitions']} compared "
+        f"({'spilled to disk' if spill else 'in memory'})",
+        f"Oversized partitions split again: {stats['repartitioned']}",
+        f"Compare workers: {workers}",
+    ]
+    if stats['memoryBudgetMb']:
+        details.append(f"Memory budget: {stats['memoryBudgetMb']:g} MB")
+    totals['fullReport'] = partition_report('Partitioned Comparison (streamed, hash-partitioned by key)',
+                                            totals, details)
+    totals['timings'] = timings
+    totals['partitionStats'] = stats
+    return totals
+
+
+def key_range_bounds(keys: pd.Series, batch_rows: int) -> List[Any]:
+    """
+    Lower bounds splitting the non-null values of a join column into ranges of about batch_rows
+    rows; a value never spans two ranges
+    """
+    counts = keys.dropna().value_counts().sort_index()
+    if counts.empty:
+        return []
+    cumulative = counts.to_numpy().cumsum()
+    batch = (cumulative - counts.to_numpy()) // batch_rows
+    starts = np.flatnonzero(np.diff(batch) > 0) + 1
+    return list(counts.index[starts])
+
+
+def key_range_predicate(db_type: str, column: str, key_range: Tuple[Any, Any]) -> str:
+    """Predicate for a half-open key range [low, high) where None is unbounded, or NULL_KEY_RANGE"""
+    col = quote_identifier(db_type, column)
+    if key_range is NULL_KEY_RANGE:
+        return f"{col} IS NULL"
+    low, high = key_range
+    conditions = [f"{col} IS NOT NULL"]
+    if low is not None:
+        conditions.append(f"{col} >= {sql_literal(low)}")
+    if high is not None:
+        conditions.append(f"{col} < {sql_literal(high)}")
+    return ' AND '.join(conditions)
+
+
+def fetch_rows_in_key_range(session: Dict[str, Any], columns: List[Dict[str, str]], key_column: str,
+                            key_range: Tuple[Any, Any]) -> pd.DataFrame:
+    """Full rows (resolved columns only) whose first join column falls in key_range"""
+    config = session['config']
+    db_type = config['dbType']
+    resolved = side_columns(session, columns)
+    names = [col['name'] for col in columns]
+    predicate = key_range_predicate(db_type, resolved[names.index(key_column)][0], key_range)
+    select = ', '.join(quote_identifier(db_type, name) for name, _ in resolved)
+    return query_side(session['cursor'], config, columns=select,
+                      filter_clause=append_predicate(config['filter'], predicate))
+
+
+def fetch_keys(session: Dict[str, Any], columns: List[Dict[str, str]], key_columns: List[str]) -> pd.DataFrame:
+    """Fetch only the join columns of every row"""
+    config = session['config']
+    resolved = side_columns(session, columns)
+    names = [col['name'] for col in columns]
+    select = ', '.join(quote_identifier(config['dbType'], resolved[names.index(key)][0]) for key in key_columns)
+    
+    start = time.perf_counter()
+    df = query_side(session['cursor'], config, columns=select)
+    session['timings']['keyFetchSeconds'] = round(time.perf_counter() - start, 3)
+    session['timings']['rows'] = int(len(df))
+    progress('fetched', side=config['side'], rows=int(len(df)), seconds=session['timings']['keyFetchSeconds'])
+    return df
+
+
+def compare_by_keys(config1: Dict[str, Any], config2: Dict[str, Any],
+                    join_columns: List[str] | str, request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Two-phase comparison that finds one-sided rows from the join columns alone
+    Phase one fetches only the keys and classifies them with a hash merge. Phase two fetches
+    full rows in batches of about KEY_DETAIL_BATCH rows (key ranges, or hash partitions for text
+    keys) and compares each batch with datacompy; row counts must equal a full comparison's.
+    """
+    key_columns = as_column_list(join_columns)
+    stats = {'keyRowsTransferred': 0, 'detailRowsFetched': 0, 'detailBatches': 0}
+    sample_rows = config1['sampleRows']
+    timings = {}
+    
+    session1, session2 = open_sessions(config1, config2)
+    try:
+        # Phase one: keys only
+        key_start = time.perf_counter()
+        meta1, meta2 = run_on_both_sides(lambda s: describe_columns(s['cursor'], s['config']),
+                                         session1, session2)
+        columns = resolve_compare_columns(meta1, meta2, config1, config2, key_columns)
+        keys1, keys2 = run_on_both_sides(lambda s: fetch_keys(s, columns, key_columns), session1, session2)
+        stats['keyRowsTransferred'] = int(len(keys1) + len(keys2))
+        
+        align_key_dtypes(keys1, keys2, key_columns)
+        first = pd.concat([keys1[key_columns[0]], keys2[key_columns[0]]], ignore_index=True)
+        largest_side = max(len(keys1), len(keys2))
+        del keys1, keys2
+        timings['keyDiffSeconds'] = round(time.perf_counter() - key_start, 3)
+        
+        # Phase two: full rows batch by batch, each row read once, so the counts are exactly those
+        # of a full comparison. Batches are ranges of the first join column (one index range query
+        # per side, NULL keys in a batch of their own) when it is a number or date; text keys, whose
+        # order depends on each database's collation, are streamed once into spilled hash
+        # partitions instead.
+        detail_start = time.perf_counter()
+        totals = new_partition_totals()
+        orderable = ((pd.api.types.is_numeric_dtype(first.dtype) and not pd.api.types.is_bool_dtype(first.dtype))
+                     or pd.api.types.is_datetime64_any_dtype(first.dtype))
+        if orderable:
+            # Both sides' keys are counted, so a batch holds about KEY_DETAIL_BATCH rows per side
+            bounds = key_range_bounds(first, 2 * KEY_DETAIL_BATCH)
+            ranges = list(zip([None] + bounds, bounds + [None]))
+            if first.isna().any():
+                ranges.append(NULL_KEY_RANGE)
+            del first
+            for key_range in ranges:
+                check_cancelled()
+                rows1, rows2 = run_on_both_sides(
+                    lambda s: fetch_rows_in_key_range(s, columns, key_columns[0], key_range), session1, session2
+                )
+                stats['detailRowsFetched'] += int(len(rows1) + len(rows2))
+                stats['detailBatches'] += 1
+                compare = compare_fetched(rows1, rows2, join_columns, config1['engine'])
+                merge_partition_totals(totals, totals_from_compare(compare, sample_rows), sample_rows)
+        else:
+            del first
+            partitions = min(KEY_DETAIL_MAX_PARTITIONS, max(1, math.ceil(largest_side / KEY_DETAIL_BATCH)))
+            key_kinds = partition_key_kinds(config1, config2, key_columns)
+            spill_dir = tempfile.mkdtemp(prefix='tablediff-')
+            try:
+                buckets1, buckets2 = run_on_both_sides(
+                    lambda s: partition_side(s, key_kinds, partitions, spill_dir), session1, session2
+                )
+                for partition in range(partitions):
+                    check_cancelled()
+                    partial = compare_partition(buckets1[partition], buckets2[partition], join_columns,
+                                                sample_rows, config1['engine'])
+                    stats['detailRowsFetched'] += partial['rows']
+                    stats['detailBatches'] += 1
+                    merge_partition_totals(totals, partial, sample_rows)
+            finally:
+                shutil.rmtree(spill_dir, ignore_errors=True)
+        timings['detailFetchSeconds'] = round(time.perf_counter() - detail_start, 3)
+    finally:
+        close_session(session1)
+        close_session(session2)
+    
+    totals['summary']['columnsCompared'] = int(len(columns))
+    
+    timings['database1'] = session1['timings']
+    timings['database2'] = session2['timings']
+    details = [
+        f"Key rows transferred: {stats['keyRowsTransferred']}",
+        f"Full rows fetched: {stats['detailRowsFetched']} in {stats['detailBatches']} batches",
+    ]
+    totals['fullReport'] = partition_report('Key Pre-Diff Comparison (keys first, then full rows in key batches)',
+                                            totals, details)
+    totals['timings'] = timings
+    totals['keyDiffStats'] = stats
+    return totals
+
+
+def count_side_rows(config: Dict[str, Any]) -> int:
+    """
+    Rows of one side's table under the user's filter
+    An unfiltered table is counted from catalog metadata (no scan); COUNT(*) is only run when there
+    is a filter, which the catalog cannot account for, or when the catalog has no row count.
+    """
+    session = open_session(config)
+    try:
+        if not config['filter'].strip():
+            rows = metadata_row_count(session)
+            if rows is not None:
+                return rows
+        counts = execute_query(session['cursor'], config['dbType'],
+                               f"SELECT COUNT(*) AS ROW_COUNT FROM {table_reference(config)} {config['filter']}")
+        return int(counts['row_count'].iloc[0])
+    finally:
+        close_session(session)
+
+
+def key_sample_predicate(db_type: str, key_columns: List[Tuple[str, str]], fraction: float) -> str:
+    """
+    Predicate keeping the keys whose hash falls in the first fraction of the hash range
+    The hash is taken over the canonical key text, so both databases keep the same keys.
+    """
+    hash_number = row_hash_number_expression(
+        db_type, [canonical_expression(db_type, name, data_type) for name, data_type in key_columns]
+    )
+    return f"{hash_number} < {int(round(fraction * SAMPLE_HASH_BUCKETS))}"
+
+
+def z_score(confidence: float) -> float:
+    """Two-sided standard normal quantile for a confidence level"""
+    return statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def wilson_interval(successes: int, trials: int, confidence: float,
+                    fraction: float = 0.0) -> Dict[str, float]:
+    """
+    Wilson score interval for a proportion observed in a sample
+    fraction is the share of the population sampled; the finite population correction narrows
+    the interval to nothing once everything is sampled.
+    """
+    if trials == 0:
+        return {'estimate': 0.0, 'lower': 0.0, 'upper': 1.0}
+    rate = successes / trials
+    if fraction >= 1:
+        return {'estimate': rate, 'lower': rate, 'upper': rate}
+    
+    n = trials / (1 - fraction)
+    z = z_score(confidence)
+    denominator = 1 + z * z / n
+    centre = (rate + z * z / (2 * n)) / denominator
+    half_width = z * math.sqrt(rate * (1 - rate) / n + z * z / (4 * n * n)) / denominator
+    return {'estimate': rate, 'lower': max(0.0, centre - half_width), 'upper': min(1.0, centre + half_width)}
+
+
+def scaled_interval(interval: Dict[str, float], total: float) -> Dict[str, int]:
+    """A proportion interval as row counts out of total"""
+    return {name: int(round(value * total)) for name, value in interval.items()}
+
+
+def sample_fraction(request_data: Dict[str, Any], population: int, confidence: float) -> float:
+    """
+    Fraction of keys to sample: sampleFraction as given, or sized from targetError so the mismatch
+    rate interval is at most +/- targetError wide even at the worst-case rate of 50%
+    The mismatch rate is measured over the rows found on both sides, so population is the common
+    row count (at most the smaller table), not either table's total.
+    """
+    if request_data.get('sampleFraction') is not None:
+        fraction = float(request_data['sampleFraction'])
+        if not 0 < fraction <= 1:
+            raise ValueError("sampleFraction must be greater than 0 and at most 1")
+        return fraction
+    if request_data.get('targetError') is not None:
+        target_error = float(request_data['targetError'])
+        if not 0 < target_error < 0.5:
+            raise ValueError("targetError must be between 0 and 0.5")
+        if population == 0:
+            return 1.0
+        z = z_score(confidence)
+        needed = z * z * 0.25 / (target_error * target_error)
+        needed = needed / (1 + (needed - 1) / population)
+        return min(1.0, math.ceil(needed) / population)
+    return SAMPLE_FRACTION
+
+
+def sampling_estimates(sampled: Dict[str, int], rows1: int, rows2: int, fraction: float,
+                       confidence: float) -> Dict[str, Any]:
+    """
+    Population estimates from the summary of a sampled comparison
+    One-sided rows are estimated as a share of each table's rows, mismatches as a share of the
+    rows found on both sides.
+    """
+    only1 = wilson_interval(sampled['onlyInDatabase1'], sampled['totalRows1'], confidence, fraction)
+    only2 = wilson_interval(sampled['onlyInDatabase2'], sampled['totalRows2'], confidence, fraction)
+    mismatch_rate = wilson_interval(sampled['mismatchedRows'], sampled['matchingRows'], confidence, fraction)
+    common = rows1 * (1 - only1['estimate'])
+    return {
+        'sampleFraction': fraction,
+        'confidenceLevel': confidence,
+        'sampledRows1': sampled['totalRows1'],
+        'sampledRows2': sampled['totalRows2'],
+        'sampledMatchingRows': sampled['matchingRows'],
+        'mismatchRate': mismatch_rate,
+        'mismatchedRows': scaled_interval(mismatch_rate, common),
+        'onlyInDatabase1': scaled_interval(only1, rows1),
+        'onlyInDatabase2': scaled_interval(only2, rows2),
+    }
+
+
+def sampling_report(summary: Dict[str, Any]) -> str:
+    """Text section describing the sample and the estimated differences"""
+    estimates = summary['estimates']
+    confidence = f"{estimates['confidenceLevel']:.0%}"
+    rate = estimates['mismatchRate']
+    lines = [
+        'Sampled Comparison (deterministic key-hash sample)',
+        '--------------------------------------------------',
+        f"Sample fraction: {estimates['sampleFraction']:.6g} of keys",
+        f"Rows in Database_1: {summary['totalRows1']} ({estimates['sampledRows1']} sampled)",
+        f"Rows in Database_2: {summary['totalRows2']} ({estimates['sampledRows2']} sampled)",
+        f"Mismatch rate: {rate['estimate']:.4%} ({confidence} interval {rate['lower']:.4%} - {rate['upper']:.4%})",
+    ]
+    for label, name in (('Mismatched rows', 'mismatchedRows'), ('Rows only in Database_1', 'onlyInDatabase1'),
+                        ('Rows only in Database_2', 'onlyInDatabase2')):
+        interval = estimates[name]
+        lines.append(f"{label} (estimated): {interval['estimate']} ({confidence} interval "
+                     f"{interval['lower']} - {interval['upper']})")
+    lines.append('The sections below describe the sample only.')
+    return '\n'.join(lines)
+
+
+def compare_sampled(config1: Dict[str, Any], config2: Dict[str, Any],
+                    join_columns: List[str] | str, request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Estimate the differences from a deterministic sample of keys
+    Both queries keep only the rows whose key hash falls below fraction * 2^32, so both sides
+    sample the same keys (TABLESAMPLE picks blocks independently per side and is not used).
+    The sample is compared like a full fetch; the summary then holds population estimates with
+    Wilson intervals, and the sample rows and report describe the sample itself.
+    """
+    key_columns = as_column_list(join_columns)
+    confidence = float(request_data.get('confidenceLevel') or SAMPLE_CONFIDENCE)
+    if not 0 < confidence < 1:
+        raise ValueError("confidenceLevel must be between 0 and 1")
+    
+    count_start = time.perf_counter()
+    meta1, meta2 = run_on_both_sides(describe_side, config1, config2)
+    columns = resolve_compare_columns(meta1, meta2, config1, config2, key_columns)
+    rows1, rows2 = run_on_both_sides(count_side_rows, config1, config2)
+    count_seconds = round(time.perf_counter() - count_start, 3)
+    fraction = sample_fraction(request_data, min(rows1, rows2), confidence)
+    
+    # Same key-hash predicate on both sides, on top of the user's filters
+    keys = [next(col for col in columns if col['name'] == key) for key in key_columns]
+    sample_configs = []
+    for config in (config1, config2):
+        side = config['side']
+        predicate = key_sample_predicate(config['dbType'], [(key[f'column{side}'], key[f'type{side}']) for key in keys],
+                                         fraction)
+        sample_configs.append(dict(config, filter=append_predicate(config['filter'], predicate)))
+    
+    outcome = compare_full(sample_configs[0], sample_configs[1], join_columns, request_data)
+    sampled = outcome['summary']
+    estimates = sampling_estimates(sampled, rows1, rows2, fraction, confidence)
+    outcome['summary'] = {
+        'totalRows1': rows1,
+        'totalRows2': rows2,
+        'matchingRows': rows1 - estimates['onlyInDatabase1']['estimate'],
+        'mismatchedRows': estimates['mismatchedRows']['estimate'],
+        'onlyInDatabase1': estimates['onlyInDatabase1']['estimate'],
+        'onlyInDatabase2': estimates['onlyInDatabase2']['estimate'],
+        'columnsCompared': sampled['columnsCompared'],
+        'estimates': estimates,
+    }
+    outcome['fullReport'] = deferred_report([sampling_report(outcome['summary']), outcome['fullReport']],
+                                            separator='\n\n')
+    outcome['timings']['countSeconds'] = count_seconds
+    return outcome
+
+
+def profile_side(session: Dict[str, Any], columns: List[Dict[str, str]],
+                 key_columns: List[str]) -> Dict[str, Any]:
+    """
+    Aggregate profile of one side computed in the database
+    Row count, distinct key count and a whole-row hash sum, plus per column the non-NULL count
+    and a hash sum of its canonical text, with SUM/MIN/MAX for numeric columns
+    """
+    config = session['config']
+    db_type = config['dbType']
+    resolved = side_columns(session, columns)
+    names = [col['name'] for col in columns]
+    canonical = [canonical_expression(db_type, name, data_type) for name, data_type in resolved]
+    float_type = 'DOUBLE' if db_type == 'snowflake' else 'FLOAT'
+    
+    selects = [
+        'COUNT(*) AS ROW_COUNT',
+        f"{hash_sum_expression(db_type, row_hash_number_expression(db_type, canonical))} AS ROW_HASH",
+    ]
+    for i, (name, data_type) in enumerate(resolved):
+        col = quote_identifier(db_type, name)
+        selects.append(f"COUNT({col}) AS C{i}_NON_NULL")
+        selects.append(f"{hash_sum_expression(db_type, row_hash_number_expression(db_type, [canonical[i]]))} AS C{i}_HASH")
+        if data_type in NUMERIC_TYPES:
+            selects.append(f"SUM(CAST({col} AS {float_type})) AS C{i}_SUM")
+            selects.append(f"MIN({col}) AS C{i}_MIN")
+            selects.append(f"MAX({col}) AS C{i}_MAX")
+    
+    start = time.perf_counter()
+    table = table_reference(config)
+    row = execute_query(session['cursor'], db_type,
+                        f"SELECT {', '.join(selects)} FROM {table} {config['filter']}").iloc[0]
+    keys = ', '.join(quote_identifier(db_type, resolved[names.index(key)][0]) for key in key_columns)
+    distinct = execute_query(session['cursor'], db_type,
+                             f"SELECT COUNT(*) AS KEY_COUNT FROM (SELECT DISTINCT {keys} FROM {table} {config['filter']}) K")
+    session['timings']['profileSeconds'] = round(time.perf_counter() - start, 3)
+    
+    profile = {
+        'rows': int(row['row_count']),
+        'distinctKeys': int(distinct['key_count'].iloc[0]),
+        'rowHash': row['row_hash'],
+        'columns': {},
+    }
+    for i, (name, data_type) in enumerate(resolved):
+        aggregates = {'nonNull': int(row[f'c{i}_non_null']), 'hash': row[f'c{i}_hash']}
+        if data_type in NUMERIC_TYPES:
+            for aggregate in ('sum', 'min', 'max'):
+                aggregates[aggregate] = row[f'c{i}_{aggregate}']
+        profile['columns'][names[i]] = aggregates
+    return convert_to_json_serializable(profile)
+
+
+def aggregates_agree(value1: Any, value2: Any) -> bool:
+    """Compare two profile aggregates; numbers within PROFILE_REL_TOLERANCE (float sums are order dependent)"""
+    if value1 is None or value2 is None:
+        return value1 is None and value2 is None
+    if is_numeric_value(value1) and is_numeric_value(value2):
+        return math.isclose(float(value1), float(value2), rel_tol=PROFILE_REL_TOLERANCE)
+    return str(value1) == str(value2)
+
+
+def profile_deltas(profile1: Dict[str, Any], profile2: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Aggregates that differ between the two profiles, table-level ones under column '*'"""
+    deltas = []
+    
+    def check(column, aggregate, value1, value2):
+        if not aggregates_agree(value1, value2):
+            deltas.append({'column': column, 'aggregate': aggregate, 'database1': value1, 'database2': value2})
+    
+    for aggregate in ('rows', 'distinctKeys', 'rowHash'):
+        check('*', aggregate, profile1[aggregate], profile2[aggregate])
+    for column, aggregates1 in profile1['columns'].items():
+        aggregates2 = profile2['columns'][column]
+        for aggregate, value1 in aggregates1.items():
+            # A column numeric on one side only has no SUM/MIN/MAX on the other; its hash still covers it
+            if aggregate in aggregates2:
+                check(column, aggregate, value1, aggregates2[aggregate])
+    return deltas
+
+
+def profile_tables(config1: Dict[str, Any], config2: Dict[str, Any],
+                   key_columns: List[str]) -> Dict[str, Any]:
+    """
+    Profile both tables with pushed-down aggregates
+    matched is True only when every aggregate agrees and the keys are unique, in which case the
+    row-level comparison would find no differences (up to the canonical-text hash precision)
+    """
+    session1, session2 = open_sessions(config1, config2)
+    try:
+        start = time.perf_counter()
+        meta1, meta2 = run_on_both_sides(lambda s: describe_columns(s['cursor'], s['config']),
+                                         session1, session2)
+        columns = resolve_compare_columns(meta1, meta2, config1, config2, key_columns)
+        profile1, profile2 = run_on_both_sides(lambda s: profile_side(s, columns, key_columns),
+                                               session1, session2)
+        seconds = round(time.perf_counter() - start, 3)
+    finally:
+        close_session(session1)
+        close_session(session2)
+    
+    deltas = profile_deltas(profile1, profile2)
+    unique_keys = profile1['distinctKeys'] == profile1['rows'] and profile2['distinctKeys'] == profile2['rows']
+    return {
+        'matched': not deltas and unique_keys,
+        'deltas': deltas,
+        'rows': profile1['rows'],
+        'columnsCompared': len(columns),
+        'timings': {'database1': session1['timings'], 'database2': session2['timings'], 'profileSeconds': seconds},
+    }
+
+
+def profile_report(profile: Dict[str, Any]) -> str:
+    """Report section describing the aggregate profile stage"""
+    title = 'Aggregate Profile'
+    lines = [title, '-' * len(title)]
+    if profile['matched']:
+        lines.append('All aggregates agree on both sides; row-level comparison skipped')
+    elif not profile['deltas']:
+        lines.append('All aggregates agree, but duplicate keys require the row-level comparison')
+    else:
+        lines.append('Aggregates that differ (column, aggregate, Database_1, Database_2):')
+        for delta in profile['deltas']:
+            lines.append(f"{delta['column']}  {delta['aggregate']}  {delta['database1']}  {delta['database2']}")
+    return '\n'.join(lines)
+
+
+def profile_outcome(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Comparison outcome for tables whose profiles agree, without any row transfer"""
+    outcome = summarize_compare_empty()
+    outcome['summary'].update({
+        'totalRows1': profile['rows'],
+        'totalRows2': profile['rows'],
+        'matchingRows': profile['rows'],
+        'columnsCompared': profile['columnsCompared'],
+    })
+    outcome['fullReport'] = profile_report(profile)
+    outcome['timings'] = profile['timings']
+    return outcome
+
+
+def watermark_literal(db_type: str, value: Any) -> str:
+    """SQL literal for a stored watermark; SQL Server timestamps go through DATETIME2 to keep microseconds"""
+    if db_type == 'sqlserver' and isinstance(value, (pd.Timestamp, datetime.datetime)):
+        return f"CAST({sql_literal(value)} AS DATETIME2(7))"
+    return sql_literal(value)
+
+
+def watermark_state_key(config1: Dict[str, Any], config2: Dict[str, Any], join_columns: List[str] | str,
+                        watermark_column: str) -> str:
+    """Identify an incremental comparison: both tables with their column lists and filters, keys and watermark"""
+    sides = [
+        [*metadata_cache_key(config), config['columns'].strip(), config['filter'].strip()]
+        for config in (config1, config2)
+    ]
+    return watermark_state.state_key([*sides, as_column_list(join_columns), watermark_column])
+
+
+def open_watermark_window(config1: Dict[str, Any], config2: Dict[str, Any], join_columns: List[str] | str,
+                          watermark_column: str, full_reconcile: bool) -> Dict[str, Any]:
+    """
+    Restrict both sides to the rows past the last validated watermark (in place)
+    The window ends at Database_1's current MAX of the watermark column (normalized to the stored
+    watermark's type), so rows arriving during the run are left for the next one. A full reconciliation (also used for the first run) drops
+    the lower bound and includes rows whose watermark is NULL.
+    Returns the window: {'stateKey', 'state', 'column', 'start', 'end', 'fullReconcile', 'empty'}
+    """
+    state_key = watermark_state_key(config1, config2, join_columns, watermark_column)
+    state = watermark_state.load_state(state_key)
+    start = None if full_reconcile or state is None else state['watermark']
+    
+    names = {}
+    for config in (config1, config2):
+        lookup = {name.lower(): name for name, _ in describe_side(config)}
+        if watermark_column not in lookup:
+            raise ValueError(f"Watermark column '{watermark_column}' must exist in both tables")
+        names[config['side']] = lookup[watermark_column]
+    
+    session = open_session(config1)
+    try:
+        end = watermark_state.normalize_watermark(key_bounds(session, names[1])[1])
+    finally:
+        close_session(session)
+    
+    window = {
+        'stateKey': state_key,
+        'state': state,
+        'column': watermark_column,
+        'start': start,
+        'end': end,
+        'fullReconcile': start is None,
+        'empty': end is None or (start is not None and not end > start),
+    }
+    if window['empty']:
+        return window
+    
+    for config in (config1, config2):
+        db_type = config['dbType']
+        col = quote_identifier(db_type, names[config['side']])
+        predicate = f"{col} <= {watermark_literal(db_type, end)}"
+        if start is None:
+            predicate = f"({predicate} OR {col} IS NULL)"
+        else:
+            predicate = f"{col} > {watermark_literal(db_type, start)} AND {predicate}"
+        config['filter'] = append_predicate(config['filter'], predicate)
+    return window
+
+
+def empty_window_outcome(window: Dict[str, Any]) -> Dict[str, Any]:
+    """Outcome of an incremental run with no rows past the last validated watermark"""
+    outcome = summarize_compare_empty()
+    outcome['fullReport'] = f"No rows past the last validated watermark ({window['start']})"
+    outcome['timings'] = {}
+    return outcome
+
+
+def close_watermark_window(window: Dict[str, Any], summary: Dict[str, int]) -> Dict[str, Any]:
+    """
+    Persist the new watermark and running totals after a successful run
+    Cumulative counts restart from this run's counts after a full reconciliation; they assume an
+    append-mostly table, since a row updated after being validated is counted again in its new window.
+    Returns the incremental section of the result
+    """
+    state = window['state']
+    cumulative = dict(summary) if window['fullReconcile'] or state is None else dict(state['cumulative'])
+    if not window['fullReconcile'] and state is not None:
+        for name, value in summary.items():
+            if name == 'columnsCompared':
+                cumulative[name] = max(cumulative.get(name, 0), value)
+            else:
+                cumulative[name] = cumulative.get(name, 0) + value
+    
+    runs = 1 if state is None else state['runs'] + 1
+    last_full_reconcile = state['lastFullReconcile'] if state is not None else None
+    if window['fullReconcile']:
+        last_full_reconcile = datetime.datetime.now().isoformat()
+    watermark = window['start'] if window['empty'] else window['end']
+    watermark_state.save_state(window['stateKey'], watermark, cumulative, runs, last_full_reconcile)
+    
+    return convert_to_json_serializable({
+        'watermarkColumn': window['column'],
+        'windowStart': None if window['start'] is None else str(window['start']),
+        'windowEnd': None if window['empty'] else str(window['end']),
+        'fullReconcile': window['fullReconcile'],
+        'runs': runs,
+        'lastFullReconcile': last_full_reconcile,
+        'window': summary,
+        'cumulative': cumulative,
+    })
+
+
+def incremental_report(incremental: Dict[str, Any]) -> str:
+    """Report section with the window bounds and the cumulative counts"""
+    title = 'Incremental Comparison'
+    cumulative = incremental['cumulative']
+    kind = 'full reconciliation' if incremental['fullReconcile'] else 'delta window'
+    lines = [
+        '', '', title, '-' * len(title),
+        f"Watermark column: {incremental['watermarkColumn']} ({kind})",
+        f"Window: after {incremental['windowStart'] or '(start)'} up to {incremental['windowEnd'] or '(no new rows)'}",
+        f"Runs: {incremental['runs']} (last full reconciliation {incremental['lastFullReconcile'] or 'never'})",
+        f"Cumulative rows in Database_1: {cumulative.get('totalRows1', 0)}",
+        f"Cumulative rows in Database_2: {cumulative.get('totalRows2', 0)}",
+        f"Cumulative rows with some compared columns unequal: {cumulative.get('mismatchedRows', 0)}",
+        f"Cumulative rows only in Database_1: {cumulative.get('onlyInDatabase1', 0)}",
+        f"Cumulative rows only in Database_2: {cumulative.get('onlyInDatabase2', 0)}",
+    ]
+    return '\n'.join(lines)
+
+
+# Comparison strategies selectable with the request's compareMode
+COMPARE_MODES = {
+    'full': compare_full,
+    'hash': compare_by_hash,
+    'bisect': compare_by_bisection,
+    'partitioned': compare_partitioned,
+    'keys': compare_by_keys,
+    'sampled': compare_sampled,
+}
+
+
+def compare_tables(request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compare two database tables and return comparison results
+    Supports Snowflake-to-Snowflake, SQL Server-to-SQL Server, 
+    and cross-database comparisons
+    """
+    try:
+        config1 = get_side_config(request_data, 1)
+        config2 = get_side_config(request_data, 2)
+        db1_type = config1['dbType']
+        db2_type = config2['dbType']
+        
+        # Primary keys
+        primary_key1 = request_data['primaryKey1']
+        primary_key2 = request_data.get('primaryKey2', '')
+        primary_key3 = request_data.get('primaryKey3', '')
+        primary_key4 = request_data.get('primaryKey4', '')
+        
+        # Email configuration
+        email_address = request_data.get('emailAddress', '')
+        send_email_flag = request_data.get('sendEmail', False)
+        
+        # Build primary keys (normalize to lowercase)
+        join_columns = build_primary_keys(
+            primary_key1.lower() if primary_key1 else '',
+            primary_key2.lower() if primary_key2 else '',
+            primary_key3.lower() if primary_key3 else '',
+            primary_key4.lower() if primary_key4 else ''
+        )
+        
+        compare_mode = request_data.get('compareMode') or 'full'
+        if compare_mode not in COMPARE_MODES:
+            raise ValueError(f"Unknown compareMode '{compare_mode}'")
+        if config1['engine'] not in COMPARE_ENGINES:
+            raise ValueError(f"Unknown engine '{config1['engine']}'")
+        
+        # Incremental runs compare only the rows past the last validated watermark
+        watermark_column = (request_data.get('watermarkColumn') or '').strip().lower()
+        window = None
+        if watermark_column and compare_mode == 'sampled':
+            raise ValueError("A sampled comparison cannot advance the watermark; use another compareMode")
+        if watermark_column:
+            window = open_watermark_window(config1, config2, join_columns, watermark_column,
+                                           bool(request_data.get('fullReconcile')))
+        
+        # Result cache: the same request against unchanged tables returns the stored result and report
+        cache_key, cached = cached_comparison(request_data, config1, config2)
+        if cached is not None:
+            return cached
+        
+        # Fetch only the columns both tables share
+        dropped_columns = project_columns(config1, config2, as_column_list(join_columns))
+        
+        # Optional aggregate profile: skip the row-level comparison when the tables provably match
+        empty_window = window is not None and window['empty']
+        profile = None
+        if request_data.get('profileFirst') and not empty_window:
+            profile = profile_tables(config1, config2, as_column_list(join_columns))
+            # Suspect columns reach the job's progress stream before the row-level diff starts
+            progress('profiled', matched=profile['matched'],
+                     suspectColumns=sorted({delta['column'] for delta in profile['deltas']}),
+                     deltas=profile['deltas'])
+        
+        if empty_window:
+            outcome = empty_window_outcome(window)
+        elif profile is not None and profile['matched']:
+            outcome = profile_outcome(profile)
+        else:
+            outcome = COMPARE_MODES[compare_mode](config1, config2, join_columns, request_data)
+        
+        # The mode's report may be deferred (datacompy's report() is slow on wide tables)
+        report_parts = [outcome.pop('fullReport')]
+        if profile is not None:
+            if not profile['matched']:
+                report_parts.insert(0, profile_report(profile) + '\n\n')
+                outcome['profileDeltas'] = profile['deltas']
+                outcome['timings']['profileSeconds'] = profile['timings']['profileSeconds']
+            outcome['profileMatched'] = profile['matched']
+        report_parts.append(dropped_columns_report(dropped_columns))
+        outcome['droppedColumns'] = dropped_columns
+        if window is not None:
+            outcome['incremental'] = close_watermark_window(window, outcome['summary'])
+            report_parts.append(incremental_report(outcome['incremental']))
+        report = deferred_report(report_parts, separator='')
+        
+        # Build the report now only if it is returned or emailed; otherwise keep it for a later request
+        if request_data.get('includeReport', True) is not False or (send_email_flag and email_address):
+            progress('report')
+            report_start = time.perf_counter()
+            report = report()
+            outcome['timings']['reportSeconds'] = round(time.perf_counter() - report_start, 3)
+        
+        # Generate timestamp
+        timestamp = datetime.datetime.now().isoformat()
+        
+        # Build database info strings with type labels
+        db1_info = f"{db1_type.upper()}: {config1['database']}.{config1['schema']}.{config1['table']}"
+        db2_info = f"{db2_type.upper()}: {config2['database']}.{config2['schema']}.{config2['table']}"
+        
+        # Return results
+        result = {
+            'timestamp': timestamp,
+            'database1Info': db1_info,
+            'database2Info': db2_info,
+            'compareMode': compare_mode,
+        }
+        result.update(outcome)
+        result['cacheHit'] = False
+        # A deferred report is cached once it is built (see render_stored_report)
+        if cache_key is not None and isinstance(report, str):
+            result_cache.store(cache_key, result, report)
+            cache_key = None
+        return deliver_result(result, report, request_data, cache_key)
+        
+    except Exception as e:
+        raise Exception(f"Comparison failed: {str(e)}")
+
+
+def cached_comparison(request_data: Dict[str, Any], config1: Dict[str, Any],
+                      config2: Dict[str, Any]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """
+    Look a request up in the result cache (incremental runs and resultCache: false skip it)
+    Returns (cache key, or None when the result cannot be cached; the delivered result of a live
+    entry with its report, or None when the comparison has to run)
+    """
+    watermark_column = (request_data.get('watermarkColumn') or '').strip()
+    use_cache = request_data.get('resultCache') is not False and not watermark_column
+    cache_key = result_cache_key(request_data, config1, config2) if use_cache else None
+    if cache_key is None or request_data.get('forceRefresh'):
+        return cache_key, None
+    cached = result_cache.lookup(cache_key)
+    if cached is None or cached['report'] is None:
+        return cache_key, None
+    
+    progress('cacheHit')
+    result = cached['result']
+    result['cacheHit'] = True
+    result['cacheAgeSeconds'] = round(time.time() - cached['createdAt'], 1)
+    return cache_key, deliver_result(result, cached['report'], request_data)
+
+
+def result_cache_key(request_data: Dict[str, Any], config1: Dict[str, Any],
+                     config2: Dict[str, Any]) -> Optional[str]:
+    """
+    Result cache key: the request without credentials or delivery options, plus both tables'
+    fingerprints. None (no caching) when either table has no fingerprint; tables without catalog
+    metadata only get one when the request sets cacheChecksum.
+    """
+    checksum = bool(request_data.get('cacheChecksum'))
+    fingerprint1, fingerprint2 = run_on_both_sides(
+        lambda config: result_fingerprint(config, checksum), config1, config2
+    )
+    if fingerprint1 is None or fingerprint2 is None:
+        return None
+    
+    request = {
+        name: value.strip() if isinstance(value, str) else value
+        for name, value in request_data.items()
+        if name not in RESULT_CACHE_IGNORED_FIELDS and value not in (None, '')
+    }
+    return result_cache.cache_key([request, fingerprint1, fingerprint2])
+
+
+def deliver_result(result: Dict[str, Any], report: Any, request_data: Dict[str, Any],
+                   cache_key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Send the result email if requested, keep the result for follow-up tasks by resultId (unless
+    storeResult is false) and shape the response (report included or deferred, rows as records
+    or columnar)
+    cache_key is the result cache entry to write once a deferred report is built.
+    """
+    email_address = request_data.get('emailAddress', '')
+    include_report = request_data.get('includeReport', True) is not False
+    
+    # Send email if requested
+    email_sent = False
+    if request_data.get('sendEmail', False) and email_address:
+        subject = (f"TableMigrationCheck Results: {result['database1Info']} vs {result['database2Info']}"
+                   f" - {result['timestamp']}")
+        email_sent = send_email(email_address, subject, report)
+    
+    result['emailSent'] = email_sent
+    if request_data.get('storeResult', True) is not False:
+        result['resultId'] = store_result(result, report, cache_key)
+    result['fullReport'] = report if isinstance(report, str) and include_report else ''
+    result['reportDeferred'] = not include_report
+    
+    # Optional columnar payload: column names once per table instead of once per row
+    if request_data.get('payloadFormat') == 'columnar':
+        for name in ('onlyInDatabase1', 'onlyInDatabase2', 'mismatchedRows'):
+            result[name] = columnar_rows(result[name])
+    return result
+
+
+def retained_bytes(value: Any, seen: Optional[set] = None, depth: int = 0) -> int:
+    """
+    Approximate bytes a stored report keeps alive: the frames and arrays reachable from it
+    through bound methods, closures, containers and object attributes (a few levels deep)
+    """
+    seen = set() if seen is None else seen
+    if depth > 4 or id(value) in seen:
+        return 0
+    seen.add(id(value))
+    
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, (np.ndarray, pa.Array, pa.ChunkedArray, pa.RecordBatch, pa.Table)):
+        return int(value.nbytes)
+    if callable(getattr(value, 'estimated_size', None)):  # polars frames
+        return int(value.estimated_size())
+    
+    if isinstance(value, types.MethodType):
+        children = [value.__self__]
+    elif isinstance(value, types.FunctionType):
+        children = [cell.cell_contents for cell in value.__closure__ or () if cell.cell_contents is not None]
+    elif isinstance(value, (list, tuple, set)):
+        children = list(value)
+    elif isinstance(value, dict):
+        children = list(value.values())
+    elif hasattr(value, '__dict__') and not isinstance(value, (type, types.ModuleType)):
+        children = list(vars(value).values())
+    else:
+        return 0
+    return sum(retained_bytes(child, seen, depth + 1) for child in children)
+
+
+def result_store_mb() -> float:
+    """Memory held by this worker's stored results, in MB"""
+    return round(sum(entry['bytes'] for entry in RESULT_STORE.values()) / (1024 * 1024), 1)
+
+
+def purge_result_store() -> None:
+    """Drop stored results unused for RESULT_STORE_TTL_SECONDS"""
+    now = time.time()
+    for result_id in [rid for rid, entry in RESULT_STORE.items()
+                      if now - entry['usedAt'] > RESULT_STORE_TTL_SECONDS]:
+        del RESULT_STORE[result_id]
+
+
+def render_stored_report(entry: Dict[str, Any]) -> None:
+    """
+    Build a stored entry's deferred report, releasing the comparison state it held, and add
+    the report to the result cache entry waiting for it
+    """
+    entry['report'] = entry['report']()
+    entry['bytes'] = len(entry['report'])
+    if entry['cacheKey'] is not None:
+        result_cache.store(entry['cacheKey'], entry['result'], entry['report'])
+
+
+def store_result(result: Dict[str, Any], report: Any, cache_key: Optional[str] = None) -> str:
+    """
+    Keep a result and its report (text, or the deferred builder holding the datacompy state)
+    in this worker, so the report, DOCX export and email can be produced later by ID
+    A builder holding more than RESULT_STORE_MAX_MB is rendered at once so only its text is kept;
+    older entries are evicted past RESULT_STORE_SIZE entries or RESULT_STORE_MAX_MB in total.
+    The ID starts with the worker's PID, which the Express pool uses to route follow-up tasks.
+    """
+    purge_result_store()
+    result_id = f"{os.getpid()}-{uuid.uuid4().hex[:16]}"
+    entry = {
+        'result': dict(result),
+        'report': report,
+        'bytes': retained_bytes(report) if callable(report) else len(report),
+        'usedAt': time.time(),
+        'cacheKey': cache_key,
+    }
+    if callable(report) and entry['bytes'] > RESULT_STORE_MAX_BYTES:
+        progress('report')
+        render_stored_report(entry)
+    
+    RESULT_STORE[result_id] = entry
+    while len(RESULT_STORE) > 1 and (len(RESULT_STORE) > RESULT_STORE_SIZE
+                                     or sum(e['bytes'] for e in RESULT_STORE.values()) > RESULT_STORE_MAX_BYTES):
+        RESULT_STORE.popitem(last=False)
+    return result_id
+
+
+def stored_report(result_id: str) -> Tuple[Dict[str, Any], str]:
+    """A stored result and its report text, building the report on first use"""
+    entry = RESULT_STORE.get(result_id)
+    if entry is None:
+        raise ResultExpired(f"Result {result_id} is no longer available; run the comparison again")
+    RESULT_STORE.move_to_end(result_id)
+    entry['usedAt'] = time.time()
+    
+    if callable(entry['report']):
+        render_stored_report(entry)
+    return entry['result'], entry['report']
+
+
+def metadata_row_count(session: Dict[str, Any]) -> Optional[int]:
+    """Row count of the whole table from catalog metadata (no scan); None when unavailable"""
+    config = session['config']
+    try:
+        if config['dbType'] == 'snowflake':
+            session['cursor'].execute(
+                f"SELECT ROW_COUNT FROM {config['database']}.INFORMATION_SCHEMA.TABLES "
+                f"WHERE UPPER(TABLE_SCHEMA) = UPPER(%s) AND UPPER(TABLE_NAME) = UPPER(%s)",
+                (config['schema'], config['table'])
+            )
+        else:  # sqlserver
+            session['cursor'].execute(
+                f"SELECT SUM(p.rows) FROM sys.partitions p "
+                f"JOIN sys.tables t ON t.object_id = p.object_id "
+                f"JOIN sys.schemas s ON s.schema_id = t.schema_id "
+                f"WHERE s.name = %s AND t.name = %s AND p.index_id IN (0, 1)",
+                (config['schema'], config['table'])
+            )
+        row = session['cursor'].fetchone()
+    except Exception as e:
+        print(f"Catalog row count unavailable: {str(e)}", file=sys.stderr)
+        return None
+    return None if row is None or row[0] is None else int(row[0])
+
+
+def value_width(data_type: str) -> int:
+    """Approximate in-memory bytes of one fetched value of a source type"""
+    if data_type in BOOLEAN_TYPES:
+        return 1
+    if data_type in NUMERIC_TYPES or data_type in DATETIME_TYPES or data_type in ZONED_DATETIME_TYPES:
+        return 8
+    return TEXT_WIDTH_BYTES
+
+
+def estimate_side(config: Dict[str, Any], key_columns: List[str]) -> Dict[str, Any]:
+    """
+    Rows and fetched bytes per row (all compared columns, and the join columns alone) of one side
+    Rows come from the catalog, else UNKNOWN_TABLE_ROWS is assumed (rowsKnown False); the catalog
+    count ignores the filter, which only makes the estimate conservative.
+    """
+    session = open_session(config)
+    try:
+        rows = metadata_row_count(session)
+        columns = describe_columns(session['cursor'], config)
+    finally:
+        close_session(session)
+    
+    # Expressions cannot be matched to the catalog, so every column is counted
+    wanted = requested_columns(config) if plain_column_list(config) else None
+    widths = {name.lower(): value_width(data_type) for name, data_type in columns
+              if wanted is None or name.lower() in wanted or name.lower() in key_columns}
+    return {
+        'rows': rows if rows is not None else UNKNOWN_TABLE_ROWS,
+        'rowsKnown': rows is not None,
+        'rowBytes': sum(widths.values()),
+        'keyBytes': sum(widths.get(key, TEXT_WIDTH_BYTES) for key in key_columns),
+    }
+
+
+def estimate_memory(request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Peak memory a comparison is expected to add to a worker, from catalog metadata only
+    Full fetches count both tables times COMPARE_MEMORY_FACTOR; the other modes count what
+    they actually hold (keys and hashes, detail batches, the sample, or the partition budget).
+    The columnar engines add ENGINE_MEMORY_FACTORS. Memory the worker keeps for stored results
+    is reserved separately by admission control.
+    """
+    config1 = get_side_config(request_data, 1)
+    config2 = get_side_config(request_data, 2)
+    key_columns = as_column_list(build_primary_keys(*[
+        (request_data.get(f'primaryKey{i}') or '').lower() for i in range(1, 5)
+    ]))
+    side1, side2 = run_on_both_sides(lambda config: estimate_side(config, key_columns), config1, config2)
+    
+    mb = 1024 * 1024
+    full_mb = (side1['rows'] * side1['rowBytes'] + side2['rows'] * side2['rowBytes']) / mb
+    key_mb = (side1['rows'] * side1['keyBytes'] + side2['rows'] * side2['keyBytes']) / mb
+    row_bytes = side1['rowBytes'] + side2['rowBytes']
+    compare_mode = request_data.get('compareMode') or 'full'
+    
+    if compare_mode == 'sampled':
+        fraction = sample_fraction(request_data, min(side1['rows'], side2['rows']),
+                                   float(request_data.get('confidenceLevel') or SAMPLE_CONFIDENCE))
+        estimate = full_mb * COMPARE_MEMORY_FACTOR * fraction
+    elif compare_mode == 'hash':
+        hashes = key_mb + (side1['rows'] + side2['rows']) * HASH_WIDTH_BYTES / mb
+        estimate = hashes * COMPARE_MEMORY_FACTOR + MAX_HASH_DETAIL_ROWS * row_bytes * COMPARE_MEMORY_FACTOR / mb
+    elif compare_mode == 'keys':
+        estimate = (key_mb + KEY_DETAIL_BATCH * row_bytes / mb) * COMPARE_MEMORY_FACTOR
+    elif compare_mode == 'bisect':
+        leaf_rows = int(request_data.get('bisectLeafRows') or BISECT_LEAF_ROWS)
+        segments = int(request_data.get('bisectSegments') or BISECT_SEGMENTS)
+        estimate = min(full_mb, leaf_rows * segments * row_bytes / mb) * COMPARE_MEMORY_FACTOR
+    elif compare_mode == 'partitioned':
+        partitions = max(1, int(request_data.get('partitionCount') or PARTITION_COUNT))
+        budget_mb = request_data.get('memoryBudgetMb')
+        if budget_mb:
+            estimate = float(budget_mb)
+        elif request_data.get('spillToDisk', True) is not False:
+            estimate = full_mb * COMPARE_MEMORY_FACTOR / partitions
+        else:
+            # Every partition stays in memory; one at a time is merged
+            estimate = full_mb + full_mb * COMPARE_MEMORY_FACTOR / partitions
+    else:
+        estimate = full_mb * COMPARE_MEMORY_FACTOR
+    estimate *= ENGINE_MEMORY_FACTORS.get(config1['engine'], 1.0)
+    
+    return {
+        'compareMode': compare_mode,
+        'engine': config1['engine'],
+        'rows1': side1['rows'],
+        'rows2': side2['rows'],
+        # False when a side's row count was assumed, so the estimate should not calibrate later ones
+        'rowsKnown': side1['rowsKnown'] and side2['rowsKnown'],
+        'rowBytes1': side1['rowBytes'],
+        'rowBytes2': side2['rowBytes'],
+        'estimatedMb': round(estimate, 1),
+    }
+
+
+def handle_request(request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Worker entry point
+    task 'compare' (default) runs a comparison and reports the memory it took; 'estimate'
+    predicts that memory from metadata, or answers a result cache hit itself ({'cacheHit': True,
+    'result'}) so it skips admission and the compare task; 'report', 'result' and 'email' act on a
+    stored result by resultId without comparing again; 'poolStats' reports this worker's connection pool
+    """
+    task = request_data.get('task', 'compare')
+    purge_result_store()
+    if task == 'compare':
+        emit({'phase': 'started', 'pid': os.getpid()})
+        reset_peak_rss()
+        start_mb = proc_status_mb('VmRSS')
+        result = compare_tables(request_data)
+        peak_mb = proc_status_mb('VmHWM')
+        result['memory'] = {
+            'startRssMb': start_mb,
+            'peakRssMb': peak_mb,
+            'jobPeakMb': round(peak_mb - start_mb, 1) if peak_mb is not None and start_mb is not None else None,
+            # Kept after the job for follow-up tasks; admission counts it until this worker reports again
+            'pid': os.getpid(),
+            'retainedMb': result_store_mb(),
+        }
+        return result
+    if task == 'estimate':
+        config1 = get_side_config(request_data, 1)
+        config2 = get_side_config(request_data, 2)
+        cached = cached_comparison(request_data, config1, config2)[1]
+        if cached is None:
+            return estimate_memory(request_data)
+        cached['memory'] = {'startRssMb': None, 'peakRssMb': None, 'jobPeakMb': None,
+                            'pid': os.getpid(), 'retainedMb': result_store_mb()}
+        return {'cacheHit': True, 'result': cached}
+    if task == 'poolStats':
+        return connection_pool.pool_stats()
+    
+    result, report = stored_report(request_data['resultId'])
+    if task == 'report':
+        return {'resultId': request_data['resultId'], 'fullReport': report}
+    if task == 'result':
+        return dict(result, fullReport=report, reportDeferred=False)
+    if task == 'email':
+        subject = (f"TableMigrationCheck Results: {result['database1Info']} vs {result['database2Info']}"
+                   f" - {result['timestamp']}")
+        return {'emailSent': send_email(request_data['emailAddress'], subject, report)}
+    raise ValueError(f"Unknown task '{task}'")
+
+
+def main():
+    """Main function to handle command line execution"""
+    # Long-lived worker mode used by the Express worker pool
+    if '--serve' in sys.argv[1:]:
+        serve(handle_request, cancel=abort_active_queries)
+        return
+    
     try:
         # Read JSON input from stdin
         input_data = json.loads(sys.stdin.read())
@@ -345,7 +3332,7 @@ def main():
         result = compare_tables(input_data)
         
         # Output result as JSON
-        print(json.dumps(result))
+        print(dumps(result))
         sys.exit(0)
         
     except Exception as e:
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Persistent state for incremental (watermark) comparisons
+One SQLite row per comparison holds the last validated watermark and the running
+summary counts since the last full reconciliation.
+"""
+
+import os
+import json
+import hashlib
+import sqlite3
+import decimal
+import datetime
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, Optional
+
+# SQLite file shared by every worker on the machine
+STATE_PATH = os.environ.get('COMPARE_STATE_PATH') or os.path.join(
+    os.path.expanduser('~'), '.tablediff', 'compare_state.sqlite3'
+)
+
+
+def connect() -> sqlite3.Connection:
+    """Open the state database, creating it on first use"""
+    os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+    conn = sqlite3.connect(STATE_PATH, timeout=30)
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS watermark_state ('
+        'state_key TEXT PRIMARY KEY, watermark TEXT, cumulative TEXT NOT NULL, '
+        'runs INTEGER NOT NULL, last_full_reconcile TEXT, updated_at TEXT NOT NULL)'
+    )
+    return conn
+
+
+def state_key(parts: Any) -> str:
+    """Stable row key for the identifying parts of a comparison"""
+    return hashlib.sha256(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+
+
+def encode_watermark(value: Any) -> Optional[str]:
+    """Store a watermark with its kind, so timestamps and exact decimals survive the round trip"""
+    value = normalize_watermark(value)
+    if value is None:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return json.dumps({'kind': 'timestamp', 'value': value.isoformat()})
+    if isinstance(value, decimal.Decimal):
+        return json.dumps({'kind': 'number', 'value': str(value)})
+    return json.dumps({'kind': 'text', 'value': str(value)})
+
+
+def decode_watermark(stored: Optional[str]) -> Any:
+    """Inverse of encode_watermark"""
+    if stored is None:
+        return None
+    watermark = json.loads(stored)
+    if watermark['kind'] == 'timestamp':
+        return pd.Timestamp(watermark['value'])
+    if watermark['kind'] == 'number':
+        return decimal.Decimal(watermark['value'])
+    return watermark['value']
+
+
+def normalize_watermark(value: Any) -> Any:
+    """
+    A fetched watermark as the type decode_watermark returns (Timestamp, Decimal or text), so the
+    stored and current watermarks compare (datetime.date against Timestamp raises TypeError)
+    Returns None for NULL, NaT and NaN.
+    """
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, (pd.Timestamp, datetime.datetime, datetime.date, np.datetime64)):
+        return pd.Timestamp(value)
+    if isinstance(value, (bool, np.bool_)):
+        return decimal.Decimal(int(value))
+    if isinstance(value, (int, float, decimal.Decimal, np.number)):
+        return decimal.Decimal(str(value))
+    return value
+
+
+def load_state(state_key: str) -> Optional[Dict[str, Any]]:
+    """
+    Saved state of a comparison, or None before its first run
+    Returns: {'watermark', 'cumulative', 'runs', 'lastFullReconcile', 'updatedAt'}
+    """
+    conn = connect()
+    try:
+        row = conn.execute(
+            'SELECT watermark, cumulative, runs, last_full_reconcile, updated_at '
+            'FROM watermark_state WHERE state_key = ?',
+            (state_key,)
+        ).fetchone()
+    finally:
+        conn.close()
+
+    if row is None:
+        return None
+    return {
+        'watermark': decode_watermark(row[0]),
+        'cumulative': json.loads(row[1]),
+        'runs': row[2],
+        'lastFullReconcile': row[3],
+        'updatedAt': row[4],
+    }
+
+
+def save_state(state_key: str, watermark: Any, cumulative: Dict[str, int], runs: int,
+               last_full_reconcile: Optional[str]) -> None:
+    """Insert or replace the state of a comparison after a successful run"""
+    conn = connect()
+    try:
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO watermark_state '
+                '(state_key, watermark, cumulative, runs, last_full_reconcile, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (state_key, encode_watermark(watermark), json.dumps(cumulative), runs,
+                 last_full_reconcile, datetime.datetime.now().isoformat())
+            )
+    finally:
+        conn.close()
@@ -4,6 +4,14 @@ import { z } from "zod";
 export const databaseTypeSchema = z.enum(["snowflake", "sqlserver"]);
 export type DatabaseType = z.infer<typeof databaseTypeSchema>;
 
+// Comparison strategy (see COMPARE_MODES in server/table_compare.py)
+export const compareModeSchema = z.enum(["full", "hash", "bisect", "partitioned", "keys", "sampled"]);
+export type CompareMode = z.infer<typeof compareModeSchema>;
+
+// Row comparison engine (see COMPARE_ENGINES in server/table_compare.py)
+export const compareEngineSchema = z.enum(["datacompy", "native", "polars", "duckdb"]);
+export type CompareEngine = z.infer<typeof compareEngineSchema>;
+
 // Comparison request schema
 export const comparisonRequestSchema = z.object({
   // Database 1 type
@@ -51,6 +59,81 @@ export const comparisonRequestSchema = z.object({
   primaryKey3: z.string().optional(),
   primaryKey4: z.string().optional(),
   
+  // Comparison strategy: "full" fetches every row, "hash" compares row checksums computed in each database,
+  // "bisect" narrows differences down with per-segment checksums over the first key's range,
+  // "partitioned" streams both sides into hash partitions by key and compares them pairwise,
+  // "keys" diffs the join columns first and fetches full rows only for keys on both sides,
+  // "sampled" compares a deterministic key-hash sample and reports estimates with confidence intervals
+  compareMode: compareModeSchema.default("full"),
+  
+  // Sampled mode: a fixed key fraction, or a target error on the mismatch rate to size the sample
+  sampleFraction: z.coerce.number().positive().max(1).optional(),
+  targetError: z.coerce.number().positive().lt(0.5).optional(),
+  confidenceLevel: z.coerce.number().positive().lt(1).optional(),
+  
+  // "native" aligns both sides once and compares columns as vectorized masks; same summary as datacompy.
+  // "polars" and "duckdb" run the join and column comparison multi-threaded on Arrow data
+  engine: compareEngineSchema.optional(),
+  
+  // Native engine, full mode: compare column groups of columnChunkSize in this many worker processes
+  columnWorkers: z.coerce.number().int().min(1).optional(),
+  columnChunkSize: z.coerce.number().int().min(1).optional(),
+  
+  // Map fetched object columns (Decimal, datetime, str) to compact dtypes; on unless false
+  normalizeDtypes: z.boolean().optional(),
+  
+  // Compare pushed-down aggregates first; when every aggregate agrees no rows are fetched
+  profileFirst: z.boolean().optional(),
+  
+  // Rows per fetchmany batch when streaming SQL Server results
+  fetchBatchSize: z.coerce.number().int().min(1).optional(),
+  
+  // Split each side's read on the first primary key and fetch the pieces over this many connections
+  parallelFetch: z.coerce.number().int().min(1).max(32).optional(),
+  parallelFetchMethod: z.enum(["range", "hash"]).optional(),
+  
+  // Reuse an on-disk snapshot of a full fetch younger than snapshotTtlSeconds; validateSnapshot
+  // also requires the table's row count and last-altered time to be unchanged
+  snapshotCache: z.boolean().optional(),
+  snapshotTtlSeconds: z.coerce.number().positive().optional(),
+  validateSnapshot: z.boolean().optional(),
+  
+  // Return the stored result of the same request while both tables' fingerprints are unchanged
+  // (on unless resultCache is false); forceRefresh compares again and replaces the stored result
+  resultCache: z.boolean().optional(),
+  forceRefresh: z.boolean().optional(),
+  // Fingerprint tables without usable catalog metadata by a row hash computed over the whole table
+  // (a full scan per side on every request); off, such tables are simply not cached
+  cacheChecksum: z.boolean().optional(),
+  
+  // Sample rows returned per kind of difference, and "columnar" to send them as {columns, rows}
+  sampleRows: z.coerce.number().int().min(0).optional(),
+  payloadFormat: z.enum(["records", "columnar"]).optional(),
+  
+  // false defers the text report: the result keeps a resultId and the report, DOCX and email
+  // are produced later through /api/results/:id/...
+  includeReport: z.boolean().optional(),
+  // false keeps nothing in the worker after the comparison (no resultId or follow-up tasks)
+  storeResult: z.boolean().optional(),
+  
+  // Incremental comparison: only rows whose watermark column is past the last validated value;
+  // fullReconcile compares everything and restarts the cumulative totals
+  watermarkColumn: z.string().optional(),
+  fullReconcile: z.boolean().optional(),
+  
+  // Partitioned mode: number of hash partitions and whether they are spilled to a temp directory
+  // (default true; false keeps them in memory); a memory budget forces spilling and re-splits
+  // partitions that would not fit
+  partitionCount: z.coerce.number().int().min(1).optional(),
+  spillToDisk: z.boolean().optional(),
+  memoryBudgetMb: z.coerce.number().positive().optional(),
+  partitionWorkers: z.coerce.number().int().min(1).optional(),
+  
+  // Bisection mode tuning: segments per split, segment size fetched raw, recursion limit
+  bisectSegments: z.coerce.number().int().min(2).optional(),
+  bisectLeafRows: z.coerce.number().int().min(1).optional(),
+  bisectMaxRounds: z.coerce.number().int().min(1).optional(),
+  
   // Email configuration
   emailAddress: z.string().email("Invalid email address").optional().or(z.literal("")),
   sendEmail: z.boolean().default(false),
@@ -85,25 +168,194 @@ export const comparisonRequestSchema = z.object({
 
 export type ComparisonRequest = z.infer<typeof comparisonRequestSchema>;
 
+// Per-side connect/fetch timings reported by the comparison script
+export const sideTimingsSchema = z.object({
+  connectSeconds: z.number().optional(),
+  connection: z.enum(["hit", "shared", "miss"]).optional(),
+  fetchSeconds: z.number().optional(),
+  hashFetchSeconds: z.number().optional(),
+  keyFetchSeconds: z.number().optional(),
+  profileSeconds: z.number().optional(),
+  snapshot: z.enum(["hit", "miss", "stale"]).optional(),
+  rows: z.number().optional(),
+  rowsPerSecond: z.number().nullable().optional(),
+  // Worker's peak RSS during this job so far (the process high-water mark where /proc is missing)
+  peakRssMb: z.number().nullable().optional(),
+  connections: z.number().optional(),
+  normalization: z.object({
+    savedMb: z.number(),
+    columns: z.array(z.object({
+      column: z.string(),
+      from: z.string(),
+      to: z.string(),
+      bytesBefore: z.number(),
+      bytesAfter: z.number(),
+      savedMb: z.number(),
+    })),
+  }).optional(),
+});
+
+// Sample difference rows: one object per row, or the columnar payload naming each column once
+export const columnarRowsSchema = z.object({
+  columns: z.array(z.string()),
+  rows: z.array(z.array(z.any())),
+});
+export const sampleRowsSchema = z.union([z.array(z.record(z.any())), columnarRowsSchema]);
+export type SampleRows = z.infer<typeof sampleRowsSchema>;
+
+// Estimate with its confidence interval, as a rate or a row count
+export const intervalSchema = z.object({
+  estimate: z.number(),
+  lower: z.number(),
+  upper: z.number(),
+});
+
+// Summary counts of one comparison; sampled comparisons report estimates for the whole tables
+export const comparisonSummarySchema = z.object({
+  totalRows1: z.number(),
+  totalRows2: z.number(),
+  matchingRows: z.number(),
+  mismatchedRows: z.number(),
+  onlyInDatabase1: z.number(),
+  onlyInDatabase2: z.number(),
+  columnsCompared: z.number(),
+  estimates: z.object({
+    sampleFraction: z.number(),
+    confidenceLevel: z.number(),
+    sampledRows1: z.number(),
+    sampledRows2: z.number(),
+    sampledMatchingRows: z.number(),
+    mismatchRate: intervalSchema,
+    mismatchedRows: intervalSchema,
+    onlyInDatabase1: intervalSchema,
+    onlyInDatabase2: intervalSchema,
+  }).optional(),
+});
+
 // Comparison result schema
 export const comparisonResultSchema = z.object({
   timestamp: z.string(),
   database1Info: z.string(),
   database2Info: z.string(),
-  summary: z.object({
-    totalRows1: z.number(),
-    totalRows2: z.number(),
-    matchingRows: z.number(),
-    mismatchedRows: z.number(),
-    onlyInDatabase1: z.number(),
-    onlyInDatabase2: z.number(),
-    columnsCompared: z.number(),
-  }),
+  summary: comparisonSummarySchema,
   fullReport: z.string(),
-  onlyInDatabase1: z.array(z.record(z.any())),
-  onlyInDatabase2: z.array(z.record(z.any())),
-  mismatchedRows: z.array(z.record(z.any())),
+  onlyInDatabase1: sampleRowsSchema,
+  onlyInDatabase2: sampleRowsSchema,
+  mismatchedRows: sampleRowsSchema,
   emailSent: z.boolean().optional(),
+  resultId: z.string().optional(),
+  reportDeferred: z.boolean().optional(),
+  cacheHit: z.boolean().optional(),
+  cacheAgeSeconds: z.number().optional(),
+  // Admission control: reserved memory estimate, queue position on arrival (0 = ran at once)
+  // and time spent waiting (absent for cache hits, which skip admission); memory is what the
+  // worker actually used (jobPeakMb above its start) and what it keeps afterwards for follow-up
+  // tasks (retainedMb)
+  admission: z.object({
+    estimatedMb: z.number(),
+    queuePosition: z.number(),
+    waitSeconds: z.number(),
+  }).optional(),
+  memory: z.object({
+    startRssMb: z.number().nullable(),
+    peakRssMb: z.number().nullable(),
+    jobPeakMb: z.number().nullable(),
+    pid: z.number().optional(),
+    retainedMb: z.number().optional(),
+  }).optional(),
+  compareMode: compareModeSchema.optional(),
+  hashStats: z.object({
+    hashRowsTransferred: z.number(),
+    detailRowsFetched: z.number(),
+  }).optional(),
+  bisectStats: z.object({
+    rounds: z.number(),
+    segmentsChecked: z.number(),
+    segmentsMatched: z.number(),
+    leafSegments: z.number(),
+    checksumRowsTransferred: z.number(),
+    leafRowsTransferred: z.number(),
+  }).optional(),
+  partitionStats: z.object({
+    partitions: z.number(),
+    spilledToDisk: z.boolean(),
+    memoryBudgetMb: z.number().nullable(),
+    workers: z.number(),
+    repartitioned: z.number(),
+    comparedPartitions: z.number(),
+    largestPartitionRows: z.number(),
+  }).optional(),
+  keyDiffStats: z.object({
+    keyRowsTransferred: z.number(),
+    detailRowsFetched: z.number(),
+    detailBatches: z.number(),
+  }).optional(),
+  columnMismatches: z.record(z.number()).optional(),
+  profileMatched: z.boolean().optional(),
+  profileDeltas: z.array(z.object({
+    column: z.string(),
+    aggregate: z.string(),
+    database1: z.any(),
+    database2: z.any(),
+  })).optional(),
+  incremental: z.object({
+    watermarkColumn: z.string(),
+    windowStart: z.string().nullable(),
+    windowEnd: z.string().nullable(),
+    fullReconcile: z.boolean(),
+    runs: z.number(),
+    lastFullReconcile: z.string().nullable(),
+    window: comparisonSummarySchema,
+    cumulative: comparisonSummarySchema,
+  }).optional(),
+  droppedColumns: z.object({
+    database1: z.array(z.string()),
+    database2: z.array(z.string()),
+  }).optional(),
+  timings: z.object({
+    database1: sideTimingsSchema,
+    database2: sideTimingsSchema,
+    fetchSeconds: z.number().optional(),
+    hashSeconds: z.number().optional(),
+    keyDiffSeconds: z.number().optional(),
+    profileSeconds: z.number().optional(),
+    countSeconds: z.number().optional(),
+    detailFetchSeconds: z.number().optional(),
+    searchSeconds: z.number().optional(),
+    leafFetchSeconds: z.number().optional(),
+    compareSeconds: z.number().optional(),
+    reportSeconds: z.number().optional(),
+  }).optional(),
 });
 
 export type ComparisonResult = z.infer<typeof comparisonResultSchema>;
+
+// Asynchronous comparison jobs (POST /api/jobs)
+export const jobStatusSchema = z.enum(["queued", "running", "succeeded", "failed", "cancelled"]);
+export type JobStatus = z.infer<typeof jobStatusSchema>;
+
+// Progress event: estimated, queued (position) and admitted from admission control, then from the
+// comparison script started, connected, fetching, fetched, profiled (matched, suspectColumns and
+// deltas of the aggregate profile), bisecting, comparing, report or cacheHit, with
+// side/rows/seconds details where they apply
+export const jobEventSchema = z.object({
+  phase: z.string(),
+  time: z.string(),
+  side: z.number().optional(),
+  rows: z.number().optional(),
+  seconds: z.number().optional(),
+}).passthrough();
+export type JobEvent = z.infer<typeof jobEventSchema>;
+
+export const comparisonJobSchema = z.object({
+  jobId: z.string(),
+  status: jobStatusSchema,
+  createdAt: z.string(),
+  startedAt: z.string().nullable(),
+  finishedAt: z.string().nullable(),
+  events: z.array(jobEventSchema),
+  nextEvent: z.number(),
+  result: comparisonResultSchema.optional(),
+  error: z.string().optional(),
+});
+export type ComparisonJob = z.infer<typeof comparisonJobSchema>;
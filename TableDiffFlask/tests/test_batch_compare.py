@@ -0,0 +1,65 @@
+"""Batch runs (user-025): a worker process that dies fails its pairs, not the batch"""
+
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import batch_compare
+
+
+def fake_run_pair(request):
+    """Compare nothing; the pair named 'crash' kills its worker process"""
+    if request['table1'] == 'crash':
+        os._exit(1)
+    return {'summary': {'totalRows1': 1, 'totalRows2': 1, 'mismatchedRows': 0,
+                        'onlyInDatabase1': 0, 'onlyInDatabase2': 0}}
+
+
+def fake_size_pair(pair):
+    pair['rows1'] = pair['rows2'] = 1
+    pair['sizeBytes'] = int(pair['request']['size'])
+    pair['estimatedMb'] = 0
+    return pair
+
+
+@pytest.fixture
+def fake_batch(monkeypatch, tmp_path):
+    # Forked workers inherit the fakes; the real pool spawns fresh interpreters
+    monkeypatch.setattr(batch_compare, 'worker_pool', lambda workers: ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('fork')))
+    monkeypatch.setattr(batch_compare, 'run_pair', fake_run_pair)
+    monkeypatch.setattr(batch_compare, 'size_pair', fake_size_pair)
+    monkeypatch.setattr(batch_compare, 'pair_sources', lambda request: [f"sqlserver:{request['table1']}"])
+
+    def manifest(*tables):
+        path = tmp_path / 'manifest.json'
+        path.write_text(json.dumps({
+            'defaults': {'db1Type': 'sqlserver', 'db2Type': 'sqlserver'},
+            'pairs': [{'name': table, 'table1': table, 'table2': table, 'size': size}
+                      for size, table in enumerate(reversed(tables))],
+        }))
+        return batch_compare.load_manifest(str(path))
+    return manifest, str(tmp_path / 'results.jsonl')
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_worker_death_is_recorded_and_batch_continues(fake_batch, workers):
+    manifest, output = fake_batch
+    summary = batch_compare.run_batch(manifest('first', 'crash', 'after1', 'after2'), output, workers, 2)
+    statuses = {line['name']: line['status'] for line in summary['results']}
+    assert statuses['crash'] == 'error'
+    assert summary['pairs'] == 4
+    if workers == 1:
+        # Pairs running alongside the crash may fail with it; with one worker there are none
+        assert statuses == {'first': 'ok', 'crash': 'error', 'after1': 'ok', 'after2': 'ok'}
+    with open(output) as f:
+        assert len(f.readlines()) == 4
+
+    # A resumed run retries only the pairs that did not finish
+    failed = summary['failed']
+    summary = batch_compare.run_batch(manifest('first', 'crash', 'after1', 'after2'), output, workers, 2, resume=True)
+    assert summary['resumed'] == 4 - failed
+    assert summary['pairs'] == 4
@@ -0,0 +1,102 @@
+"""Snapshot (user-012) and result (user-022) cache keys, failed snapshot writes, and cache hits
+answered by the estimate task (user-015)"""
+
+import pandas as pd
+import pytest
+
+import result_cache
+import snapshot_cache
+import table_compare
+from table_compare import get_side_config, result_cache_key, side_snapshot_key
+
+
+def make_request(**overrides):
+    request = {
+        'db1Type': 'sqlserver', 'db2Type': 'sqlserver',
+        'database1': 'Sales', 'schema1': 'dbo', 'table1': 'Orders',
+        'database2': 'Sales', 'schema2': 'dbo', 'table2': 'Orders',
+        'sqlserver1Host': 'db1', 'sqlserver1User': 'reader', 'sqlserver1Password': 'secret',
+        'sqlserver2Host': 'db2', 'sqlserver2User': 'reader', 'sqlserver2Password': 'secret',
+        'primaryKey1': 'id', 'primaryKey2': 'id',
+    }
+    request.update(overrides)
+    return request
+
+
+def snapshot_key_for(**overrides):
+    return side_snapshot_key(get_side_config(make_request(**overrides), 1))
+
+
+def test_snapshot_key_separates_credentials_and_stored_form():
+    base = snapshot_key_for()
+    assert snapshot_key_for() == base
+    assert snapshot_key_for(sqlserver1Password='wrong') != base
+    assert snapshot_key_for(sqlserver1User='other') != base
+    assert snapshot_key_for(normalizeDtypes=False) != base
+    assert snapshot_key_for(engine='polars') != base
+    # Both columnar engines fetch the same raw Arrow table
+    assert snapshot_key_for(engine='polars') == snapshot_key_for(engine='duckdb')
+    assert snapshot_key_for(engine='polars', normalizeDtypes=False) == snapshot_key_for(engine='polars')
+    assert snapshot_key_for(filter1=' amount > 0 ') == snapshot_key_for(filter1='amount > 0')
+
+
+@pytest.fixture
+def fingerprints(monkeypatch):
+    """Fixed table fingerprints instead of catalog lookups"""
+    values = {1: ['1000', '2024-01-01'], 2: ['1000', '2024-01-01']}
+    monkeypatch.setattr(table_compare, 'result_fingerprint', lambda config, checksum=False: values[config['side']])
+    return values
+
+
+def result_key_for(**overrides):
+    request = make_request(**overrides)
+    return result_cache_key(request, get_side_config(request, 1), get_side_config(request, 2))
+
+
+def test_result_key_ignores_credentials_and_delivery(fingerprints):
+    base = result_key_for()
+    assert result_key_for(sqlserver1Password='rotated', sqlserver2Password='rotated') == base
+    assert result_key_for(sendEmail=True, emailAddress='a@example.com', includeReport=False) == base
+    assert result_key_for(storeResult=False, payloadFormat='columnar') == base
+    assert result_key_for(table2='Orders ') == base
+    assert result_key_for(filter1='amount > 0') != base
+    assert result_key_for(sqlserver1User='other') != base
+
+
+def test_result_key_follows_table_fingerprints(fingerprints):
+    base = result_key_for()
+    fingerprints[2] = ['1001', '2024-01-02']
+    assert result_key_for() != base
+    fingerprints[2] = None
+    assert result_key_for() is None
+
+
+def test_snapshot_store_skips_failed_writes(monkeypatch, tmp_path):
+    monkeypatch.setattr(snapshot_cache, 'SNAPSHOT_DIR', str(tmp_path))
+    df = pd.DataFrame({'id': [1, 2, 3], 'amount': [1.5, 2.5, None]})
+    assert snapshot_cache.store('ok', df, ['3'])
+    assert snapshot_cache.lookup('ok')['rows'] == 3
+
+    def disk_full(*args, **kwargs):
+        raise OSError(28, 'No space left on device')
+
+    monkeypatch.setattr(snapshot_cache.feather, 'write_feather', disk_full)
+    assert snapshot_cache.store('full', df, ['3']) is False
+    assert snapshot_cache.lookup('full') is None
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['ok.arrow', 'ok.json']
+
+
+def test_estimate_answers_cache_hits(monkeypatch, tmp_path, fingerprints):
+    """A cached result is delivered by the estimate task, so it skips admission and the compare task"""
+    monkeypatch.setattr(result_cache, 'RESULT_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(table_compare, 'estimate_memory', lambda request: {'estimatedMb': 1.0})
+    request = make_request()
+    assert table_compare.handle_request(dict(request, task='estimate')) == {'estimatedMb': 1.0}
+
+    key = result_key_for()
+    result_cache.store(key, {'summary': {'totalRows1': 3}}, 'report text')
+    answer = table_compare.handle_request(dict(request, task='estimate'))
+    assert answer['cacheHit'] and answer['result']['cacheHit']
+    assert answer['result']['summary'] == {'totalRows1': 3}
+    assert answer['result']['memory']['pid'] > 0
+    assert table_compare.handle_request(dict(request, task='estimate', forceRefresh=True)) == {'estimatedMb': 1.0}
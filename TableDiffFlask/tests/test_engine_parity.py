@@ -0,0 +1,85 @@
+"""Comparison engines (user-016/017) and dtype normalization (user-019) agree with datacompy.Compare"""
+
+import datetime
+import decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import datacompy
+from dtype_normalize import normalize_frame
+from table_compare import COMPARE_ENGINES, summarize_compare
+
+
+def make_tables(rows=400):
+    rng = np.random.default_rng(11)
+    ids = np.arange(rows)
+    table1 = pd.DataFrame({
+        'id': ids,
+        'amount': rng.normal(100, 25, rows).round(2),
+        'quantity': rng.integers(0, 50, rows),
+        'region': rng.choice(['north', 'south', 'east', 'west'], rows),
+        'shipped': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 90, rows), unit='D'),
+    })
+    table1.loc[table1.index[::37], 'amount'] = np.nan
+    table2 = table1.copy()
+    table2.loc[table2.index[::11], 'amount'] += 0.5
+    table2.loc[table2.index[::13], 'region'] = 'central'
+    table2.loc[table2.index[::17], 'shipped'] += pd.Timedelta(days=1)
+    table2.loc[table2.index[::29], 'amount'] = np.nan
+    table1 = table1.drop(index=table1.index[4::45])
+    table2 = table2.drop(index=table2.index[6::35])
+    # A duplicated key on both sides is matched by occurrence, as datacompy does
+    table1 = pd.concat([table1, table1.iloc[[10]]], ignore_index=True)
+    table2 = pd.concat([table2, table2.iloc[[10, 10]]], ignore_index=True)
+    return table1.reset_index(drop=True), table2.reset_index(drop=True)
+
+
+def compare_with(engine, table1, table2):
+    compare = COMPARE_ENGINES[engine](table1, table2, join_columns='id', df1_name='Database_1', df2_name='Database_2')
+    outcome = summarize_compare(compare)
+    unequal = {stats['column']: stats['unequal_cnt'] for stats in compare.column_stats}
+    return outcome['summary'], unequal
+
+
+@pytest.fixture(scope='module')
+def expected():
+    table1, table2 = make_tables()
+    return compare_with('datacompy', table1, table2)
+
+
+@pytest.mark.parametrize('engine', ['native', 'polars', 'duckdb'])
+def test_engine_matches_datacompy(engine, expected):
+    if engine == 'polars':
+        pytest.importorskip('polars')
+    if engine == 'duckdb':
+        pytest.importorskip('duckdb')
+    table1, table2 = make_tables()
+    summary, unequal = compare_with(engine, table1, table2)
+    assert summary == expected[0]
+    assert unequal == expected[1]
+
+
+def as_sqlserver_objects(df):
+    """The frame as pymssql returns it: Decimal, datetime and str objects"""
+    return pd.DataFrame({
+        'id': [decimal.Decimal(int(value)) for value in df['id']],
+        'amount': [None if pd.isna(value) else decimal.Decimal(str(value)) for value in df['amount']],
+        'quantity': [decimal.Decimal(int(value)) for value in df['quantity']],
+        'region': df['region'].astype(object),
+        'shipped': [value.to_pydatetime().date() for value in df['shipped']],
+    })
+
+
+@pytest.mark.parametrize('engine', ['datacompy', 'native'])
+def test_normalized_sqlserver_frame_matches_typed_frame(engine, expected):
+    """A normalized object frame compares exactly like the typed frame it came from"""
+    table1, table2 = make_tables()
+    normalized = normalize_frame(as_sqlserver_objects(table1))
+    assert normalized['id'].dtype == np.int64
+    assert normalized['amount'].dtype == np.float64
+    assert isinstance(as_sqlserver_objects(table1)['shipped'].iloc[0], datetime.date)
+    summary, unequal = compare_with(engine, normalized, table2)
+    assert summary == expected[0]
+    assert unequal == expected[1]
@@ -0,0 +1,42 @@
+"""Hash mode canonicalization (user-003): both databases must render a value to the same text"""
+
+import decimal
+
+import pandas as pd
+
+from table_compare import NULL_TOKEN, align_key_dtypes, canonical_expression, key_predicate
+
+
+def test_boolean_null_stays_null_on_snowflake():
+    expr = canonical_expression('snowflake', 'FLAG', 'boolean')
+    assert expr == f"""COALESCE(IFF("FLAG" IS NULL, NULL, IFF("FLAG", '1', '0')), '{NULL_TOKEN}')"""
+
+
+def test_boolean_null_token_on_sqlserver():
+    expr = canonical_expression('sqlserver', 'FLAG', 'bit')
+    assert expr == f"COALESCE(CAST([FLAG] AS VARCHAR(1)), '{NULL_TOKEN}')"
+
+
+def test_every_type_family_falls_back_to_null_token():
+    for db_type in ('snowflake', 'sqlserver'):
+        for data_type in ('number', 'int', 'boolean', 'bit', 'timestamp_tz', 'datetime2', 'varchar'):
+            assert canonical_expression(db_type, 'C', data_type).endswith(f", '{NULL_TOKEN}')")
+
+
+def test_large_integer_keys_stay_exact():
+    big = 2 ** 60 + 1
+    df1 = pd.DataFrame({'id': [big, 5]})
+    df2 = pd.DataFrame({'id': [decimal.Decimal(big), decimal.Decimal(5)]})
+    align_key_dtypes(df1, df2, ['id'])
+
+    assert df1['id'].tolist() == df2['id'].tolist() == [big, 5]
+    assert key_predicate('snowflake', ['ID'], df2[['id']]) == f'"ID" IN ({big}, 5)'
+
+
+def test_mixed_keys_fall_back_to_text():
+    df1 = pd.DataFrame({'id': [1, 2]})
+    df2 = pd.DataFrame({'id': ['1', 'b']})
+    align_key_dtypes(df1, df2, ['id'])
+
+    assert df1['id'].tolist() == ['1', '2']
+    assert df2['id'].tolist() == ['1', 'b']
@@ -0,0 +1,32 @@
+"""Worker protocol encoding (user-017): both encoders write valid JSON"""
+
+import decimal
+import json
+
+import numpy as np
+import pytest
+
+import json_worker
+
+
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_dumps_writes_null_for_nan(monkeypatch, use_orjson):
+    if use_orjson:
+        pytest.importorskip('orjson')
+    else:
+        monkeypatch.setattr(json_worker, 'orjson', None)
+    message = {
+        'ratio': float('nan'),
+        'bounds': [1.5, float('inf'), np.float64('-inf')],
+        'values': np.array([1.0, np.nan]),
+        'count': np.int64(3),
+    }
+    assert json.loads(json_worker.dumps(message)) == {
+        'ratio': None, 'bounds': [1.5, None, None], 'values': [1.0, None], 'count': 3,
+    }
+
+
+def test_dumps_falls_back_for_decimals():
+    """orjson rejects Decimal; the fallback keeps it as text and still writes NaN as null"""
+    encoded = json_worker.dumps({'amount': decimal.Decimal('10.50'), 'missing': float('nan')})
+    assert json.loads(encoded) == {'amount': '10.50', 'missing': None}
@@ -0,0 +1,31 @@
+"""Partitioned mode (user-006): both sides must bucket the same key into the same partition"""
+
+import datetime
+import decimal
+
+import pandas as pd
+
+from table_compare import partition_ids
+
+
+def test_bucketing_ignores_fetched_value_types():
+    kinds = {'id': 'number', 'day': 'datetime'}
+    snowflake = pd.DataFrame({
+        'id': pd.Series([1, 2, 3, 40], dtype='int64'),
+        'day': pd.to_datetime(['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-04']),
+    })
+    sqlserver = pd.DataFrame({
+        'id': pd.Series([decimal.Decimal(v) for v in (1, 2, 3, 40)], dtype=object),
+        'day': pd.Series([datetime.datetime(2024, 1, d) for d in (1, 2, 3, 4)], dtype=object),
+    })
+
+    for level in (0, 1):
+        assert (partition_ids(snowflake, kinds, 16, level) == partition_ids(sqlserver, kinds, 16, level)).all()
+
+
+def test_bucketing_does_not_depend_on_the_first_value():
+    kinds = {'id': 'text'}
+    with_null_first = pd.DataFrame({'id': pd.Series([None, 'a', 'b'], dtype=object)})
+    without = pd.DataFrame({'id': pd.Series(['a', 'b'], dtype=object)})
+
+    assert (partition_ids(with_null_first, kinds, 8)[1:] == partition_ids(without, kinds, 8)).all()
@@ -0,0 +1,72 @@
+"""Sampled mode (user-020): row counts without scans and sample sizing over the common rows"""
+
+import math
+
+import pandas as pd
+import pytest
+
+import table_compare
+from table_compare import count_side_rows, sample_fraction, z_score
+
+
+@pytest.fixture
+def fake_counts(monkeypatch):
+    """Record whether a side was counted from the catalog or with COUNT(*)"""
+    calls = []
+    catalog = {'rows': 5000}
+
+    def metadata_row_count(session):
+        calls.append('catalog')
+        return catalog['rows']
+
+    def execute_query(cursor, db_type, query):
+        calls.append(query)
+        return pd.DataFrame({'row_count': [1200]})
+
+    monkeypatch.setattr(table_compare, 'open_session', lambda config: {'config': config, 'cursor': None})
+    monkeypatch.setattr(table_compare, 'close_session', lambda session: None)
+    monkeypatch.setattr(table_compare, 'metadata_row_count', metadata_row_count)
+    monkeypatch.setattr(table_compare, 'execute_query', execute_query)
+    return calls, catalog
+
+
+def side_config(filter_clause=''):
+    return {'side': 1, 'dbType': 'sqlserver', 'database': 'Sales', 'schema': 'dbo', 'table': 'Orders',
+            'filter': filter_clause}
+
+
+def test_unfiltered_side_counted_from_catalog(fake_counts):
+    calls, _ = fake_counts
+    assert count_side_rows(side_config()) == 5000
+    assert calls == ['catalog']
+
+
+def test_filtered_side_or_missing_catalog_runs_count(fake_counts):
+    calls, catalog = fake_counts
+    assert count_side_rows(side_config('WHERE region = 1')) == 1200
+    assert len(calls) == 1 and 'COUNT(*)' in calls[0] and 'WHERE region = 1' in calls[0]
+
+    calls.clear()
+    catalog['rows'] = None
+    assert count_side_rows(side_config()) == 1200
+    assert calls[0] == 'catalog' and 'COUNT(*)' in calls[1]
+
+
+@pytest.mark.parametrize('population', [2000, 50000, 10 ** 8])
+def test_target_error_sizes_the_common_rows(population):
+    """The sampled common rows are enough for the +/- targetError interval at a 50% mismatch rate"""
+    target_error, confidence = 0.01, 0.95
+    fraction = sample_fraction({'targetError': target_error}, population, confidence)
+    sampled = fraction * population
+    half_width = z_score(confidence) * math.sqrt(0.25 / sampled * (1 - fraction))
+    assert half_width <= target_error * 1.001
+    assert 0 < fraction <= 1
+
+
+def test_sample_fraction_validation():
+    assert sample_fraction({'sampleFraction': 0.2}, 100, 0.95) == 0.2
+    assert sample_fraction({'targetError': 0.05}, 0, 0.95) == 1.0
+    with pytest.raises(ValueError):
+        sample_fraction({'targetError': 0.5}, 100, 0.95)
+    with pytest.raises(ValueError):
+        sample_fraction({'sampleFraction': 0}, 100, 0.95)
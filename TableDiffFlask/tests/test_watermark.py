@@ -0,0 +1,81 @@
+"""Incremental comparisons (user-013): watermarks survive storage and compare with fetched ones"""
+
+import datetime
+import decimal
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import table_compare
+import watermark_state
+from table_compare import close_watermark_window, get_side_config, open_watermark_window
+
+
+@pytest.mark.parametrize('value, expected', [
+    (datetime.date(2024, 3, 1), pd.Timestamp('2024-03-01')),
+    (datetime.datetime(2024, 3, 1, 12, 30, 0, 123456), pd.Timestamp('2024-03-01 12:30:00.123456')),
+    (pd.Timestamp('2024-03-01 12:30', tz='UTC'), pd.Timestamp('2024-03-01 12:30', tz='UTC')),
+    (np.datetime64('2024-03-01T08:00'), pd.Timestamp('2024-03-01 08:00')),
+    (np.int64(12345678901234567), decimal.Decimal('12345678901234567')),
+    (decimal.Decimal('10.50'), decimal.Decimal('10.50')),
+    (2.5, decimal.Decimal('2.5')),
+    ('B-0042', 'B-0042'),
+])
+def test_watermark_round_trip(value, expected):
+    stored = watermark_state.decode_watermark(watermark_state.encode_watermark(value))
+    assert stored == expected
+    assert type(stored) is type(expected)
+    assert watermark_state.normalize_watermark(value) == stored
+
+
+@pytest.mark.parametrize('value', [None, pd.NaT, float('nan')])
+def test_missing_watermark(value):
+    assert watermark_state.encode_watermark(value) is None
+    assert watermark_state.normalize_watermark(value) is None
+
+
+def make_configs():
+    request = {
+        'db1Type': 'sqlserver', 'db2Type': 'sqlserver',
+        'database1': 'Sales', 'schema1': 'dbo', 'table1': 'Orders',
+        'database2': 'Sales', 'schema2': 'dbo', 'table2': 'Orders',
+        'sqlserver1Host': 'db1', 'sqlserver2Host': 'db2',
+    }
+    return get_side_config(request, 1), get_side_config(request, 2)
+
+
+@pytest.mark.parametrize('first, later', [
+    (datetime.date(2024, 3, 1), datetime.date(2024, 3, 2)),
+    (decimal.Decimal('100'), 101),
+    (np.int64(100), np.float64(100.5)),
+])
+def test_window_after_stored_watermark(monkeypatch, tmp_path, first, later):
+    """Every run after the first compares the stored watermark with the fetched MAX"""
+    monkeypatch.setattr(watermark_state, 'STATE_PATH', str(tmp_path / 'state.sqlite3'))
+    monkeypatch.setattr(table_compare, 'describe_side', lambda config: [('Id', 'int'), ('Updated', 'date')])
+    monkeypatch.setattr(table_compare, 'open_session', lambda config: {'config': config})
+    monkeypatch.setattr(table_compare, 'close_session', lambda session: None)
+    current = {'max': first}
+    monkeypatch.setattr(table_compare, 'key_bounds', lambda session, column: (None, current['max']))
+    summary = {'totalRows1': 1, 'totalRows2': 1, 'columnsCompared': 2}
+
+    config1, config2 = make_configs()
+    window = open_watermark_window(config1, config2, 'id', 'updated', False)
+    assert window['fullReconcile'] and not window['empty']
+    assert close_watermark_window(window, summary)['runs'] == 1
+
+    # Nothing new since the last run
+    config1, config2 = make_configs()
+    window = open_watermark_window(config1, config2, 'id', 'updated', False)
+    assert window['empty']
+    close_watermark_window(window, dict.fromkeys(summary, 0))
+
+    current['max'] = later
+    config1, config2 = make_configs()
+    window = open_watermark_window(config1, config2, 'id', 'updated', False)
+    assert not window['empty'] and not window['fullReconcile']
+    assert '[Updated] >' in config1['filter'] and '[Updated] <=' in config2['filter']
+    incremental = close_watermark_window(window, summary)
+    assert incremental['runs'] == 3
+    assert incremental['cumulative']['totalRows1'] == 2